@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Cache proxy benchmark
+Several workers download the same video from fake_media.py at once, first
+straight from the origin and then through cache_proxy.CacheProxy, and the
+bytes the origin had to send are compared
+
+Usage:
+    python benchmarks/bench_cache_proxy.py --workers 4 --bandwidth 4M
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+sys.path.insert(0, BENCH_DIR)
+
+from cache_proxy import CacheProxy  # noqa: E402
+from downloader import YouTubeDownloader  # noqa: E402
+from fake_media import FakeMediaServer, generate_media  # noqa: E402
+from scheduler import parse_rate  # noqa: E402
+
+FAKE_YTDLP = os.path.join(BENCH_DIR, 'fake_ytdlp.py')
+
+
+def run(media, work_dir: str, name: str, workers: int, bandwidth, proxy: bool):
+    """All workers fetch video 'shared' into their own folder; returns the numbers"""
+    server = FakeMediaServer(media, bandwidth=bandwidth)
+    server.start()
+    cache_proxy = CacheProxy(os.path.join(work_dir, f'{name}-cache')) if proxy else None
+    proxy_url = cache_proxy.start() if cache_proxy is not None else None
+
+    def job(n):
+        downloader = YouTubeDownloader(ytdlp_path=FAKE_YTDLP)
+        options = {'output_path': os.path.join(work_dir, name, str(n)), 'ignore_archive': True,
+                   'proxy': proxy_url}
+        return downloader.download(server.watch_url('shared'), options)
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(job, range(workers)))
+    finally:
+        server.stop()
+        if cache_proxy is not None:
+            cache_proxy.stop()
+    failed = [r for r in results if not r['success']]
+    if failed:
+        raise RuntimeError(f"{len(failed)} downloads failed: {failed[0].get('error')}")
+    report = {
+        'wall_seconds': time.perf_counter() - started,
+        'origin_bytes': server.stats()['bytes_sent'],
+        'origin_media_requests': server.stats()['media_requests'],
+        'delivered_bytes': sum(r.get('downloaded_bytes', 0) for r in results),
+    }
+    if cache_proxy is not None:
+        report['proxy'] = cache_proxy.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='parallel downloads of the video')
+    parser.add_argument('--duration', type=int, default=10, help='test video length in seconds')
+    parser.add_argument('--bandwidth', default='4M', help='origin speed per connection, e.g. 4M')
+    args = parser.parse_args()
+    bandwidth = parse_rate(args.bandwidth)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        media = generate_media(os.path.join(work_dir, 'media'), args.duration)
+        report = {'workers': args.workers, 'bandwidth': bandwidth,
+                  'direct': run(media, work_dir, 'direct', args.workers, bandwidth, proxy=False),
+                  'proxied': run(media, work_dir, 'proxied', args.workers, bandwidth, proxy=True)}
+    report['origin_bytes_saved'] = (1 - report['proxied']['origin_bytes']
+                                    / report['direct']['origin_bytes'])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
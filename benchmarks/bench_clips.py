@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Clip extraction benchmark
+Compares stream-copy and re-encode throughput when cutting many clips
+from one locally generated test video
+
+Usage:
+    python benchmarks/bench_clips.py --duration 300 --clips 12 --length 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from clipper import MODE_AUTO, MODE_COPY, MODE_REENCODE, ClipExtractor  # noqa: E402
+
+
+def make_test_video(path: str, duration: int, gop: int, ffmpeg: str = 'ffmpeg'):
+    """Encode a synthetic H.264/AAC video with a keyframe every `gop` frames at 25 fps"""
+    subprocess.run([
+        ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=25:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-g', str(gop), '-keyint_min', str(gop),
+        '-sc_threshold', '0', '-c:a', 'aac', '-shortest', path,
+    ], check=True)
+
+
+def clip_ranges(duration: int, count: int, length: float, gop_seconds: float):
+    """Evenly spread (start, end) minute ranges whose starts sit on keyframes"""
+    step = max(gop_seconds, (duration - length) / max(count, 1))
+    ranges = []
+    for n in range(count):
+        start = round(n * step / gop_seconds) * gop_seconds
+        ranges.append((start / 60, min(start + length, duration) / 60))
+    return ranges
+
+
+def run_mode(source: str, ranges, mode: str, workers: int, output_dir: str):
+    """Cut every range with one mode; returns wall time and per-clip stats"""
+    job_dir = os.path.join(output_dir, mode)
+    os.makedirs(job_dir)
+    extractor = ClipExtractor(max_workers=workers)
+    started = time.perf_counter()
+    results = extractor.extract(source, ranges, job_dir, mode)
+    wall = time.perf_counter() - started
+    failed = [r for r in results if not r['success']]
+    if failed:
+        raise RuntimeError(f'{mode}: {len(failed)} clips failed: {failed[0].get("error")}')
+    media_seconds = sum((r['end'] - r['start']) * 60 for r in results)
+    return {
+        'wall_seconds': wall,
+        'clips_per_second': len(results) / wall,
+        # Seconds of output media produced per second of wall time
+        'media_speed': media_seconds / wall,
+        'stream_copied': sum(1 for r in results if r['mode'] == MODE_COPY),
+        'output_bytes': sum(r['size'] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=int, default=300, help='test video length in seconds')
+    parser.add_argument('--clips', type=int, default=12, help='number of clips to cut')
+    parser.add_argument('--length', type=float, default=10.0, help='clip length in seconds')
+    parser.add_argument('--gop', type=int, default=50, help='keyframe interval in frames (25 fps)')
+    parser.add_argument('--workers', type=int, default=None, help='parallel ffmpeg processes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        source = os.path.join(work_dir, 'source.mp4')
+        started = time.perf_counter()
+        make_test_video(source, args.duration, args.gop)
+        ranges = clip_ranges(args.duration, args.clips, args.length, args.gop / 25)
+        report = {
+            'duration': args.duration,
+            'clips': args.clips,
+            'clip_length': args.length,
+            'workers': args.workers or os.cpu_count(),
+            'generate_seconds': time.perf_counter() - started,
+            'modes': {},
+        }
+        for mode in (MODE_COPY, MODE_REENCODE, MODE_AUTO):
+            report['modes'][mode] = run_mode(source, ranges, mode, args.workers, work_dir)
+
+    copy_wall = report['modes'][MODE_COPY]['wall_seconds']
+    report['copy_speedup'] = report['modes'][MODE_REENCODE]['wall_seconds'] / copy_wall
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Engine startup benchmark
+Compares per-job overhead of the subprocess and in-process (API) engines
+against a local HTTP server, so results do not depend on YouTube
+
+Usage:
+    python benchmarks/bench_engines.py --jobs 10 --size 2
+"""
+
+import argparse
+import functools
+import http.server
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from downloader import YouTubeDownloader  # noqa: E402
+from engines import ENGINE_API, ENGINE_SUBPROCESS, api_available  # noqa: E402
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def copyfile(self, source, outputfile):
+        # yt-dlp's generic extractor hangs up after sniffing the first bytes
+        try:
+            super().copyfile(source, outputfile)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def serve_directory(directory: str):
+    """Serve a directory on a random localhost port; returns (server, base_url)"""
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def run_engine(engine: str, url: str, jobs: int, output_dir: str):
+    """Download the same file `jobs` times; returns per-job timings"""
+    downloader = YouTubeDownloader(engine=engine)
+    timings = []
+    for n in range(jobs):
+        job_dir = os.path.join(output_dir, f'{engine}-{n}')
+        os.makedirs(job_dir)
+        first_event = []
+        started = time.perf_counter()
+        result = downloader.download(url, {
+            'output_path': job_dir,
+            'progress_callback': lambda e: first_event or first_event.append(time.perf_counter()),
+        })
+        finished = time.perf_counter()
+        if not result['success']:
+            raise RuntimeError(f'{engine} job {n} failed: {result.get("error")}')
+        timings.append({
+            'total': finished - started,
+            # Time until the first byte arrived: process spawn, imports, extraction
+            'startup': (first_event[0] if first_event else finished) - started,
+        })
+    downloader.close()
+    return timings
+
+
+def summarize(timings):
+    """Mean/median/min of each timing field"""
+    summary = {}
+    for field in ('startup', 'total'):
+        values = [t[field] for t in timings]
+        summary[field] = {
+            'mean': statistics.mean(values),
+            'median': statistics.median(values),
+            'min': min(values),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=10, help='downloads per engine')
+    parser.add_argument('--size', type=float, default=2.0, help='test file size in MiB')
+    args = parser.parse_args()
+
+    engines = [ENGINE_SUBPROCESS] + ([ENGINE_API] if api_available() else [])
+    with tempfile.TemporaryDirectory() as media_dir, tempfile.TemporaryDirectory() as out_dir:
+        with open(os.path.join(media_dir, 'media.mp4'), 'wb') as f:
+            f.write(os.urandom(int(args.size * 1048576)))
+        server, base_url = serve_directory(media_dir)
+        try:
+            report = {'jobs': args.jobs, 'size_mib': args.size, 'engines': {}}
+            for engine in engines:
+                timings = run_engine(engine, f'{base_url}/media.mp4', args.jobs, out_dir)
+                report['engines'][engine] = summarize(timings)
+        finally:
+            server.shutdown()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
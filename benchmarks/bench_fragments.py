@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Fragment concurrency benchmark
+Runs rounds of parallel downloads from fake_media.py, whose connections are
+each capped and share one access link, with a fixed fragment count per job
+and with transfer.TransferTuner sizing it, and compares throughput and the
+connections the server saw
+
+Usage:
+    python benchmarks/bench_fragments.py --jobs 4 --rounds 4 --bandwidth 1M --link 8M
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+sys.path.insert(0, BENCH_DIR)
+
+from downloader import YouTubeDownloader  # noqa: E402
+from fake_media import FakeMediaServer, generate_media  # noqa: E402
+from scheduler import parse_rate  # noqa: E402
+from transfer import TransferTuner  # noqa: E402
+
+FAKE_YTDLP = os.path.join(BENCH_DIR, 'fake_ytdlp.py')
+
+
+def run(media, work_dir: str, mode: str, jobs: int, rounds: int, bandwidth, link, chunk_size: int):
+    """`rounds` rounds of `jobs` parallel downloads; returns the numbers"""
+    server = FakeMediaServer(media, bandwidth=bandwidth, link_bandwidth=link)
+    server.start()
+    tuner = TransferTuner(fixed=None if mode == 'auto' else int(mode), chunk_size=chunk_size,
+                          max_jobs=jobs)
+
+    def job(n):
+        downloader = YouTubeDownloader(ytdlp_path=FAKE_YTDLP, transfer=tuner)
+        options = {'output_path': os.path.join(work_dir, mode, str(n)), 'ignore_archive': True}
+        return downloader.download(server.watch_url(f'v{n}'), options)
+
+    results = []
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for round_ in range(rounds):
+                results.extend(pool.map(job, range(round_ * jobs, (round_ + 1) * jobs)))
+    finally:
+        server.stop()
+    wall = time.perf_counter() - started
+    failed = [r for r in results if not r['success']]
+    if failed:
+        raise RuntimeError(f"{len(failed)} downloads failed: {failed[0].get('error')}")
+    transferred = sum(r.get('downloaded_bytes', 0) for r in results)
+    return {
+        'wall_seconds': wall,
+        'throughput_bps': transferred / wall,
+        'fragments_per_round': [[r['concurrent_fragments'] for r in results[i:i + jobs]]
+                                for i in range(0, len(results), jobs)],
+        'server_peak_connections': server.stats()['peak_connections'],
+        'tuner': tuner.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=4, help='parallel downloads per round')
+    parser.add_argument('--rounds', type=int, default=4, help='rounds, so the tuner can learn')
+    parser.add_argument('--duration', type=int, default=20, help='test video length in seconds')
+    parser.add_argument('--bandwidth', default='1M', help='server speed per connection, e.g. 1M')
+    parser.add_argument('--link', default='8M', help='server speed across all connections')
+    parser.add_argument('--chunk-size', default='512K',
+                        help='--http-chunk-size (the fragment size)')
+    parser.add_argument('--mode', action='append', metavar='N|auto',
+                        help="fragment count to compare, or 'auto' "
+                             "(repeatable; default: 1, 16, auto)")
+    args = parser.parse_args()
+    bandwidth, link = parse_rate(args.bandwidth), parse_rate(args.link)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        media = generate_media(os.path.join(work_dir, 'media'), args.duration)
+        report = {'jobs': args.jobs, 'rounds': args.rounds, 'bandwidth': bandwidth, 'link': link,
+                  'media_bytes': sum(os.path.getsize(path) for path in media.values()), 'modes': {}}
+        for mode in args.mode or ['1', '16', 'auto']:
+            print(f'Running {mode}...', file=sys.stderr, flush=True)
+            report['modes'][mode] = run(media, work_dir, mode, args.jobs, args.rounds,
+                                        bandwidth, link, int(parse_rate(args.chunk_size)))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
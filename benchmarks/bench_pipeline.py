@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Pipeline benchmark
+Downloads a batch of locally served test videos and transcodes them, once
+with fetch and ffmpeg work done back to back per job and once through the
+staged pipeline, with the download speed capped so both sides take time
+
+Usage:
+    python benchmarks/bench_pipeline.py --videos 6 --duration 20 --rate 2M
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_clips import make_test_video  # noqa: E402
+from bench_engines import serve_directory  # noqa: E402
+from downloader import YouTubeDownloader  # noqa: E402
+from pipeline import TRANSCODE_PRESETS, Pipeline  # noqa: E402
+from runner import StreamingProcess  # noqa: E402
+from scheduler import ResourceScheduler, parse_rate  # noqa: E402
+
+
+def serial_batch(urls, output_dir: str, workers: int, rate: float, preset: str):
+    """Each worker downloads a video, then transcodes it, then takes the next one"""
+    scheduler = ResourceScheduler(network_slots=workers, bandwidth_limit=rate, min_free_bytes=0)
+    ext, codec_args = TRANSCODE_PRESETS[preset]
+    timings = {'fetch': 0.0, 'transcode': 0.0}
+
+    def job(url):
+        downloader = YouTubeDownloader(scheduler=scheduler)
+        started = time.perf_counter()
+        result = downloader.download(url, {'output_path': output_dir, 'ignore_archive': True})
+        fetched = time.perf_counter()
+        if not result['success']:
+            raise RuntimeError(result.get('error'))
+        source = result['filepath']
+        cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-y', '-i', source]
+        cmd += codec_args + [os.path.splitext(source)[0] + f'.{preset}{ext}']
+        if StreamingProcess(cmd).run(lambda line: None) != 0:
+            raise RuntimeError(f'transcode failed for {source}')
+        timings['fetch'] += fetched - started
+        timings['transcode'] += time.perf_counter() - fetched
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(job, urls))
+    return {'wall_seconds': time.perf_counter() - started, 'busy_seconds': timings}
+
+
+def pipelined_batch(urls, output_dir: str, workers: int, cpu_workers: int, rate: float,
+                    preset: str):
+    """The same work through Pipeline: fetches overlap with transcodes"""
+    scheduler = ResourceScheduler(network_slots=workers, cpu_slots=cpu_workers,
+                                  bandwidth_limit=rate, min_free_bytes=0)
+    pipeline = Pipeline(fetch_workers=workers, cpu_workers=cpu_workers, scheduler=scheduler)
+    started = time.perf_counter()
+    jobs = pipeline.run(urls, {'output_path': output_dir, 'transcode': preset})
+    wall = time.perf_counter() - started
+    pipeline.shutdown()
+    failed = [job for job in jobs if job.state != 'done']
+    if failed:
+        raise RuntimeError(f'{len(failed)} jobs failed: {failed[0].error}')
+    stats = pipeline.stats()
+    return {
+        'wall_seconds': wall,
+        'busy_seconds': stats['busy_seconds'],
+        'network_seconds': stats['network_seconds'],
+        'cpu_seconds': stats['cpu_seconds'],
+        'overlap': stats['overlap'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--videos', type=int, default=6, help='videos in the batch')
+    parser.add_argument('--duration', type=int, default=20, help='test video length in seconds')
+    parser.add_argument('--rate', default='2M', help='total download speed, e.g. 2M')
+    parser.add_argument('--workers', type=int, default=1, help='parallel downloads')
+    parser.add_argument('--cpu-workers', type=int, default=None,
+                        help='parallel ffmpeg processes (default: CPU count)')
+    parser.add_argument('--preset', choices=sorted(TRANSCODE_PRESETS), default='h264')
+    args = parser.parse_args()
+    rate = parse_rate(args.rate)
+    cpu_workers = args.cpu_workers or os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        media_dir = os.path.join(work_dir, 'media')
+        os.makedirs(media_dir)
+        source = os.path.join(media_dir, 'video0.mp4')
+        make_test_video(source, args.duration, 50)
+        for n in range(1, args.videos):
+            shutil.copy(source, os.path.join(media_dir, f'video{n}.mp4'))
+        server, base_url = serve_directory(media_dir)
+        urls = [f'{base_url}/video{n}.mp4' for n in range(args.videos)]
+        report = {
+            'videos': args.videos,
+            'video_bytes': os.path.getsize(source),
+            'rate': rate,
+            'workers': args.workers,
+            'cpu_workers': cpu_workers,
+            'preset': args.preset,
+        }
+        try:
+            for name in ('serial', 'pipelined'):
+                output_dir = os.path.join(work_dir, name)
+                os.makedirs(output_dir)
+                if name == 'serial':
+                    report[name] = serial_batch(urls, output_dir, args.workers, rate, args.preset)
+                else:
+                    report[name] = pipelined_batch(urls, output_dir, args.workers, cpu_workers,
+                                                   rate, args.preset)
+        finally:
+            server.shutdown()
+
+    busy = report['serial']['busy_seconds']
+    report['network_seconds'] = busy['fetch'] / args.workers
+    report['cpu_seconds'] = busy['transcode'] / args.workers
+    # What a perfect overlap would take, vs. doing both back to back
+    report['ideal_seconds'] = max(report['network_seconds'], report['cpu_seconds'])
+    report['speedup'] = report['serial']['wall_seconds'] / report['pipelined']['wall_seconds']
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark
+Times imports, YouTubeDownloader() and the yt-dlp version probe in fresh
+interpreters, with the discovery cache cold and warm
+
+Every measurement runs in a new Python process with HOME pointed at a
+scratch directory, so the user's real cache is left alone. Also reports
+whether tkinter or yt_dlp got imported along the way.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 7
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+
+# Each snippet prints the seconds it measured; the clock starts after the
+# interpreter is up so only our own code is timed
+SNIPPETS = {
+    'import_package': (
+        "import time, sys; t = time.perf_counter(); import src; src.YouTubeDownloader\n"
+        "print(time.perf_counter() - t, 'tkinter' in sys.modules, 'yt_dlp' in sys.modules)"
+    ),
+    'import_downloader': (
+        f"import time, sys; sys.path.insert(0, {SRC_DIR!r}); t = time.perf_counter()\n"
+        "import downloader\n"
+        "print(time.perf_counter() - t, 'tkinter' in sys.modules, 'yt_dlp' in sys.modules)"
+    ),
+    'construct_downloader': (
+        f"import time, sys; sys.path.insert(0, {SRC_DIR!r}); import downloader\n"
+        "t = time.perf_counter(); downloader.YouTubeDownloader()\n"
+        "print(time.perf_counter() - t, 'tkinter' in sys.modules, 'yt_dlp' in sys.modules)"
+    ),
+    'version_probe': (
+        f"import time, sys; sys.path.insert(0, {SRC_DIR!r}); import ytdlp_binary\n"
+        "t = time.perf_counter(); ytdlp_binary.ytdlp_version(ytdlp_binary.find_ytdlp())\n"
+        "print(time.perf_counter() - t, 'tkinter' in sys.modules, 'yt_dlp' in sys.modules)"
+    ),
+}
+
+# What YouTubeDownloader() did before discovery was cached: one `which` per candidate
+LEGACY_SNIPPET = (
+    "import os, subprocess, time; t = time.perf_counter()\n"
+    "for path in ('yt-dlp', 'yt-dlp.exe', os.path.expanduser('~/.local/bin/yt-dlp')):\n"
+    "    if path.endswith('.exe'):\n"
+    "        if os.path.exists(path): break\n"
+    "    elif subprocess.run(['which', path], capture_output=True, timeout=2).returncode == 0:\n"
+    "        break\n"
+    "print(time.perf_counter() - t, False, False)"
+)
+
+
+def measure(code: str, home: str, cold: bool) -> dict:
+    """Run a snippet in a new interpreter; clears the discovery cache first if `cold`"""
+    cache = os.path.join(home, '.youtube_downloader_ytdlp.json')
+    if cold and os.path.exists(cache):
+        os.remove(cache)
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                               cwd=ROOT_DIR, env=env, check=True)
+    wall = time.perf_counter() - started
+    seconds, tkinter, yt_dlp = completed.stdout.split()
+    return {'seconds': float(seconds), 'process_seconds': wall,
+            'tkinter': tkinter == 'True', 'yt_dlp': yt_dlp == 'True'}
+
+
+def summarize(runs) -> dict:
+    return {
+        'median_ms': statistics.median(r['seconds'] for r in runs) * 1000,
+        'max_ms': max(r['seconds'] for r in runs) * 1000,
+        'process_median_ms': statistics.median(r['process_seconds'] for r in runs) * 1000,
+        'loads_tkinter': any(r['tkinter'] for r in runs),
+        'loads_yt_dlp': any(r['yt_dlp'] for r in runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement')
+    args = parser.parse_args()
+
+    report = {'python': sys.version.split()[0], 'repeat': args.repeat}
+    with tempfile.TemporaryDirectory() as home:
+        report['legacy_which_lookup'] = summarize(
+            [measure(LEGACY_SNIPPET, home, cold=True) for _ in range(args.repeat)])
+        for name, code in SNIPPETS.items():
+            if name.startswith('import_'):
+                report[name] = summarize(
+                    [measure(code, home, cold=False) for _ in range(args.repeat)])
+                continue
+            report[f'{name}_cold'] = summarize(
+                [measure(code, home, cold=True) for _ in range(args.repeat)])
+            report[f'{name}_warm'] = summarize(
+                [measure(code, home, cold=False) for _ in range(args.repeat)])
+
+        runs = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'run.py'), '--help'],
+                           capture_output=True, check=True,
+                           env=dict(os.environ, HOME=home, USERPROFILE=home))
+            runs.append(time.perf_counter() - started)
+        report['cli_help_ms'] = statistics.median(runs) * 1000
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Download path benchmark suite
+Runs the real downloader against fake_media.py and fake_ytdlp.py and reports
+throughput, latency percentiles and peak memory per scenario as JSON
+
+Scenarios:
+    single    downloads one after another (video + audio merged by ffmpeg)
+    clip      download_clips cutting several clips from each download
+    fallback  videos refused with HTTP 403 until the governor switches client
+    batch     DownloadQueue with several workers on a bandwidth-limited server
+    lookup    downloads and archive hits with thousands of files in the folder
+
+Each scenario runs in its own process so peak RSS is its own. Save a run
+with --output and compare a later one against it with --compare:
+
+    python benchmarks/bench_suite.py --output baseline.json
+    python benchmarks/bench_suite.py --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional, Dict, Any, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_media import FakeMediaServer, generate_media  # noqa: E402
+
+SCENARIOS = ('single', 'clip', 'fallback', 'batch', 'lookup')
+
+FAKE_YTDLP = os.path.join(BENCH_DIR, 'fake_ytdlp.py')
+
+# Report keys compared by --compare, and whether bigger is better
+_COMPARED = {
+    'wall_seconds': False,
+    'jobs_per_second': True,
+    'throughput_bps': True,
+    'latency.p50': False,
+    'latency.p90': False,
+    'latency.p99': False,
+    'peak_rss_mib': False,
+    'children_peak_rss_mib': False,
+}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p90/p99/max/mean of a list of seconds (nearest rank)"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {'p50': rank(50), 'p90': rank(90), 'p99': rank(99), 'max': ordered[-1],
+            'mean': sum(ordered) / len(ordered)}
+
+
+def peak_rss_mib(who: int) -> float:
+    """Peak resident memory of this process or of its reaped children"""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1048576 if sys.platform == 'darwin' else 1024)
+
+
+def environment() -> Dict[str, Any]:
+    """What the numbers were measured on"""
+    try:
+        commit = subprocess.run(['git', '-C', BENCH_DIR, 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'commit': commit or None,
+    }
+
+
+class ScenarioRun:
+    """One scenario inside a child process: server, downloader and measurements"""
+
+    def __init__(self, name: str, args, work_dir: str, media: Dict[str, str]):
+        from metrics import MetricsRecorder
+
+        self.name = name
+        self.args = args
+        self.work_dir = work_dir
+        self.media = media
+        self.metrics = MetricsRecorder()
+        self.latencies: List[float] = []
+        self.failures = 0
+        self.bytes = 0
+        self.extra: Dict[str, Any] = {}
+        self.server: Optional[FakeMediaServer] = None
+
+    def serve(self, **kwargs) -> FakeMediaServer:
+        """Start the fake server with the suite's latency plus scenario settings"""
+        kwargs.setdefault('latency', self.args.latency)
+        self.server = FakeMediaServer(self.media, **kwargs)
+        self.server.start()
+        return self.server
+
+    def output_dir(self, name: str) -> str:
+        path = os.path.join(self.work_dir, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def downloader(self, **kwargs):
+        from downloader import YouTubeDownloader
+        return YouTubeDownloader(ytdlp_path=FAKE_YTDLP, **kwargs)
+
+    def timed(self, call, *call_args) -> Dict[str, Any]:
+        """Run one download, keeping its latency, bytes and phase timings"""
+        started = time.perf_counter()
+        result = call(*call_args)
+        elapsed = time.perf_counter() - started
+        self.latencies.append(elapsed)
+        self.account(result, elapsed)
+        return result
+
+    def account(self, result: Dict[str, Any], elapsed: float):
+        """Fold a finished download into the totals"""
+        if not result.get('success'):
+            self.failures += 1
+        for path in result.get('filepaths') or [result.get('filepath')]:
+            if path and os.path.isfile(path):
+                self.bytes += os.path.getsize(path)
+        self.metrics.record({'state': 'done' if result.get('success') else 'failed',
+                             'duration': elapsed, 'timings': result.get('timings'),
+                             'retries': result.get('retries'), 'strategy': result.get('strategy'),
+                             'blocked': result.get('blocked')})
+
+    def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            getattr(self, f'scenario_{self.name}')()
+        finally:
+            if self.server is not None:
+                self.server.stop()
+        wall = time.perf_counter() - started
+        jobs = len(self.latencies)
+        report = {
+            'jobs': jobs,
+            'failures': self.failures,
+            'wall_seconds': wall,
+            'jobs_per_second': jobs / wall if wall else 0.0,
+            'bytes': self.bytes,
+            'throughput_bps': self.bytes / wall if wall else 0.0,
+            'latency': percentiles(self.latencies),
+            'peak_rss_mib': peak_rss_mib(resource.RUSAGE_SELF),
+            'children_peak_rss_mib': peak_rss_mib(resource.RUSAGE_CHILDREN),
+            'phases': self.metrics.summary()['phases'],
+        }
+        if self.server is not None:
+            report['server'] = self.server.stats()
+        report.update(self.extra)
+        return report
+
+    def scenario_single(self):
+        server = self.serve()
+        downloader = self.downloader()
+        options = {'output_path': self.output_dir('single'), 'ignore_archive': True}
+        for n in range(self.args.jobs):
+            self.timed(downloader.download, server.watch_url(f'single{n}'), options)
+
+    def scenario_clip(self):
+        server = self.serve()
+        downloader = self.downloader()
+        options = {'output_path': self.output_dir('clip'), 'ignore_archive': True}
+        # Three clips spread over the test video, in minutes
+        length = self.args.duration / 60
+        clips = [(length * k / 4, length * (k + 1) / 4) for k in range(3)]
+        for n in range(max(1, self.args.jobs // 2)):
+            self.timed(downloader.download_clips, server.watch_url(f'clip{n}'), clips, options)
+        self.extra['clips_per_job'] = len(clips)
+
+    def scenario_fallback(self):
+        from governor import RateGovernor
+
+        ids = [f'fallback{n}' for n in range(max(1, self.args.jobs // 2))]
+        server = self.serve(forbidden=ids)
+        # Short backoff so the run measures the ladder, not the pause
+        governor = RateGovernor(rate=1000, burst=1000, base_backoff=0.1, max_backoff=0.5, jitter=0)
+        downloader = self.downloader(governor=governor)
+        options = {'output_path': self.output_dir('fallback'), 'ignore_archive': True}
+        for video_id in ids:
+            self.timed(downloader.download, server.watch_url(video_id), options)
+        self.extra['governor'] = governor.stats()
+
+    def scenario_batch(self):
+        from batch import DownloadQueue, JobState
+        from scheduler import parse_rate
+
+        server = self.serve(bandwidth=parse_rate(self.args.bandwidth))
+        queue = DownloadQueue(max_workers=self.args.workers,
+                              downloader_factory=lambda: self.downloader())
+        options = {'output_path': self.output_dir('batch'), 'ignore_archive': True}
+        jobs = [queue.submit(server.watch_url(f'batch{n}'), options)
+                for n in range(self.args.jobs)]
+        queue.wait()
+        queue.shutdown()
+        for job in jobs:
+            # Submission to finish, so queueing behind busy workers counts
+            elapsed = (job.finished_at or time.time()) - job.submitted_at
+            self.latencies.append(elapsed)
+            self.account(job.result or {'success': job.state == JobState.DONE}, elapsed)
+        self.extra['workers'] = self.args.workers
+        self.extra['bandwidth_per_connection'] = parse_rate(self.args.bandwidth)
+
+    def scenario_lookup(self):
+        from archive import DownloadArchive
+
+        server = self.serve()
+        output_dir = self.output_dir('lookup')
+        for n in range(self.args.filler):
+            with open(os.path.join(output_dir, f'filler video {n:05d} [f{n:05d}].mp4'), 'wb') as f:
+                f.write(b'\0' * 1024)
+        archive = DownloadArchive(os.path.join(self.work_dir, 'archive.db'))
+        downloader = self.downloader(archive=archive)
+        options = {'output_path': output_dir}
+        urls = [server.watch_url(f'lookup{n}') for n in range(self.args.jobs)]
+        for url in urls:
+            self.timed(downloader.download, url, options)
+        # The same links again are answered from the archive
+        hits = []
+        for url in urls:
+            started = time.perf_counter()
+            result = downloader.download(url, options)
+            hits.append(time.perf_counter() - started)
+            if not result.get('archived'):
+                self.failures += 1
+        archive.close()
+        self.extra['filler_files'] = self.args.filler
+        self.extra['archive_hit_latency'] = percentiles(hits)
+
+
+def run_child(name: str, args) -> Dict[str, Any]:
+    """Run one scenario in this process (called in the child)"""
+    with tempfile.TemporaryDirectory(prefix=f'bench-{name}-') as work_dir:
+        media = json.loads(args.media)
+        return ScenarioRun(name, args, work_dir, media).run()
+
+
+def spawn_child(name: str, args, media: Dict[str, str]) -> Dict[str, Any]:
+    """Run one scenario in a fresh interpreter and read its JSON report"""
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', name, '--media', json.dumps(media),
+           '--jobs', str(args.jobs), '--workers', str(args.workers),
+           '--duration', str(args.duration), '--latency', str(args.latency),
+           '--bandwidth', args.bandwidth, '--filler', str(args.filler)]
+    completed = subprocess.run(cmd, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'error': (completed.stderr.strip().splitlines() or ['failed'])[-1]}
+    return json.loads(completed.stdout)
+
+
+def _lookup(report: Dict[str, Any], dotted: str) -> Optional[float]:
+    value: Any = report
+    for key in dotted.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Relative change of the compared keys per scenario; positive ratio = better"""
+    changes = {}
+    for name, report in current.get('scenarios', {}).items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        deltas = {}
+        for key, higher_is_better in _COMPARED.items():
+            new, old = _lookup(report, key), _lookup(before, key)
+            if new is None or not old:
+                continue
+            change = (new - old) / old
+            deltas[key] = {'baseline': old, 'current': new, 'change': change,
+                           'better': change > 0 if higher_is_better else change < 0}
+        changes[name] = deltas
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='run only this scenario (repeatable; default: all)')
+    parser.add_argument('--jobs', type=int, default=6, help='downloads per scenario')
+    parser.add_argument('--workers', type=int, default=3, help='parallel downloads in batch')
+    parser.add_argument('--duration', type=int, default=10, help='test video length in seconds')
+    parser.add_argument('--latency', type=float, default=0.02, help='server delay per response')
+    parser.add_argument('--bandwidth', default='4M', help='per-connection speed in batch')
+    parser.add_argument('--filler', type=int, default=5000, help='extra files in the lookup folder')
+    parser.add_argument('--output', metavar='FILE', help='also write the report to FILE')
+    parser.add_argument('--compare', metavar='FILE', help='compare against an earlier report')
+    parser.add_argument('--child', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--media', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args)))
+        return
+
+    report: Dict[str, Any] = {
+        'environment': environment(),
+        'settings': {'jobs': args.jobs, 'workers': args.workers, 'duration': args.duration,
+                     'latency': args.latency, 'bandwidth': args.bandwidth, 'filler': args.filler},
+        'scenarios': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='bench-media-') as media_dir:
+        media = generate_media(media_dir, args.duration)
+        report['settings']['media_bytes'] = {fmt: os.path.getsize(path)
+                                             for fmt, path in media.items()}
+        for name in args.scenario or SCENARIOS:
+            print(f'Running {name}...', file=sys.stderr, flush=True)
+            report['scenarios'][name] = spawn_child(name, args, media)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            report['comparison'] = compare(report, json.load(f))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Fake media server
+Serves generated videos and yt-dlp style info JSON on localhost, with
+configurable latency, bandwidth and injected HTTP 403 errors
+
+Used by bench_suite.py together with fake_ytdlp.py; can also be run on its
+own to poke at it with curl:
+
+    python benchmarks/fake_media.py --videos 3 --bandwidth 1M --forbidden v1
+"""
+
+import argparse
+import http.server
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional, Dict, Any, Iterable
+from urllib.parse import parse_qs, urlsplit
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Formats every fake video offers, like YouTube's 137 (video only),
+# 140 (audio only) and 18 (combined)
+FORMATS = (
+    {'format_id': '137', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720},
+    {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a', 'height': None},
+    {'format_id': '18', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 720},
+)
+
+
+def generate_media(directory: str, duration: int = 10, size_mib: float = 2.0,
+                   ffmpeg: str = 'ffmpeg') -> Dict[str, str]:
+    """
+    Write one file per format into `directory`
+
+    With ffmpeg the files are real H.264/AAC streams (so merging and
+    cutting work); without it they are random bytes of `size_mib`.
+
+    Returns:
+        Dict of format id -> path
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {fmt['format_id']: os.path.join(directory, f"media.f{fmt['format_id']}.{fmt['ext']}")
+             for fmt in FORMATS}
+    if shutil.which(ffmpeg):
+        base = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y']
+        video = ['-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=25:duration={duration}',
+                 '-c:v', 'libx264', '-preset', 'veryfast', '-g', '50', '-b:v', '1500k']
+        audio = ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+                 '-c:a', 'aac', '-b:a', '128k']
+        subprocess.run(base + video + ['-an', paths['137']], check=True)
+        subprocess.run(base + audio + ['-vn', paths['140']], check=True)
+        subprocess.run(base + ['-i', paths['137'], '-i', paths['140'], '-c', 'copy',
+                               '-movflags', '+faststart', paths['18']], check=True)
+    else:
+        sizes = {'137': 0.85, '140': 0.15, '18': 1.0}
+        for format_id, path in paths.items():
+            with open(path, 'wb') as f:
+                f.write(os.urandom(int(size_mib * sizes[format_id] * 1048576)))
+    return paths
+
+
+class FakeMediaServer:
+    """
+    Threaded HTTP server standing in for YouTube
+
+    Routes:
+        GET /watch?v=<id>            minimal watch page
+        GET /info/<id>               yt-dlp style info JSON with format URLs
+        GET /media/<id>/<format>     the media bytes (Range requests supported)
+
+    Every response waits `latency` seconds first; media is sent at
+    `bandwidth` bytes per second per connection and, with `link_bandwidth`,
+    all connections together share that many bytes per second (the access
+    link, so more connections stop helping once it is full). Media requests for a
+    video in `forbidden` get HTTP 403 unless they ask for another player
+    client (?client=... as fake_ytdlp sends with --extractor-args), and
+    any media request fails with 403 at `fail_rate`. Counters are
+    available from stats().
+    """
+
+    def __init__(self, media: Dict[str, str], latency: float = 0.0,
+                 bandwidth: Optional[float] = None, forbidden: Iterable[str] = (),
+                 fail_rate: float = 0.0, chunk_size: int = 64 * 1024, seed: int = 0,
+                 link_bandwidth: Optional[float] = None):
+        """
+        Args:
+            media: Format id -> file, shared by every video (see generate_media)
+            latency: Seconds before each response
+            bandwidth: Bytes per second per connection, or None for unlimited
+            forbidden: Video ids whose media is refused for the default client
+            fail_rate: Fraction of media requests refused at random (0-1)
+            chunk_size: Bytes written per send
+            seed: Seed for the random failures, so runs are repeatable
+            link_bandwidth: Bytes per second across all connections, or None
+        """
+        self.media = dict(media)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.forbidden = set(forbidden)
+        self.fail_rate = fail_rate
+        self.chunk_size = chunk_size
+        self.link_bandwidth = link_bandwidth
+        self._link_free = 0.0
+        self._active = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'media_requests': 0, 'range_requests': 0,
+                          'forbidden': 0, 'bytes_sent': 0, 'peak_connections': 0}
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+        self.base_url = ''
+
+    def start(self) -> str:
+        """Listen on a random localhost port; returns the base URL"""
+        server = self
+
+        class Handler(_FakeHandler):
+            fake = server
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='fake-media', daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self._server.server_address[1]}'
+        return self.base_url
+
+    def stop(self):
+        """Shut the server down"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def watch_url(self, video_id: str) -> str:
+        """Link the downloader is given for a video"""
+        return f'{self.base_url}/watch?v={video_id}'
+
+    def info(self, video_id: str) -> Dict[str, Any]:
+        """Info dict in the shape yt-dlp's --dump-single-json prints"""
+        formats = []
+        for fmt in FORMATS:
+            path = self.media.get(fmt['format_id'])
+            if path is None:
+                continue
+            formats.append(dict(fmt, url=f"{self.base_url}/media/{video_id}/{fmt['format_id']}",
+                                filesize=os.path.getsize(path)))
+        return {
+            'id': video_id,
+            'title': f'Fake video {video_id}',
+            'webpage_url': self.watch_url(video_id),
+            'extractor': 'fake',
+            'extractor_key': 'Fake',
+            'formats': formats,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests, 403s and bytes served so far"""
+        with self._lock:
+            return dict(self._counters)
+
+    def _count(self, **amounts):
+        """Add to the named counters"""
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counters[name] += amount
+
+    def _connection(self, delta: int):
+        """Track media responses being sent at once"""
+        with self._lock:
+            self._active += delta
+            self._counters['peak_connections'] = max(self._counters['peak_connections'],
+                                                     self._active)
+
+    def _link_delay(self, size: int) -> float:
+        """Reserve link time for `size` bytes; returns how long to wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._link_free = max(now, self._link_free) + size / self.link_bandwidth
+            return self._link_free - now
+
+    def _refuse(self, video_id: str, client: Optional[str]) -> bool:
+        """Whether a media request gets the injected 403"""
+        if video_id in self.forbidden and not client:
+            return True
+        if self.fail_rate:
+            with self._lock:
+                return self._random.random() < self.fail_rate
+        return False
+
+
+class _FakeHandler(http.server.BaseHTTPRequestHandler):
+    fake: FakeMediaServer = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        fake = self.fake
+        fake._count(requests=1)
+        if fake.latency:
+            time.sleep(fake.latency)
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        segments = [s for s in parts.path.split('/') if s]
+        try:
+            if segments == ['watch'] and query.get('v'):
+                body = f"<html><title>Fake video {query['v'][0]}</title></html>".encode()
+                self._send(200, body, 'text/html')
+            elif len(segments) == 2 and segments[0] == 'info':
+                self._send(200, json.dumps(fake.info(segments[1])).encode(), 'application/json')
+            elif len(segments) == 3 and segments[0] == 'media' and segments[2] in fake.media:
+                self._media(segments[1], segments[2], query.get('client', [None])[0])
+            else:
+                self._send(404, b'Not found', 'text/plain')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _media(self, video_id: str, format_id: str, client: Optional[str]):
+        fake = self.fake
+        fake._count(media_requests=1)
+        if fake._refuse(video_id, client):
+            fake._count(forbidden=1)
+            self._send(403, b'Forbidden', 'text/plain')
+            return
+        path = fake.media[format_id]
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = _RANGE_RE.match(self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            fake._count(range_requests=1)
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4' if path.endswith('.mp4') else 'audio/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+        remaining = end - start + 1
+        started = time.monotonic()
+        sent = 0
+        fake._connection(1)
+        try:
+            with open(path, 'rb') as f:
+                f.seek(start)
+                while remaining > 0:
+                    chunk = f.read(min(fake.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    # Wait before each write, so the response ends with its last byte
+                    if fake.link_bandwidth:
+                        time.sleep(fake._link_delay(len(chunk)))
+                    if fake.bandwidth:
+                        # Sleep until the bytes sent so far, plus this chunk, fit the rate
+                        ahead = (sent + len(chunk)) / fake.bandwidth - (time.monotonic() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+                    sent += len(chunk)
+                    fake._count(bytes_sent=len(chunk))
+        finally:
+            fake._connection(-1)
+
+
+def main():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+    from scheduler import parse_rate
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--videos', type=int, default=3, help='video ids v0..vN-1 to list')
+    parser.add_argument('--duration', type=int, default=10, help='media length in seconds')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each response')
+    parser.add_argument('--bandwidth', help='bytes per second per connection, e.g. 1M')
+    parser.add_argument('--link-bandwidth', help='bytes per second across all connections, e.g. 8M')
+    parser.add_argument('--forbidden', action='append', default=[], metavar='ID',
+                        help='refuse media of this video id for the default client')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of random 403s')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as media_dir:
+        server = FakeMediaServer(generate_media(media_dir, args.duration), latency=args.latency,
+                                 bandwidth=parse_rate(args.bandwidth), forbidden=args.forbidden,
+                                 fail_rate=args.fail_rate,
+                                 link_bandwidth=parse_rate(args.link_bandwidth))
+        server.start()
+        for n in range(args.videos):
+            print(server.watch_url(f'v{n}'))
+        print('Press Ctrl+C to stop', file=sys.stderr)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            print(json.dumps(server.stats()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
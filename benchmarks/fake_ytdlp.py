@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Fake yt-dlp
+Understands the subset of yt-dlp's command line the downloader uses and
+downloads from fake_media.FakeMediaServer, so benchmarks exercise the real
+process handling, progress parsing and fallbacks without YouTube
+
+Supported: -f selections (best, bv/ba with '+' merges and ',' splits),
+-o templates, --progress-template, --print, --continue (Range resume),
+--limit-rate, --retries, --load-info-json, --dump-single-json,
+--http-chunk-size ranges (fetched -N/--concurrent-fragments at a time, the
+way yt-dlp fetches DASH fragments),
+--download-sections, --extractor-args (asks the server for another player
+client), --cookies-from-browser/--cookies and --version.
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
+from urllib.parse import parse_qs, urlsplit
+
+VERSION = '2099.01.01-fake'
+
+# Options followed by a value; everything else starting with '-' is a flag
+_VALUE_OPTIONS = {
+    '-f', '-o', '-N', '--socket-timeout', '--http-chunk-size', '--progress-template', '--print',
+    '--retries', '--retry-sleep', '--fragment-retries', '--cookies', '--cookies-from-browser',
+    '--user-agent', '--download-sections', '--merge-output-format', '--limit-rate',
+    '--load-info-json', '--extractor-args', '--concurrent-fragments', '--downloader',
+    '--downloader-args', '--ffmpeg-location', '--proxy', '--format-sort',
+}
+
+_FIELD_RE = re.compile(r'%\((?P<fields>[^)]+)\)(?P<conv>[sd])')
+_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_args(argv: List[str]):
+    """Split the command line into {option: [values]}, flags and positional arguments"""
+    options: Dict[str, List[str]] = {}
+    flags = set()
+    positional = []
+    args = iter(argv)
+    for arg in args:
+        if arg in _VALUE_OPTIONS:
+            options.setdefault(arg, []).append(next(args, ''))
+        elif arg.startswith('-') and len(arg) > 1:
+            flags.add(arg)
+        else:
+            positional.append(arg)
+    return options, flags, positional
+
+
+def render(template: str, values: Dict[str, Any]) -> str:
+    """Fill a yt-dlp output template; missing fields become NA"""
+    def field(match):
+        value = None
+        for name in match.group('fields').split(','):
+            value = values.get(name)
+            if value is not None:
+                break
+        if value is None:
+            return 'NA'
+        return str(int(value)) if match.group('conv') == 'd' else str(value)
+    return _FIELD_RE.sub(field, template)
+
+
+def parse_rate(text: Optional[str]) -> Optional[float]:
+    """--limit-rate value in bytes per second"""
+    match = re.match(r'^(\d+(?:\.\d+)?)([kmg]?)', text or '', re.I)
+    return float(match.group(1)) * _UNITS[match.group(2).lower()] if match else None
+
+
+class FakeYtDlp:
+    """One fake yt-dlp run"""
+
+    def __init__(self, argv: List[str]):
+        self.options, self.flags, self.positional = parse_args(argv)
+        self.prints: Dict[str, List[str]] = {}
+        for spec in self.options.get('--print', []):
+            when, _, template = spec.partition(':') if ':' in spec else ('video', '', spec)
+            self.prints.setdefault(when, []).append(template)
+        progress = self.option('--progress-template') or ''
+        if progress.startswith('download:'):
+            progress = progress.split(':', 1)[1]
+        self.progress_template = progress
+        self.limit_rate = parse_rate(self.option('--limit-rate'))
+        self.retries = int(self.option('--retries') or 10)
+        client = re.search(r'player_client=([\w,]+)',
+                           ' '.join(self.options.get('--extractor-args', [])))
+        self.client = client.group(1).split(',')[0] if client else None
+        chunk_size = parse_rate(self.option('--http-chunk-size'))
+        self.chunk_size = int(chunk_size) if chunk_size else None
+        self.fragments = int(self.option('--concurrent-fragments') or self.option('-N') or 1)
+        # Like yt-dlp, --proxy applies to every request; without it no proxy is used
+        proxy = self.option('--proxy')
+        self.opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({'http': proxy, 'https': proxy} if proxy else {}))
+
+    def option(self, name: str) -> Optional[str]:
+        """Last value given for an option"""
+        values = self.options.get(name)
+        return values[-1] if values else None
+
+    def run(self) -> int:
+        """Do what the command line asks; returns the exit code"""
+        if '--version' in self.flags:
+            print(VERSION)
+            return 0
+        jar = self.option('--cookies')
+        if self.option('--cookies-from-browser') and jar:
+            with open(jar, 'w') as f:
+                f.write('# Netscape HTTP Cookie File\n.youtube.com\tTRUE\t/\tTRUE\t0\tSID\tfake\n')
+            print(f"Extracted 1 cookies from {self.option('--cookies-from-browser')}")
+        info_file = self.option('--load-info-json')
+        if not self.positional and not info_file:
+            print('yt-dlp: error: You must provide at least one URL.', file=sys.stderr)
+            return 2
+        try:
+            info = self.load_info(info_file)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            print(f'ERROR: [fake] Unable to download webpage: {e}', file=sys.stderr)
+            return 1
+        if '--dump-single-json' in self.flags or '-J' in self.flags:
+            print(json.dumps(info), flush=True)
+            return 0
+        try:
+            for group in self.select(info):
+                self.download_group(info, group)
+        except urllib.error.HTTPError as e:
+            print(f'ERROR: unable to download video data: HTTP Error {e.code}: {e.reason}',
+                  file=sys.stderr)
+            return 1
+        except (urllib.error.URLError, OSError) as e:
+            print(f'ERROR: {e}', file=sys.stderr)
+            return 1
+        return 0
+
+    def load_info(self, info_file: Optional[str]) -> Dict[str, Any]:
+        """Info dict from --load-info-json or from the server"""
+        if info_file:
+            with open(info_file, encoding='utf-8') as f:
+                return json.load(f)
+        url = self.positional[-1]
+        parts = urlsplit(url)
+        video_id = parse_qs(parts.query).get('v', [os.path.basename(parts.path)])[0]
+        print(f'[fake] {video_id}: Downloading webpage', flush=True)
+        with self.opener.open(f'{parts.scheme}://{parts.netloc}/info/{video_id}',
+                              timeout=30) as response:
+            return json.load(response)
+
+    def select(self, info: Dict[str, Any]) -> List[List[Dict[str, Any]]]:
+        """Formats to fetch: one list per ',' group, several formats in a list are merged"""
+        formats = info['formats']
+        video = next(f for f in formats if f['acodec'] == 'none')
+        audio = next(f for f in formats if f['vcodec'] == 'none')
+        combined = next(f for f in formats if f['acodec'] != 'none' and f['vcodec'] != 'none')
+        by_id = {f['format_id']: f for f in formats}
+        groups = []
+        for group in (self.option('-f') or 'bv*+ba/b').split(','):
+            choice = group.split('/')[0]
+            picked = []
+            for selector in choice.split('+'):
+                if selector in by_id:
+                    # A format ID, as the format planner passes
+                    picked.append(by_id[selector])
+                elif selector.startswith(('bv', 'bestvideo')):
+                    picked.append(video)
+                elif selector.startswith(('ba', 'bestaudio')):
+                    picked.append(audio)
+                else:
+                    picked.append(combined)
+            groups.append(picked)
+        return groups
+
+    def output_path(self, info: Dict[str, Any], fmt: Dict[str, Any], ext: str,
+                    section_start: float = 0) -> str:
+        """Fill the -o template for one format"""
+        template = self.option('-o') or '%(title)s [%(id)s].%(ext)s'
+        return render(template, dict(info, ext=ext, format_id=fmt['format_id'],
+                                     section_start=section_start))
+
+    def download_group(self, info: Dict[str, Any], group: List[Dict[str, Any]]):
+        """Fetch one format, or several and merge them"""
+        self.emit('before_dl', dict(info, filesize=sum(f['filesize'] for f in group)))
+        if len(group) == 1:
+            path = self.output_path(info, group[0], group[0]['ext'])
+            self.fetch(group[0], path)
+        else:
+            ext = self.option('--merge-output-format') or 'mkv'
+            path = self.output_path(info, group[0], ext)
+            stem = os.path.splitext(path)[0]
+            parts = []
+            for fmt in group:
+                part = f"{stem}.f{fmt['format_id']}.{fmt['ext']}"
+                self.fetch(fmt, part)
+                parts.append(part)
+            print(f'[Merger] Merging formats into "{path}"', flush=True)
+            self.merge(parts, path)
+        for path in self.cut_sections(info, group[0], path):
+            self.emit('after_move', dict(info, filepath=os.path.abspath(path),
+                                         format_id='+'.join(f['format_id'] for f in group)))
+
+    def fetch(self, fmt: Dict[str, Any], path: str):
+        """Download one format with resume, rate limit and retries"""
+        url = fmt['url'] + (f'?client={self.client}' if self.client else '')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        print(f'[download] Destination: {path}', flush=True)
+        part = path + '.part'
+        for attempt in range(self.retries + 1):
+            resume = os.path.exists(part) and '--continue' in self.flags
+            offset = os.path.getsize(part) if resume else 0
+            try:
+                if self.fragments > 1 and self.chunk_size:
+                    self.fetch_parallel(url, part, offset)
+                else:
+                    self.fetch_ranges(url, part, offset)
+                break
+            except urllib.error.HTTPError as e:
+                if e.code < 500 or attempt == self.retries:
+                    raise
+                print(f'[download] Got error: HTTP Error {e.code}. '
+                      f'Retrying ({attempt + 1}/{self.retries})...', flush=True)
+                time.sleep(0.1)
+            except (urllib.error.URLError, ConnectionError) as e:
+                if attempt == self.retries:
+                    raise
+                print(f'[download] Got error: {e}. Retrying ({attempt + 1}/{self.retries})...',
+                      flush=True)
+                time.sleep(0.1)
+        os.replace(part, path)
+
+    def fetch_ranges(self, url: str, part: str, offset: int):
+        """Download from offset to the end, in --http-chunk-size ranges if given"""
+        total = None
+        while True:
+            request = urllib.request.Request(url)
+            end = offset + self.chunk_size - 1 if self.chunk_size else None
+            if offset or end is not None:
+                request.add_header('Range', f"bytes={offset}-{'' if end is None else end}")
+            with self.opener.open(request, timeout=30) as response:
+                content_range = response.headers.get('Content-Range')
+                if content_range:
+                    total = int(content_range.rsplit('/', 1)[1])
+                elif total is None:
+                    total = offset + int(response.headers.get('Content-Length') or 0)
+                self.copy(response, part, offset, total, finished=end is None or end + 1 >= total)
+            offset = os.path.getsize(part)
+            if end is None or offset >= total:
+                return
+
+    def fetch_parallel(self, url: str, part: str, offset: int):
+        """Download from offset in --http-chunk-size ranges, -N of them at once"""
+        # The first range also tells the total size
+        total = self.fetch_range(url, part, offset, offset + self.chunk_size - 1)
+        starts = list(range(offset + self.chunk_size, total, self.chunk_size))
+        if not starts:
+            return
+        done = set()
+        lock = threading.Lock()
+        started = time.monotonic()
+        downloaded = [os.path.getsize(part)]
+        last_report = [0.0]
+        rate = self.limit_rate / self.fragments if self.limit_rate else None
+
+        def fetch(start: int):
+            end = min(start + self.chunk_size, total) - 1
+            request = urllib.request.Request(url, headers={'Range': f'bytes={start}-{end}'})
+            begun = time.monotonic()
+            received = 0
+            with self.opener.open(request, timeout=30) as response, open(part, 'r+b') as f:
+                f.seek(start)
+                while True:
+                    chunk = response.read(64 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    received += len(chunk)
+                    if rate:
+                        ahead = received / rate - (time.monotonic() - begun)
+                        if ahead > 0:
+                            time.sleep(ahead)
+                    with lock:
+                        downloaded[0] += len(chunk)
+                        elapsed = time.monotonic() - started
+                        if elapsed - last_report[0] >= 0.1:
+                            last_report[0] = elapsed
+                            self.progress('downloading', downloaded[0], total,
+                                          (downloaded[0] - offset) / elapsed)
+            with lock:
+                done.add(start)
+
+        with open(part, 'r+b') as f:
+            f.truncate(total)
+        try:
+            with ThreadPoolExecutor(max_workers=self.fragments) as pool:
+                for future in [pool.submit(fetch, start) for start in starts]:
+                    future.result()
+        except BaseException:
+            # Keep only the contiguous part so --continue resumes from a valid offset
+            end = offset + self.chunk_size
+            while end in done:
+                end += self.chunk_size
+            with open(part, 'r+b') as f:
+                f.truncate(min(end, total))
+            raise
+        elapsed = time.monotonic() - started
+        self.progress('finished', total, total, (total - offset) / elapsed if elapsed else None)
+
+    def fetch_range(self, url: str, part: str, start: int, end: int) -> int:
+        """Append one range to the .part file; returns the total size"""
+        request = urllib.request.Request(url, headers={'Range': f'bytes={start}-{end}'})
+        with self.opener.open(request, timeout=30) as response:
+            content_range = response.headers.get('Content-Range')
+            total = int(content_range.rsplit('/', 1)[1]) if content_range else \
+                start + int(response.headers.get('Content-Length') or 0)
+            self.copy(response, part, start, total, finished=end + 1 >= total)
+        return total
+
+    def copy(self, response, part: str, offset: int, total: int, finished: bool = True):
+        """Stream a response into the .part file, reporting progress ('finished' once per file)"""
+        started = time.monotonic()
+        downloaded = offset
+        last_report = 0.0
+        with open(part, 'ab' if offset else 'wb') as f:
+            while True:
+                chunk = response.read(64 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+                downloaded += len(chunk)
+                elapsed = time.monotonic() - started
+                if self.limit_rate:
+                    ahead = (downloaded - offset) / self.limit_rate - elapsed
+                    if ahead > 0:
+                        time.sleep(ahead)
+                        elapsed += ahead
+                if elapsed - last_report >= 0.1:
+                    last_report = elapsed
+                    speed = (downloaded - offset) / elapsed if elapsed else None
+                    self.progress('downloading', downloaded, total, speed)
+        elapsed = time.monotonic() - started
+        self.progress('finished' if finished else 'downloading', downloaded, total,
+                      (downloaded - offset) / elapsed if elapsed else None)
+
+    def progress(self, status: str, downloaded: int, total: int, speed: Optional[float]):
+        """Print one --progress-template line"""
+        if not self.progress_template:
+            return
+        eta = int((total - downloaded) / speed) if speed else None
+        values = {'progress.status': status, 'progress.downloaded_bytes': downloaded,
+                  'progress.total_bytes': total or None, 'progress.speed': speed,
+                  'progress.eta': eta}
+        print(render(self.progress_template, values), flush=True)
+
+    def merge(self, parts: List[str], path: str):
+        """Mux video and audio parts like yt-dlp's Merger"""
+        ffmpeg = self.option('--ffmpeg-location') or shutil.which('ffmpeg')
+        cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y']
+        for part in parts:
+            cmd += ['-i', part]
+        cmd += ['-map', '0:v:0?', '-map', '1:a:0?', '-c', 'copy', path]
+        if not ffmpeg or subprocess.run(cmd).returncode != 0:
+            # Random test bytes cannot be muxed; concatenating keeps the size realistic
+            with open(path, 'wb') as out:
+                for part in parts:
+                    with open(part, 'rb') as f:
+                        shutil.copyfileobj(f, out)
+        for part in parts:
+            os.remove(part)
+
+    def cut_sections(self, info: Dict[str, Any], fmt: Dict[str, Any], path: str) -> List[str]:
+        """Apply --download-sections to a finished download; returns the final paths"""
+        sections = self.options.get('--download-sections')
+        if not sections:
+            return [path]
+        ffmpeg = shutil.which('ffmpeg')
+        outputs = []
+        for spec in sections:
+            start, _, end = spec.lstrip('*').partition('-')
+            output = self.output_path(info, fmt, os.path.splitext(path)[1][1:], float(start))
+            if output == path:
+                stem, ext = os.path.splitext(path)
+                output = f'{stem}.section{len(outputs)}{ext}'
+            cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y', '-ss', start]
+            if end and end != 'inf':
+                cmd += ['-to', end]
+            if not ffmpeg or subprocess.run(cmd + ['-i', path, '-c', 'copy', output]).returncode:
+                shutil.copy(path, output)
+            outputs.append(output)
+        os.remove(path)
+        return outputs
+
+    def emit(self, when: str, values: Dict[str, Any]):
+        """Print the --print templates registered for a stage"""
+        for template in self.prints.get(when, []):
+            print(render(template, values), flush=True)
+
+
+if __name__ == '__main__':
+    sys.exit(FakeYtDlp(sys.argv[1:]).run())
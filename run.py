@@ -2,6 +2,9 @@
 """
 Run YouTube Downloader from command line
 Works on both Windows and Unix-like systems
+
+Without arguments the GUI starts; with arguments (links, --help, ...) the
+headless CLI in src/cli.py runs instead
 """
 
 import sys
@@ -11,7 +14,10 @@ import os
 src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
 sys.path.insert(0, src_dir)
 
-from main import main
-
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Arguments mean a headless run; the GUI (and tkinter) is never loaded
+        from cli import main as cli_main
+        sys.exit(cli_main())
+    from main import main
     main()
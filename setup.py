@@ -49,6 +49,7 @@ setup(
     entry_points={
         "console_scripts": [
             "youtube-downloader=src.main:main",
+            "youtube-downloader-cli=src.cli:main",
         ],
     },
     include_package_data=True,
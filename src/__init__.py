@@ -5,12 +5,17 @@ YouTube Video Downloader Package
 __version__ = "1.0.0"
 __author__ = "YouTube Downloader Team"
 
-from .downloader import YouTubeDownloader
+# The GUI stays out of `import *`, which would load tkinter on headless systems
+__all__ = ['YouTubeDownloader']
 
-# GUI import is optional (requires tkinter)
-try:
-    from .main import YouTubeDownloaderGUI
-    __all__ = ['YouTubeDownloader', 'YouTubeDownloaderGUI']
-except ImportError:
-    # If tkinter is not available, still allow downloader to be imported
-    __all__ = ['YouTubeDownloader']
+
+def __getattr__(name):
+    # Imported on first use so the headless CLI never loads tkinter
+    if name == 'YouTubeDownloader':
+        from .downloader import YouTubeDownloader
+        return YouTubeDownloader
+    if name == 'YouTubeDownloaderGUI':
+        # GUI import is optional (requires tkinter)
+        from .main import YouTubeDownloaderGUI
+        return YouTubeDownloaderGUI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Download archive
+Remembers finished downloads so re-submitted links become instant no-ops
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, Union
+
+try:
+    from .paths import user_file
+    from .urls import video_key
+except ImportError:
+    from paths import user_file
+    from urls import video_key
+
+
+MEDIA_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.m4a', '.mp3', '.opus', '.ogg')
+
+# yt-dlp's default naming puts the ID in brackets: "Title [dQw4w9WgXcQ].mp4"
+_BRACKETED_ID = re.compile(r'\[([\w-]{11})\]')
+
+
+def file_checksum(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _as_key(url: str) -> str:
+    """Accept either a link or an already normalized video key"""
+    return url if url.startswith(('youtube:', 'url:')) else video_key(url)
+
+
+def clip_key(start_time: Optional[float] = None, end_time: Optional[float] = None) -> str:
+    """Archive key for a clip range in minutes; '' for the full video"""
+    if start_time is None:
+        return ''
+    return f'{start_time:g}-{end_time:g}' if end_time else f'{start_time:g}-'
+
+
+class DownloadArchive:
+    """
+    Indexed record of finished downloads
+
+    Entries map (video, format, clip range) to the file on disk with its
+    size and SHA-256. Video keys are normalized (see urls.video_key), so
+    any link form of the same video hits the same entry. Safe to share
+    between threads.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, checksums: bool = True):
+        self.path = str(path or user_file('archive.db'))
+        self.checksums = checksums
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS downloads ('
+            ' video TEXT NOT NULL,'
+            ' format TEXT NOT NULL,'
+            ' clip TEXT NOT NULL,'
+            ' filepath TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' checksum TEXT,'
+            ' created REAL NOT NULL,'
+            ' PRIMARY KEY (video, format, clip))'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS downloads_filepath ON downloads (filepath)')
+        self._db.commit()
+
+    def lookup(self, url: str, format_key: str = 'best', clip: str = '',
+               verify: Union[bool, str] = True) -> Optional[Dict[str, Any]]:
+        """
+        Find an archived download
+
+        Args:
+            url: Video link or an already normalized video key
+            format_key: Quality preset the file was downloaded with
+            clip: Clip range key (see clip_key)
+            verify: True to check the file still exists with the recorded
+                    size, 'checksum' to also re-hash it, False to trust the index
+
+        Returns:
+            Entry dict (filepath, size, checksum, created) or None
+        """
+        key = _as_key(url)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT filepath, size, checksum, created FROM downloads '
+                'WHERE video = ? AND format = ? AND clip = ?',
+                (key, format_key, clip)
+            ).fetchone()
+        entry = None
+        if row is not None:
+            entry = {'video': key, 'format': format_key, 'clip': clip, 'filepath': row[0],
+                     'size': row[1], 'checksum': row[2], 'created': row[3]}
+            if verify and not self._verify(entry, verify == 'checksum'):
+                self.remove(key, format_key, clip)
+                entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def record(self, url: str, filepath: str, format_key: str = 'best', clip: str = '',
+               checksum: Optional[str] = None) -> Dict[str, Any]:
+        """Add or replace the entry for a finished download"""
+        key = _as_key(url)
+        size = os.path.getsize(filepath)
+        if checksum is None and self.checksums:
+            checksum = file_checksum(filepath)
+        entry = {'video': key, 'format': format_key, 'clip': clip, 'filepath': filepath,
+                 'size': size, 'checksum': checksum, 'created': time.time()}
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO downloads '
+                '(video, format, clip, filepath, size, checksum, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, format_key, clip, filepath, size, checksum, entry['created'])
+            )
+            self._db.commit()
+        return entry
+
+    def remove(self, url: str, format_key: str = 'best', clip: str = ''):
+        """Forget an entry"""
+        key = _as_key(url)
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM downloads WHERE video = ? AND format = ? AND clip = ?',
+                (key, format_key, clip)
+            )
+            self._db.commit()
+
+    def import_folder(self, folder: str, format_key: str = 'best',
+                      recursive: bool = False) -> int:
+        """
+        Build index entries from files that are already on disk
+
+        A file's video ID is taken from a "[<id>]" tag in its name or from
+        a matching .info.json written by yt-dlp. Files without either are
+        skipped. Returns the number of files imported.
+        """
+        imported = 0
+        pattern = '**/*' if recursive else '*'
+        for path in sorted(Path(folder).glob(pattern)):
+            if path.suffix.lower() not in MEDIA_EXTENSIONS or not path.is_file():
+                continue
+            key = self._key_for_file(path)
+            if key is None:
+                continue
+            self.record(key, str(path), format_key)
+            imported += 1
+        return imported
+
+    @staticmethod
+    def _key_for_file(path: Path) -> Optional[str]:
+        """Video key for a media file on disk, or None if unknown"""
+        info_file = path.with_suffix('.info.json')
+        if info_file.exists():
+            try:
+                with open(info_file, 'r', encoding='utf-8') as f:
+                    info = json.load(f)
+                url = info.get('webpage_url') or info.get('original_url')
+                if url:
+                    return video_key(url)
+            except (OSError, ValueError):
+                pass
+        match = _BRACKETED_ID.search(path.stem)
+        if match:
+            return f'youtube:{match.group(1)}'
+        return None
+
+    def _verify(self, entry: Dict[str, Any], checksum: bool) -> bool:
+        """Check an entry still points to the same file"""
+        try:
+            if os.path.getsize(entry['filepath']) != entry['size']:
+                return False
+        except OSError:
+            return False
+        if checksum and entry['checksum']:
+            return file_checksum(entry['filepath']) == entry['checksum']
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookup counters and index size"""
+        with self._lock:
+            count, total = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM downloads'
+            ).fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': count, 'bytes': total}
+
+    def close(self):
+        """Close the database"""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,577 @@
+#!/usr/bin/env python3
+"""
+Batch download queue
+Runs many URLs through a bounded pool of worker threads
+"""
+
+import itertools
+import os
+import queue
+import threading
+import time
+from typing import Optional, Dict, Any, Callable, List
+
+try:
+    from .cookie_cache import CookieJarCache
+    from .downloader import YouTubeDownloader
+    from .governor import RateGovernor
+    from .job_store import KIND_PLAYLIST, JobStore
+    from .metrics import MetricsRecorder
+    from .playlist import PlaylistExpander
+    from .scheduler import ResourceScheduler
+    from .transfer import TransferTuner
+    from .urls import parse_url_list, read_url_file
+except ImportError:
+    from cookie_cache import CookieJarCache
+    from downloader import YouTubeDownloader
+    from governor import RateGovernor
+    from job_store import KIND_PLAYLIST, JobStore
+    from metrics import MetricsRecorder
+    from playlist import PlaylistExpander
+    from scheduler import ResourceScheduler
+    from transfer import TransferTuner
+    from urls import parse_url_list, read_url_file
+
+
+class JobState:
+    """Lifecycle states of a queued download"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class DownloadJob:
+    """A single URL submitted to the queue"""
+
+    def __init__(self, job_id: int, url: str, options: Dict[str, Any],
+                 store_id: Optional[int] = None):
+        self.job_id = job_id
+        self.url = url
+        self.options = options
+        self.store_id = store_id
+        self.state = JobState.QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.bytes_downloaded = 0
+        self.attempts = 0
+        self.retry_at: Optional[float] = None
+        self.progress: Optional[Dict[str, Any]] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.downloader: Optional[YouTubeDownloader] = None
+        self.cancel_requested = False
+        self._lock = threading.Lock()
+
+    def cancel(self, keep_partial: bool = False) -> bool:
+        """Cancel the job; returns False if it already finished"""
+        with self._lock:
+            if self.state in JobState.FINISHED:
+                return False
+            self.cancel_requested = True
+            if self.state == JobState.QUEUED:
+                self.state = JobState.CANCELLED
+                self.error = 'Download cancelled by user'
+                self.finished_at = time.time()
+            elif self.downloader is not None:
+                self.downloader.cancel_download(keep_partial)
+            return True
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Seconds spent running, or None if the job never started"""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly snapshot of the job"""
+        return {
+            'id': self.job_id,
+            'url': self.url,
+            'state': self.state,
+            'filepath': self.result.get('filepath') if self.result else None,
+            'error': self.error,
+            'bytes': self.bytes_downloaded,
+            'percent': self.progress.get('percent') if self.progress else None,
+            'speed': self.progress.get('speed') if self.progress else None,
+            'duration': self.duration,
+            'attempts': self.attempts,
+        }
+
+
+class DownloadQueue:
+    """
+    Bounded worker pool for downloading many URLs
+
+    Every worker thread owns one YouTubeDownloader, so cancelling a
+    running job only affects the process that job started. All workers
+    share one RateGovernor: a job that YouTube blocked slows every worker
+    down and is put back in the queue after a jittered delay. A shared
+    ResourceScheduler caps total bandwidth, pauses new downloads while
+    the disk is nearly full and keeps `max_workers` downloads transferring
+    while other jobs merge on CPU slots. Browser cookies are extracted
+    once into a shared CookieJarCache instead of by every job. With a
+    JobStore, every job is journaled and unfinished work can be picked up
+    again with resume() after a restart. With a MetricsRecorder, every
+    finished job is recorded with its phase timings. With a TransferTuner,
+    running jobs split one budget of fragment connections.
+    """
+
+    def __init__(self, max_workers: int = 3,
+                 downloader_factory: Optional[Callable[[], YouTubeDownloader]] = None,
+                 on_job_update: Optional[Callable[[DownloadJob], None]] = None,
+                 on_job_progress: Optional[Callable[[DownloadJob, Dict[str, Any]], None]] = None,
+                 job_store: Optional[JobStore] = None,
+                 governor: Optional[RateGovernor] = None,
+                 scheduler: Optional[ResourceScheduler] = None,
+                 cookie_cache: Optional[CookieJarCache] = None,
+                 metrics: Optional[MetricsRecorder] = None,
+                 transfer: Optional[TransferTuner] = None):
+        self.max_workers = max(1, int(max_workers))
+        self.downloader_factory = downloader_factory or YouTubeDownloader
+        self.on_job_update = on_job_update
+        self.on_job_progress = on_job_progress
+        self.job_store = job_store
+        self.governor = governor or RateGovernor()
+        self.scheduler = scheduler or ResourceScheduler(network_slots=self.max_workers)
+        self.scheduler.add_demand_source(self._demand)
+        self.cookie_cache = cookie_cache or CookieJarCache()
+        self.metrics = metrics
+        self.transfer = transfer
+        # Jobs past the queue and not yet post-processing; bounds probing,
+        # extraction and transfers to max_workers however many threads run
+        self._fetch_slots = threading.Semaphore(self.max_workers)
+
+        self._pending: "queue.Queue[Optional[DownloadJob]]" = queue.Queue()
+        self._jobs: Dict[int, DownloadJob] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._unfinished = 0
+        self._expanders: List[PlaylistExpander] = []
+        self._retries: Dict[int, threading.Timer] = {}
+        self._workers: List[threading.Thread] = []
+        self._started_at: Optional[float] = None
+        self._closed = False
+        self._suspended = False
+
+    def submit(self, url: str, options: Optional[Dict[str, Any]] = None,
+               store_id: Optional[int] = None) -> DownloadJob:
+        """Queue one URL; options are the same as YouTubeDownloader.download()"""
+        options = dict(options or {})
+        if self.job_store is not None and store_id is None:
+            store_id = self.job_store.add(url, options)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Queue has been shut down')
+            job = DownloadJob(next(self._ids), url, options, store_id)
+            self._jobs[job.job_id] = job
+            self._unfinished += 1
+            if self._started_at is None:
+                self._started_at = time.time()
+            self._ensure_workers()
+        self._pending.put(job)
+        self._notify(job)
+        return job
+
+    def submit_many(self, urls: List[str],
+                    options: Optional[Dict[str, Any]] = None) -> List[DownloadJob]:
+        """Queue several URLs with shared options"""
+        return [self.submit(url, options) for url in urls]
+
+    def submit_text(self, text: str,
+                    options: Optional[Dict[str, Any]] = None) -> List[DownloadJob]:
+        """Queue every link found in a pasted list"""
+        return self.submit_many(parse_url_list(text), options)
+
+    def submit_file(self, path: str,
+                    options: Optional[Dict[str, Any]] = None) -> List[DownloadJob]:
+        """Queue every link found in a text file"""
+        return self.submit_many(read_url_file(path), options)
+
+    def submit_playlist(self, url: str, options: Optional[Dict[str, Any]] = None,
+                        expander: Optional[PlaylistExpander] = None,
+                        store_id: Optional[int] = None) -> PlaylistExpander:
+        """
+        Expand a playlist or channel in the background, queueing each video
+        as soon as it is listed
+
+        Downloads start while the listing is still running; wait() also
+        waits for the listing to finish. Pass an expander with an archive
+        to skip finished videos without queueing them.
+        """
+        options = dict(options or {})
+        if expander is None:
+            expander = PlaylistExpander(format_key=options.get('quality', 'best'),
+                                        cookies_browser=options.get('cookies_browser'))
+        if expander.cookie_cache is None:
+            expander.cookie_cache = self.cookie_cache
+        if self.job_store is not None and store_id is None:
+            store_id = self.job_store.add(url, options, KIND_PLAYLIST)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Queue has been shut down')
+            self._expanders.append(expander)
+            self._unfinished += 1
+        threading.Thread(target=self._expand_playlist, args=(expander, url, options, store_id),
+                         name='playlist-expander', daemon=True).start()
+        return expander
+
+    def resume(self, options: Optional[Dict[str, Any]] = None,
+               expander_factory: Optional[Callable[[Dict[str, Any]], PlaylistExpander]] = None
+               ) -> List[DownloadJob]:
+        """
+        Queue again every job the store still lists as unfinished
+
+        `options` are laid over the stored ones (callbacks are not stored,
+        so pass them here). Interrupted playlists are listed again; videos
+        that are being resumed anyway are skipped by the new listing.
+        """
+        if self.job_store is None:
+            return []
+        jobs = []
+        playlists = []
+        for entry in self.job_store.unfinished():
+            merged = dict(entry['options'])
+            merged.update(options or {})
+            if entry['kind'] == KIND_PLAYLIST:
+                playlists.append((entry, merged))
+            else:
+                jobs.append(self.submit(entry['url'], merged, entry['id']))
+        for entry, merged in playlists:
+            expander = expander_factory(merged) if expander_factory else None
+            if expander is None:
+                expander = PlaylistExpander(format_key=merged.get('quality', 'best'),
+                                            cookies_browser=merged.get('cookies_browser'))
+            expander.exclude(job.url for job in jobs)
+            self.submit_playlist(entry['url'], merged, expander, entry['id'])
+        return jobs
+
+    def get(self, job_id: int) -> Optional[DownloadJob]:
+        """Look up a job by id"""
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[DownloadJob]:
+        """All jobs in submission order"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job"""
+        job = self._jobs.get(job_id)
+        if job is None or not job.cancel():
+            return False
+        self._notify(job)
+        self._drop_retry(job.job_id)
+        return True
+
+    def cancel_all(self):
+        """Cancel every job that has not finished yet, and running playlist listings"""
+        with self._lock:
+            expanders = list(self._expanders)
+        for expander in expanders:
+            expander.cancel()
+        for job in self.jobs():
+            self.cancel(job.job_id)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every submitted job finished; returns False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def suspend(self):
+        """
+        Stop all work but keep it resumable
+
+        Running downloads are stopped with their partial files kept, and
+        the job store is left showing every unfinished job as unfinished.
+        """
+        with self._lock:
+            self._suspended = True
+            expanders = list(self._expanders)
+        for expander in expanders:
+            expander.cancel()
+        for job in self.jobs():
+            job.cancel(keep_partial=True)
+        self.shutdown(wait=True)
+
+    def shutdown(self, wait: bool = True, cancel: bool = False):
+        """Stop accepting jobs and let the workers exit"""
+        if cancel:
+            self.cancel_all()
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+            expanders = list(self._expanders)
+            retrying = list(self._retries)
+        for expander in expanders:
+            expander.cancel()
+        for job_id in retrying:
+            # Jobs waiting out a block would never be picked up again
+            job = self._jobs[job_id]
+            job.cancel()
+            if not self._suspended:
+                self._notify(job)
+            self._drop_retry(job_id)
+        for _ in workers:
+            self._pending.put(None)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Aggregate counters and throughput across all jobs"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+            started_at = self._started_at
+        counts = {state: 0 for state in (JobState.QUEUED, JobState.RUNNING, JobState.DONE,
+                                         JobState.FAILED, JobState.CANCELLED)}
+        total_bytes = 0
+        busy_time = 0.0
+        archived = 0
+        for job in jobs:
+            counts[job.state] += 1
+            if job.result and job.result.get('archived'):
+                archived += 1
+            total_bytes += job.bytes_downloaded
+            busy_time += job.duration or 0.0
+        with self._lock:
+            retrying = len(self._retries)
+        elapsed = time.time() - started_at if started_at else 0.0
+        finished = counts[JobState.DONE] + counts[JobState.FAILED] + counts[JobState.CANCELLED]
+        return {
+            'total': len(jobs),
+            'states': counts,
+            'archived': archived,
+            'workers': self.max_workers,
+            'elapsed': elapsed,
+            'bytes': total_bytes,
+            'throughput_bps': total_bytes / elapsed if elapsed else 0.0,
+            'jobs_per_minute': finished * 60.0 / elapsed if elapsed else 0.0,
+            'busy_time': busy_time,
+            'retrying': retrying,
+            'governor': self.governor.stats(),
+            'scheduler': self.scheduler.stats(),
+            'cookies': self.cookie_cache.stats(),
+            'transfer': self.transfer.stats() if self.transfer is not None else None,
+        }
+
+    def _expand_playlist(self, expander: PlaylistExpander, url: str, options: Dict[str, Any],
+                         store_id: Optional[int]):
+        """Listing thread: submit entries as they arrive"""
+        log_callback = options.get('log_callback')
+        try:
+            for entry in expander.expand(url, log_callback):
+                self.submit(entry['url'], options)
+        except RuntimeError:
+            # Queue was shut down mid-listing
+            expander.cancel()
+        except Exception as e:
+            expander.error = str(e)
+        finally:
+            if log_callback:
+                stats = expander.stats()
+                log_callback(f"Playlist listed: {stats['new']} new, {stats['archived']} already "
+                             f"downloaded, {stats['duplicates']} duplicates")
+            if store_id is not None and not self._suspended:
+                # Listed entries are journaled as their own jobs from here on
+                state = JobState.CANCELLED if expander.is_cancelled else JobState.DONE
+                self.job_store.update(store_id, state, expander.error)
+            with self._idle:
+                self._expanders.remove(expander)
+                self._unfinished -= 1
+                self._idle.notify_all()
+
+    def _demand(self) -> int:
+        """Jobs queued or running, for the scheduler's bandwidth split"""
+        with self._lock:
+            return self._unfinished - len(self._expanders) - len(self._retries)
+
+    def _ensure_workers(self):
+        """Start worker threads lazily (lock held)"""
+        queued = self._unfinished - len(self._expanders)
+        # Extra threads pick up new downloads while others are merging; only
+        # max_workers of them hold a fetch slot (see _worker_loop)
+        limit = max(self.max_workers, self.scheduler.network_slots) + self.scheduler.cpu_slots
+        while len(self._workers) < min(limit, queued):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f'download-worker-{len(self._workers) + 1}',
+                daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _worker_loop(self):
+        """Pull jobs until a shutdown sentinel arrives"""
+        downloader = self.downloader_factory()
+        downloader.governor = self.governor
+        downloader.scheduler = self.scheduler
+        downloader.cookie_cache = self.cookie_cache
+        if self.transfer is not None:
+            downloader.transfer = self.transfer
+        while True:
+            self._fetch_slots.acquire()
+            released = []
+
+            def release_slot():
+                # Once, from the merge hand-off or when the job ends
+                if not released:
+                    released.append(True)
+                    self._fetch_slots.release()
+
+            job = self._pending.get()
+            if job is None:
+                release_slot()
+                return
+            requeued = False
+            try:
+                requeued = self._run_job(job, downloader, release_slot)
+            finally:
+                release_slot()
+                if not requeued:
+                    with self._idle:
+                        self._unfinished -= 1
+                        self._idle.notify_all()
+
+    def _run_job(self, job: DownloadJob, downloader: YouTubeDownloader,
+                 release_slot: Callable[[], None] = lambda: None) -> bool:
+        """
+        Run one job on this worker's downloader; returns True if it was requeued
+
+        `release_slot` is called when the job starts post-processing, so
+        another worker can start the next download meanwhile.
+        """
+        with job._lock:
+            if job.state != JobState.QUEUED:
+                return False
+            job.state = JobState.RUNNING
+            job.started_at = time.time()
+            job.attempts += 1
+            job.retry_at = None
+            job.downloader = downloader
+        self._notify(job)
+
+        options = dict(job.options)
+        log_callback = options.get('log_callback')
+        if log_callback:
+            options['log_callback'] = lambda msg, n=job.job_id: log_callback(f"[job {n}] {msg}")
+        progress_callback = options.get('progress_callback')
+
+        def on_progress(event):
+            job.progress = event
+            if progress_callback:
+                progress_callback(event)
+            if self.on_job_progress:
+                try:
+                    self.on_job_progress(job, event)
+                except Exception:
+                    pass
+        options['progress_callback'] = on_progress
+        options['postprocess_callback'] = release_slot
+
+        try:
+            result = downloader.download(job.url, options)
+        except Exception as e:
+            result = {'success': False, 'error': f'Unexpected error: {str(e)}'}
+
+        with job._lock:
+            job.downloader = None
+            job.result = result
+            job.finished_at = time.time()
+            delay = None
+            if result.get('blocked') and not job.cancel_requested and not self._closed:
+                delay = self.governor.requeue_delay(job.attempts)
+            if delay is not None:
+                job.state = JobState.QUEUED
+                job.error = f"Blocked ({result['blocked']}), retrying in {delay:.0f}s"
+                job.retry_at = time.time() + delay
+                job.started_at = job.finished_at = None
+            elif job.cancel_requested:
+                job.state = JobState.CANCELLED
+                job.error = 'Download cancelled by user'
+            elif result.get('success'):
+                job.state = JobState.DONE
+                if not result.get('archived'):
+                    job.bytes_downloaded = (result.get('downloaded_bytes')
+                                            or self._file_size(result.get('filepath')))
+            else:
+                job.state = JobState.FAILED
+                job.error = result.get('error', 'Unknown error')
+        if delay is not None:
+            timer = threading.Timer(delay, self._requeue, args=(job.job_id,))
+            timer.daemon = True
+            with self._lock:
+                self._retries[job.job_id] = timer
+            timer.start()
+        elif self.metrics is not None:
+            try:
+                self.metrics.record(self._metrics_record(job))
+            except Exception:
+                pass
+        self._notify(job)
+        return delay is not None
+
+    @staticmethod
+    def _metrics_record(job: DownloadJob) -> Dict[str, Any]:
+        """Flat record of a finished job for the MetricsRecorder"""
+        result = job.result or {}
+        record = job.to_dict()
+        for key in ('average_speed', 'peak_speed', 'retries', 'strategy', 'blocked', 'probe_cache',
+                    'cookie_cache', 'cookie_seconds_saved', 'archived', 'concurrent_fragments'):
+            if result.get(key) is not None:
+                record[key] = result[key]
+        timings = dict(result.get('timings') or {})
+        # From submitting to the start of the last attempt, incl. requeue delays
+        timings['queue'] = job.started_at - job.submitted_at
+        record['timings'] = timings
+        return record
+
+    def _requeue(self, job_id: int):
+        """Timer callback: hand a job that waited out its block back to the workers"""
+        with self._lock:
+            if self._retries.pop(job_id, None) is None:
+                return
+        self._pending.put(self._jobs[job_id])
+
+    def _drop_retry(self, job_id: int):
+        """Stop a pending requeue; the job no longer counts as unfinished"""
+        with self._idle:
+            timer = self._retries.pop(job_id, None)
+            if timer is None:
+                return
+            timer.cancel()
+            self._unfinished -= 1
+            self._idle.notify_all()
+
+    def _notify(self, job: DownloadJob):
+        """Journal state changes and forward them to the listener, ignoring its errors"""
+        if self.job_store is not None and job.store_id is not None:
+            # Jobs stopped by suspend() stay unfinished in the store
+            if not (self._suspended and job.state == JobState.CANCELLED):
+                try:
+                    self.job_store.update(job.store_id, job.state, job.error,
+                                          job.result.get('filepath') if job.result else None,
+                                          job.bytes_downloaded)
+                except Exception:
+                    pass
+        if self.on_job_update:
+            try:
+                self.on_job_update(job)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _file_size(filepath: Optional[str]) -> int:
+        """Size of a finished file, or 0 if it cannot be found"""
+        try:
+            if filepath and os.path.isfile(filepath):
+                return os.path.getsize(filepath)
+        except OSError:
+            pass
+        return 0
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Caching HTTP proxy
+Lets several workers share fetched media fragments and byte ranges
+"""
+
+import argparse
+import hashlib
+import http.client
+import http.server
+import json
+import os
+import select
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlsplit
+
+
+# Response headers kept with a cached body
+_CACHED_HEADERS = ('Content-Type', 'Content-Range', 'Accept-Ranges', 'Last-Modified', 'ETag')
+
+# Headers that only apply to one connection and are never forwarded
+_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'proxy-authorization',
+                'proxy-authenticate', 'te', 'trailer', 'transfer-encoding', 'upgrade'}
+
+_COPY_CHUNK = 64 * 1024
+
+
+def cache_key(url: str, range_header: Optional[str] = None) -> str:
+    """
+    Key of a response in the cache
+
+    The full URL and the Range header: equal ranges are shared, which is
+    what yt-dlp's fixed --http-chunk-size requests produce. Only plain-HTTP
+    URLs reach the cache (HTTPS is tunnelled), so there is no rewriting of
+    signed YouTube URLs here.
+    """
+    return hashlib.sha256(f"{url}|{range_header or ''}".encode()).hexdigest()
+
+
+class _Transfer:
+    """A response being fetched once and streamed to every waiting client"""
+
+    def __init__(self, temp_path: str):
+        self.temp_path = temp_path
+        self.cond = threading.Condition()
+        self.status: Optional[int] = None
+        self.headers: List[Tuple[str, str]] = []
+        self.length = 0
+        self.written = 0
+        self.done = False
+        self.failed = False
+
+
+class CacheProxy:
+    """
+    Forward HTTP proxy that caches media responses on disk
+
+    Point yt-dlp at it with --proxy. Complete 200/206 GET responses with a
+    Content-Length are stored under `cache_dir` and evicted least recently
+    used first once the cache outgrows `max_bytes`. Identical requests that
+    arrive while the first is still downloading are coalesced: they are
+    streamed from the same upstream transfer as it comes in. HTTPS is
+    tunnelled with CONNECT and cannot be cached (the proxy never sees the
+    bytes), so caching applies to plain-HTTP origins such as a LAN mirror
+    or the fake server in benchmarks/. Safe to run for many clients.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = 2 * 1024 ** 3,
+                 max_object_bytes: Optional[int] = None, host: str = '127.0.0.1', port: int = 0,
+                 timeout: float = 30.0):
+        """
+        Args:
+            cache_dir: Directory for cached bodies (a temporary one if None)
+            max_bytes: Total size the cache is trimmed to
+            max_object_bytes: Largest response stored (default: a quarter of max_bytes)
+            host: Address to listen on; '0.0.0.0' to serve a LAN
+            port: Port to listen on; 0 picks a free one
+            timeout: Seconds to wait on the upstream server
+        """
+        self._temp_dir = None
+        if cache_dir is None:
+            self._temp_dir = tempfile.TemporaryDirectory(prefix='ytd-proxy-')
+            cache_dir = self._temp_dir.name
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes or max_bytes // 4
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.url = ''
+        self._lock = threading.Lock()
+        self._index: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._size = 0
+        self._transfers: Dict[str, _Transfer] = {}
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+        self._counters = {'requests': 0, 'hits': 0, 'misses': 0, 'coalesced': 0, 'uncacheable': 0,
+                          'tunnels': 0, 'errors': 0, 'evictions': 0,
+                          'bytes_from_cache': 0, 'bytes_from_upstream': 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def start(self) -> str:
+        """Listen in a background thread; returns the proxy URL for --proxy"""
+        proxy = self
+
+        class Handler(_ProxyHandler):
+            cache = proxy
+
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='cache-proxy', daemon=True).start()
+        host, port = self._server.server_address[:2]
+        self.url = f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}"
+        return self.url
+
+    def stop(self):
+        """Stop listening; cached files stay for the next start"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+            self._temp_dir = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/coalescing counters, bytes served per source and cache size"""
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._index), cache_bytes=self._size)
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = (stats['hits'] + stats['coalesced']) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            keys = list(self._index)
+            self._index.clear()
+            self._size = 0
+        for key in keys:
+            self._remove_files(key)
+
+    # -- cache --
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return base, base + '.json'
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files a previous run left"""
+        # Bodies of transfers that were cut off when the last run stopped
+        for temp_path in Path(self.cache_dir).glob('fetch-*'):
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+        entries = []
+        for meta_path in Path(self.cache_dir).glob('*/*.json'):
+            body_path = meta_path.with_suffix('')
+            try:
+                with open(meta_path, encoding='utf-8') as f:
+                    meta = json.load(f)
+                st = body_path.stat()
+            except (OSError, ValueError):
+                continue
+            if st.st_size != meta.get('size'):
+                continue
+            entries.append((st.st_atime, body_path.name, meta))
+        for _, key, meta in sorted(entries):
+            self._index[key] = meta
+            self._size += meta['size']
+        self._evict()
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            meta = self._index.get(key)
+            if meta is not None:
+                self._index.move_to_end(key)
+        return meta
+
+    def _store(self, key: str, transfer: _Transfer):
+        """Move a finished transfer into the cache"""
+        body_path, meta_path = self._paths(key)
+        meta = {'status': transfer.status, 'headers': transfer.headers, 'size': transfer.length}
+        try:
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            os.replace(transfer.temp_path, body_path)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+        except OSError:
+            return
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self._size -= old['size']
+            self._index[key] = meta
+            self._size += meta['size']
+        self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        while True:
+            with self._lock:
+                if self._size <= self.max_bytes or not self._index:
+                    return
+                key, meta = self._index.popitem(last=False)
+                self._size -= meta['size']
+                self._counters['evictions'] += 1
+            self._remove_files(key)
+
+    def _remove_files(self, key: str):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counters[name] += amount
+
+    def _join(self, key: str) -> Tuple[_Transfer, bool]:
+        """The running transfer for a key, or a new one; True if the caller must fetch it"""
+        with self._lock:
+            transfer = self._transfers.get(key)
+            if transfer is not None:
+                return transfer, False
+            fd, temp_path = tempfile.mkstemp(prefix='fetch-', dir=self.cache_dir)
+            os.close(fd)
+            transfer = self._transfers[key] = _Transfer(temp_path)
+            return transfer, True
+
+    def _finish(self, key: str, transfer: _Transfer, complete: bool):
+        """Publish the outcome to coalesced clients and cache a complete body"""
+        if complete:
+            self._store(key, transfer)
+        # Dropped only once stored, so a request in between is never a second fetch
+        with self._lock:
+            self._transfers.pop(key, None)
+        with transfer.cond:
+            transfer.failed = not complete
+            transfer.done = True
+            transfer.cond.notify_all()
+        if not complete:
+            try:
+                os.remove(transfer.temp_path)
+            except OSError:
+                pass
+
+
+class _ProxyHandler(http.server.BaseHTTPRequestHandler):
+    cache: CacheProxy = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_CONNECT(self):
+        self.cache._count(requests=1, tunnels=1)
+        host, _, port = self.path.rpartition(':')
+        try:
+            upstream = socket.create_connection((host, int(port or 443)),
+                                                timeout=self.cache.timeout)
+        except (OSError, ValueError) as e:
+            self.cache._count(errors=1)
+            self.send_error(502, f'Cannot reach {self.path}: {e}')
+            return
+        self.send_response(200, 'Connection Established')
+        self.end_headers()
+        self.close_connection = True
+        sockets = [self.connection, upstream]
+        try:
+            while True:
+                readable, _, broken = select.select(sockets, [], sockets, self.cache.timeout * 10)
+                if broken or not readable:
+                    break
+                for sock in readable:
+                    data = sock.recv(_COPY_CHUNK)
+                    if not data:
+                        return
+                    (upstream if sock is self.connection else self.connection).sendall(data)
+        except OSError:
+            pass
+        finally:
+            upstream.close()
+
+    def do_HEAD(self):
+        self.cache._count(requests=1, uncacheable=1)
+        self._forward(cacheable=False)
+
+    def do_GET(self):
+        cache = self.cache
+        cache._count(requests=1)
+        if not self.path.startswith('http://'):
+            self.send_error(400, 'Expected an absolute http:// URL (use this server as a proxy)')
+            return
+        key = cache_key(self.path, self.headers.get('Range'))
+        meta = cache._lookup(key)
+        if meta is not None and self._serve_cached(key, meta):
+            return
+        transfer, leader = cache._join(key)
+        if leader:
+            cache._count(misses=1)
+            self._forward(cacheable=True, key=key, transfer=transfer)
+            return
+        cache._count(coalesced=1)
+        self._follow(key, transfer)
+
+    def _serve_cached(self, key: str, meta: Dict[str, Any]) -> bool:
+        body_path, _ = self.cache._paths(key)
+        try:
+            f = open(body_path, 'rb')
+        except OSError:
+            return False
+        with f:
+            os.utime(body_path)
+            self.cache._count(hits=1)
+            self._send_head(meta['status'], meta['headers'], meta['size'])
+            sent = 0
+            try:
+                for chunk in iter(lambda: f.read(_COPY_CHUNK), b''):
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+            except OSError:
+                self.close_connection = True
+            self.cache._count(bytes_from_cache=sent)
+        return True
+
+    def _follow(self, key: str, transfer: _Transfer):
+        """Stream a transfer another client started, as its bytes arrive"""
+        try:
+            # Opened up front: once complete, the file is moved into the cache
+            f = open(transfer.temp_path, 'rb')
+        except OSError:
+            meta = self.cache._lookup(key)
+            if meta is None or not self._serve_cached(key, meta):
+                self._forward(cacheable=False)
+            return
+        with f:
+            self._follow_file(f, transfer)
+
+    def _follow_file(self, f, transfer: _Transfer):
+        with transfer.cond:
+            transfer.cond.wait_for(lambda: transfer.status is not None or transfer.done)
+        if transfer.status is None:
+            # The first request was not cacheable or failed early: fetch on our own
+            self._forward(cacheable=False)
+            return
+        self._send_head(transfer.status, transfer.headers, transfer.length)
+        sent = 0
+        try:
+            while sent < transfer.length:
+                with transfer.cond:
+                    transfer.cond.wait_for(lambda: transfer.written > sent or transfer.done)
+                    available, failed = transfer.written, transfer.failed
+                if failed and available <= sent:
+                    # Upstream broke off; the client sees a short body and retries
+                    self.close_connection = True
+                    break
+                f.seek(sent)
+                chunk = f.read(min(available - sent, _COPY_CHUNK * 16))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                sent += len(chunk)
+        except OSError:
+            self.close_connection = True
+        self.cache._count(bytes_from_cache=sent)
+
+    def _forward(self, cacheable: bool, key: Optional[str] = None,
+                 transfer: Optional[_Transfer] = None):
+        """Fetch from the origin and relay; with a transfer, also record it for the cache"""
+        cache = self.cache
+        complete = False
+        try:
+            parts = urlsplit(self.path)
+            connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                else http.client.HTTPConnection)
+            upstream = connection_class(parts.hostname, parts.port, timeout=cache.timeout)
+            headers = {name: value for name, value in self.headers.items()
+                       if name.lower() not in _HOP_HEADERS}
+            if cacheable:
+                # Stored bodies must be the plain bytes any client can take
+                headers['Accept-Encoding'] = 'identity'
+            path = parts.path or '/'
+            upstream.request(self.command, path + (f'?{parts.query}' if parts.query else ''),
+                             headers=headers)
+            response = upstream.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            cache._count(errors=1)
+            if transfer is not None:
+                cache._finish(key, transfer, False)
+            self.send_error(502, f'Upstream request failed: {e}')
+            return
+
+        try:
+            length = response.getheader('Content-Length')
+            storable = (transfer is not None and self.command == 'GET'
+                        and response.status in (200, 206)
+                        and length is not None and int(length) <= cache.max_object_bytes)
+            if transfer is not None and not storable:
+                cache._count(uncacheable=1)
+                cache._finish(key, transfer, False)
+                transfer = None
+            if transfer is None:
+                self._relay(response)
+                return
+
+            headers = [(name, value) for name, value in response.getheaders()
+                       if name.title() in _CACHED_HEADERS]
+            with transfer.cond:
+                transfer.status, transfer.headers = response.status, headers
+                transfer.length = int(length)
+                transfer.cond.notify_all()
+            self._send_head(response.status, headers, transfer.length)
+            client_gone = False
+            with open(transfer.temp_path, 'wb') as f:
+                while True:
+                    chunk = response.read(_COPY_CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    f.flush()
+                    with transfer.cond:
+                        transfer.written += len(chunk)
+                        transfer.cond.notify_all()
+                    cache._count(bytes_from_upstream=len(chunk))
+                    if not client_gone:
+                        try:
+                            self.wfile.write(chunk)
+                        except OSError:
+                            # Keep filling the cache for the clients that wait on it
+                            client_gone = True
+                            self.close_connection = True
+            complete = transfer.written == transfer.length
+        except (OSError, http.client.HTTPException, ValueError):
+            cache._count(errors=1)
+            self.close_connection = True
+        finally:
+            if transfer is not None:
+                cache._finish(key, transfer, complete)
+            response.close()
+            upstream.close()
+
+    def _relay(self, response):
+        """Pass a response through unchanged"""
+        self.send_response(response.status, response.reason)
+        length = response.getheader('Content-Length')
+        for name, value in response.getheaders():
+            if name.lower() not in _HOP_HEADERS:
+                self.send_header(name, value)
+        if length is None:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        sent = 0
+        for chunk in iter(lambda: response.read(_COPY_CHUNK), b''):
+            self.wfile.write(chunk)
+            sent += len(chunk)
+        self.cache._count(bytes_from_upstream=sent)
+
+    def _send_head(self, status: int, headers: List[Tuple[str, str]], length: int):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the proxy in the foreground, e.g. on a machine the workers share"""
+    parser = argparse.ArgumentParser(description='Caching HTTP proxy for yt-dlp workers '
+                                                 '(use with --proxy http://HOST:PORT)')
+    parser.add_argument('--dir', required=True, help='cache directory')
+    parser.add_argument('--max-size', type=float, default=2.0, metavar='GIB',
+                        help='cache size in GiB (default: %(default)s)')
+    parser.add_argument('--host', default='127.0.0.1', help="listen address; '0.0.0.0' for the LAN")
+    parser.add_argument('--port', type=int, default=8899, help='port (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    proxy = CacheProxy(args.dir, max_bytes=int(args.max_size * 1024 ** 3), host=args.host,
+                       port=args.port)
+    print(f'Caching proxy on {proxy.start()}, cache in {args.dir}', file=sys.stderr, flush=True)
+    try:
+        while True:
+            time.sleep(60)
+            print(json.dumps(proxy.stats()), file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Headless command line interface
+Downloads links without tkinter and prints one JSON result per line
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INTERRUPTED = 130
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Argument parser; kept free of project imports so --help stays instant"""
+    parser = argparse.ArgumentParser(
+        prog='youtube-downloader-cli',
+        description='Download YouTube videos, clips, playlists and channels without the GUI. '
+                    'Prints one JSON object per finished link to stdout.',
+        epilog="Run 'youtube-downloader-cli serve --help' for the HTTP job service.",
+    )
+    parser.add_argument('urls', nargs='*', metavar='URL',
+                        help="links to download; '-' reads links from stdin")
+    parser.add_argument('-i', '--input', action='append', default=[], metavar='FILE',
+                        help='read links from a text file (one per line, # comments)')
+    parser.add_argument('-o', '--output', default=str(Path.home() / 'Downloads' / 'YouTube'),
+                        metavar='DIR', help='download folder (default: %(default)s)')
+    parser.add_argument('-q', '--quality', choices=('best', '1080', '720', 'audio'),
+                        default='best', help='quality preset (default: %(default)s)')
+    parser.add_argument('--cookies', choices=('chrome', 'firefox'), metavar='BROWSER',
+                        help='take cookies from chrome or firefox')
+    parser.add_argument('--cookies-from-browser', choices=('chrome', 'firefox'), metavar='BROWSER',
+                        help='retry downloads YouTube blocked with cookies from chrome or firefox')
+    parser.add_argument('--start', type=float, metavar='MIN', help='clip start in minutes')
+    parser.add_argument('--end', type=float, metavar='MIN', help='clip end in minutes')
+    parser.add_argument('--accurate-cuts', action='store_true',
+                        help='cut exactly at --start/--end by re-encoding around the cuts')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='download video and audio separately and merge/cut/transcode them '
+                             'on CPU workers while the next downloads run')
+    parser.add_argument('--transcode', choices=('h264', 'mp3'),
+                        help='re-encode every result (implies --pipeline)')
+    parser.add_argument('-j', '--jobs', type=int, default=3, metavar='N',
+                        help='parallel downloads (default: %(default)s)')
+    parser.add_argument('--limit-rate', metavar='RATE',
+                        help='total download speed across all jobs, e.g. 500K or 4M')
+    parser.add_argument('--min-free', default='500M', metavar='SIZE',
+                        help='pause new downloads while the output disk has less free space '
+                             '(default: %(default)s, 0 to disable)')
+    parser.add_argument('--proxy', metavar='URL',
+                        help='send yt-dlp requests through this proxy, e.g. a shared '
+                             'cache_proxy.py')
+    parser.add_argument('--cache-proxy', metavar='DIR',
+                        help='run a local caching proxy with its cache in DIR so parallel jobs '
+                             'share fetched fragments')
+    parser.add_argument('--concurrent-fragments', metavar='N',
+                        help="DASH/HLS fragments each download fetches at once, or 'auto' to size "
+                             'it per job from measured throughput and the number of running jobs')
+    parser.add_argument('--max-connections', type=int, default=16, metavar='N',
+                        help='with --concurrent-fragments auto, fragment connections across all '
+                             'running jobs (default: %(default)s)')
+    parser.add_argument('--external-downloader', choices=('aria2c',),
+                        help='hand transfers to aria2c with the same connection count '
+                             '(implies --concurrent-fragments auto)')
+    parser.add_argument('--plan', action='store_true',
+                        help='choose format IDs from the probed format list by estimated size and '
+                             'codec instead of leaving it to the quality preset')
+    parser.add_argument('--max-size', metavar='SIZE',
+                        help='plan the highest resolution whose estimated download fits, e.g. 200M '
+                             '(implies --plan)')
+    parser.add_argument('--max-bitrate', type=float, metavar='KBPS',
+                        help='plan the highest resolution below this total bitrate in kbit/s '
+                             '(implies --plan)')
+    parser.add_argument('--any-codec', action='store_true',
+                        help='plan smaller VP9/AV1/Opus streams over H.264/AAC of the same '
+                             'resolution (implies --plan)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the format plan and estimated bytes for each link, then exit')
+    parser.add_argument('--info-json', metavar='FILE',
+                        help='with --dry-run, plan from a saved yt-dlp -J output instead of links')
+    parser.add_argument('--engine', choices=('subprocess', 'api'), default='subprocess',
+                        help='run yt-dlp as a process or in-process (default: %(default)s)')
+    parser.add_argument('--ytdlp', metavar='PATH', help='yt-dlp executable to use')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the probe cache')
+    parser.add_argument('--no-archive', action='store_true',
+                        help='download even if the archive has the video')
+    parser.add_argument('--store', metavar='DIR',
+                        help='keep finished files once in a shared store under DIR and link them '
+                             'into the output folder; videos already stored are not downloaded '
+                             'again')
+    parser.add_argument('--store-gc', action='store_true',
+                        help='remove stored files no output folder links to any more, then exit '
+                             '(needs --store)')
+    parser.add_argument('--resume', action='store_true',
+                        help='journal jobs and first continue the ones an earlier run left '
+                             'unfinished; Ctrl+C then pauses instead of cancelling')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='append one JSON line per finished job with its phase timings')
+    parser.add_argument('--prometheus', metavar='FILE',
+                        help='keep Prometheus metrics in FILE (for a textfile collector)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='print yt-dlp output to stderr')
+    parser.add_argument('--version', action='store_true',
+                        help='print the yt-dlp in use, its version and supported features, '
+                             'then exit')
+    return parser
+
+
+def collect_urls(args, stdin=None) -> List[str]:
+    """Links from positional arguments, --input files and stdin"""
+    from urls import parse_url_list, read_url_file
+
+    stdin = stdin or sys.stdin
+    text = [url for url in args.urls if url != '-']
+    urls = parse_url_list(' '.join(text))
+    for path in args.input:
+        urls.extend(read_url_file(path))
+    if '-' in args.urls or (not args.urls and not args.input and not stdin.isatty()):
+        urls.extend(parse_url_list(stdin.read()))
+    # Keep first occurrences only, across all sources
+    return list(dict.fromkeys(urls))
+
+
+def run_pipeline(args, urls: List[str], options: Dict[str, Any], downloader_factory, scheduler,
+                 governor, cookie_cache, metrics, make_expander, emit) -> int:
+    """Run the links through pipeline.Pipeline; returns the exit code"""
+    from pipeline import Pipeline
+    from playlist import is_collection_url
+
+    def on_job_update(job):
+        if job.state in ('done', 'failed', 'cancelled'):
+            record = job.to_dict()
+            record['success'] = job.state == 'done'
+            emit(record)
+
+    job_options = {k: v for k, v in options.items() if k not in ('start_time', 'end_time')}
+    if args.start is not None:
+        # Cut locally from the full download
+        job_options['clips'] = [(args.start, args.end)]
+    if args.transcode:
+        job_options['transcode'] = args.transcode
+    pipeline = Pipeline(fetch_workers=args.jobs, downloader_factory=downloader_factory,
+                        scheduler=scheduler, governor=governor, cookie_cache=cookie_cache,
+                        metrics=metrics, on_job_update=on_job_update)
+    try:
+        for url in urls:
+            if is_collection_url(url):
+                listing_options = dict(options, ignore_archive=(options['ignore_archive']
+                                                                or bool(args.transcode)))
+                for entry in make_expander(listing_options).expand(url, options['log_callback']):
+                    pipeline.submit(entry['url'], job_options)
+            else:
+                pipeline.submit(url, job_options)
+        while not pipeline.wait(timeout=0.5):
+            pass
+    except KeyboardInterrupt:
+        pipeline.shutdown(wait=True, cancel=True)
+        return EXIT_INTERRUPTED
+    pipeline.shutdown()
+
+    stats = pipeline.stats()
+    options['log_callback'](f"Finished: {json.dumps(stats)}")
+    failed = stats['total'] - stats['states'].get('done', 0)
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point; returns the process exit code"""
+    argv = sys.argv[1:] if argv is None else argv
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    if argv[:1] == ['serve']:
+        from service import main as serve_main
+        return serve_main(argv[1:])
+    from scheduler import parse_rate
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.version:
+        from ytdlp_binary import find_ytdlp, ytdlp_features, ytdlp_version
+        path = args.ytdlp or find_ytdlp()
+        version = ytdlp_version(path)
+        print(json.dumps({'ytdlp': path, 'version': version,
+                          'features': ytdlp_features(version) if version else None}))
+        return EXIT_OK if version else EXIT_FAILED
+    if args.store_gc:
+        if not args.store:
+            parser.error('--store-gc needs --store')
+        from media_store import MediaStore
+        store = MediaStore(args.store)
+        try:
+            print(json.dumps(dict(store.gc(), **store.stats())))
+        finally:
+            store.close()
+        return EXIT_OK
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.start is None and args.end is not None:
+        parser.error('--end needs --start')
+    if args.end is not None and args.end <= args.start:
+        parser.error('--end must be greater than --start')
+    if args.transcode:
+        args.pipeline = True
+    if args.pipeline and args.resume:
+        parser.error('--resume cannot be combined with --pipeline')
+    if args.proxy and args.cache_proxy:
+        parser.error('--proxy cannot be combined with --cache-proxy')
+    if args.info_json and not args.dry_run:
+        parser.error('--info-json needs --dry-run')
+    try:
+        bandwidth_limit = parse_rate(args.limit_rate)
+        min_free = parse_rate(args.min_free) or 0
+        max_size = parse_rate(args.max_size)
+    except ValueError as e:
+        parser.error(str(e))
+    transfer = None
+    if args.concurrent_fragments or args.external_downloader:
+        from transfer import TransferTuner
+        fragments = args.concurrent_fragments or 'auto'
+        if fragments != 'auto' and not (fragments.isdigit() and int(fragments) > 0):
+            parser.error("--concurrent-fragments must be a positive number or 'auto'")
+        transfer = TransferTuner(max_connections=args.max_connections,
+                                 fixed=None if fragments == 'auto' else int(fragments),
+                                 external=args.external_downloader, max_jobs=args.jobs)
+        if args.external_downloader and transfer.external is None:
+            print(f'{args.external_downloader} not found, using the built-in downloader',
+                  file=sys.stderr)
+    planner = None
+    if args.plan or args.dry_run or max_size or args.max_bitrate or args.any_codec:
+        from format_planner import FormatPlanner
+        planner = FormatPlanner(max_bytes=max_size, max_bitrate=args.max_bitrate,
+                                prefer_mp4_native=not args.any_codec)
+    if args.info_json:
+        from downloader import YouTubeDownloader
+        try:
+            with open(args.info_json, encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f'cannot read {args.info_json}: {e}')
+        report = YouTubeDownloader(ytdlp_path=args.ytdlp, planner=planner).plan_formats(
+            info.get('webpage_url', ''), {'quality': args.quality, 'merge': not args.pipeline},
+            info=info)
+        print(json.dumps(dict(report, url=info.get('webpage_url'))))
+        return EXIT_OK if report['success'] else EXIT_FAILED
+
+    # Project modules are imported only once there is work to do
+    try:
+        urls = collect_urls(args)
+    except OSError as e:
+        parser.error(f'cannot read links: {e}')
+    if not urls and not args.resume:
+        parser.error('no links given')
+
+    from archive import DownloadArchive, clip_key
+    from batch import DownloadQueue, JobState
+    from cache_proxy import CacheProxy
+    from cookie_cache import CookieJarCache
+    from downloader import YouTubeDownloader
+    from governor import RateGovernor
+    from job_store import JobStore
+    from media_store import MediaStore
+    from metrics import MetricsRecorder
+    from playlist import PlaylistExpander, is_collection_url
+    from probe_cache import ProbeCache
+    from scheduler import ResourceScheduler
+    from ytdlp_binary import find_ytdlp
+
+    output_lock = threading.Lock()
+
+    def log(message: str):
+        if args.verbose:
+            with output_lock:
+                print(message, file=sys.stderr, flush=True)
+
+    def emit(record):
+        with output_lock:
+            print(json.dumps(record), flush=True)
+
+    def on_job_update(job):
+        if job.state not in JobState.FINISHED:
+            return
+        record = job.to_dict()
+        record['success'] = job.state == JobState.DONE
+        record['archived'] = bool(job.result and job.result.get('archived'))
+        if job.result and job.result.get('filepaths'):
+            record['filepaths'] = job.result['filepaths']
+        emit(record)
+
+    probe_cache = None if args.no_cache else ProbeCache()
+    archive = DownloadArchive()
+    job_store = JobStore() if args.resume else None
+    media_store = MediaStore(args.store) if args.store else None
+    os.makedirs(args.output, exist_ok=True)
+    cache_proxy = CacheProxy(args.cache_proxy) if args.cache_proxy else None
+    options = {
+        'quality': args.quality,
+        'cookies_browser': args.cookies,
+        'start_time': args.start,
+        'end_time': args.end,
+        'accurate_cuts': args.accurate_cuts,
+        'output_path': args.output,
+        'ignore_archive': args.no_archive,
+        'proxy': cache_proxy.start() if cache_proxy is not None else args.proxy,
+        'log_callback': log,
+    }
+    scheduler = ResourceScheduler(network_slots=args.jobs, bandwidth_limit=bandwidth_limit,
+                                  min_free_bytes=int(min_free))
+    governor = RateGovernor(cookies_browser=args.cookies_from_browser)
+    cookie_cache = CookieJarCache()
+    metrics = None
+    if args.metrics or args.prometheus:
+        metrics = MetricsRecorder(jsonl_path=args.metrics, prometheus_path=args.prometheus)
+
+    def make_downloader():
+        return YouTubeDownloader(ytdlp_path=args.ytdlp, engine=args.engine,
+                                 probe_cache=probe_cache, archive=archive, media_store=media_store,
+                                 governor=governor, planner=planner, transfer=transfer)
+
+    def make_expander(job_options):
+        return PlaylistExpander(
+            ytdlp_path=args.ytdlp or find_ytdlp(),
+            archive=None if job_options.get('ignore_archive') else archive,
+            format_key=job_options.get('quality', 'best'),
+            clip=clip_key(job_options.get('start_time'), job_options.get('end_time')),
+            cookies_browser=job_options.get('cookies_browser'),
+            cookie_cache=cookie_cache
+        )
+
+    queue = None
+    try:
+        if args.dry_run:
+            downloader = make_downloader()
+            plan_options = dict(options, merge=not args.pipeline)
+            failed = 0
+            for url in urls:
+                report = downloader.plan_formats(url, plan_options)
+                failed += not report['success']
+                emit(dict(report, url=url))
+            return EXIT_FAILED if failed else EXIT_OK
+        if args.pipeline:
+            return run_pipeline(args, urls, options, make_downloader, scheduler, governor,
+                                cookie_cache, metrics, make_expander, emit)
+        queue = DownloadQueue(max_workers=args.jobs, downloader_factory=make_downloader,
+                              on_job_update=on_job_update, job_store=job_store, scheduler=scheduler,
+                              governor=governor, cookie_cache=cookie_cache, metrics=metrics,
+                              transfer=transfer)
+        if job_store is not None:
+            resumed = queue.resume({'log_callback': log}, make_expander)
+            log(f"Resuming {len(resumed)} unfinished jobs")
+        for url in urls:
+            if is_collection_url(url):
+                queue.submit_playlist(url, options, make_expander(options))
+            else:
+                queue.submit(url, options)
+        # Short waits keep the main thread responsive to Ctrl+C
+        while not queue.wait(timeout=0.5):
+            pass
+    except KeyboardInterrupt:
+        # No queue yet during --dry-run or before the first job is queued
+        if queue is not None and job_store is not None:
+            queue.suspend()
+        elif queue is not None:
+            queue.shutdown(wait=True, cancel=True)
+        return EXIT_INTERRUPTED
+    finally:
+        if queue is not None:
+            queue.shutdown(wait=False)
+        if probe_cache is not None:
+            probe_cache.close()
+        archive.close()
+        if media_store is not None:
+            media_store.close()
+        if job_store is not None:
+            job_store.close()
+        if metrics is not None:
+            metrics.close()
+        if cache_proxy is not None:
+            log(f"Cache proxy: {json.dumps(cache_proxy.stats())}")
+            cache_proxy.stop()
+
+    stats = queue.stats()
+    log(f"Finished: {json.dumps(stats)}")
+    failed = stats['states'][JobState.FAILED] + stats['states'][JobState.CANCELLED]
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
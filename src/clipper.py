@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Multi-clip extraction
+Cuts many ranges out of one local video in parallel ffmpeg workers
+"""
+
+import bisect
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
+
+try:
+    from .runner import StreamingProcess
+    from .scheduler import ResourceScheduler
+except ImportError:
+    from runner import StreamingProcess
+    from scheduler import ResourceScheduler
+
+
+MODE_AUTO = 'auto'
+MODE_COPY = 'copy'
+MODE_REENCODE = 'reencode'
+
+
+class ClipExtractor:
+    """
+    Cut clips from a source file with ffmpeg
+
+    In 'auto' mode a clip is stream-copied (-c copy, no decoding) when its
+    start lands on a keyframe, and re-encoded otherwise so it starts at the
+    exact time. Clips run in parallel, one ffmpeg process per worker; with
+    a scheduler, re-encodes also take one of its CPU slots, so cuts from
+    several jobs together do not oversubscribe the CPU.
+    """
+
+    def __init__(self, ffmpeg_path: str = 'ffmpeg', ffprobe_path: str = 'ffprobe',
+                 max_workers: Optional[int] = None, keyframe_tolerance: float = 0.05,
+                 scheduler: Optional[ResourceScheduler] = None):
+        self.ffmpeg_path = ffmpeg_path
+        self.ffprobe_path = ffprobe_path
+        self.scheduler = scheduler
+        self.max_workers = (max_workers or (scheduler.cpu_slots if scheduler else os.cpu_count())
+                            or 2)
+        self.keyframe_tolerance = keyframe_tolerance
+        self.is_cancelled = False
+        self._processes: List[StreamingProcess] = []
+        self._lock = threading.Lock()
+
+    def keyframes(self, source: str) -> Optional[List[float]]:
+        """Sorted keyframe timestamps of the first video stream, or None if unknown"""
+        # Packet flags are read from the container, nothing gets decoded
+        if shutil.which(self.ffprobe_path):
+            return self._keyframes_ffprobe(source)
+        return self._keyframes_framecrc(source)
+
+    def _keyframes_ffprobe(self, source: str) -> Optional[List[float]]:
+        """Keyframes from ffprobe's packet listing"""
+        cmd = [
+            self.ffprobe_path, '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            source,
+        ]
+        times = []
+
+        def on_line(line: str):
+            pts, _, flags = line.partition(',')
+            if 'K' in flags:
+                try:
+                    times.append(float(pts))
+                except ValueError:
+                    pass
+
+        process = StreamingProcess(cmd, tail_lines=5)
+        if process.run(on_line) != 0:
+            return None
+        return sorted(times)
+
+    def _keyframes_framecrc(self, source: str) -> Optional[List[float]]:
+        """Keyframes from ffmpeg's framecrc muxer, for installs without ffprobe"""
+        cmd = [
+            self.ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-nostdin',
+            '-i', source, '-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-',
+        ]
+        times = []
+        time_base = [1.0]
+
+        def on_line(line: str):
+            # "#tb 0: 1/12800" then "stream, dts, pts, duration, size, crc[, F=0x..]";
+            # only non-key packets carry the F= flags column
+            if line.startswith('#tb 0:'):
+                num, _, den = line.split(':', 1)[1].strip().partition('/')
+                time_base[0] = int(num) / int(den or 1)
+            elif not line.startswith('#') and 'F=' not in line:
+                fields = [f.strip() for f in line.split(',')]
+                if len(fields) >= 6 and fields[0] == '0':
+                    times.append(int(fields[2]) * time_base[0])
+
+        if not shutil.which(self.ffmpeg_path):
+            return None
+        process = StreamingProcess(cmd, tail_lines=5)
+        if process.run(on_line) != 0:
+            return None
+        return sorted(times)
+
+    def choose_mode(self, start_seconds: float, keyframes: Optional[List[float]]) -> str:
+        """Stream copy when the cut starts on a keyframe, re-encode otherwise"""
+        if start_seconds <= self.keyframe_tolerance:
+            return MODE_COPY
+        if not keyframes:
+            return MODE_REENCODE
+        i = bisect.bisect_left(keyframes, start_seconds)
+        nearest = [keyframes[j] for j in (i - 1, i) if 0 <= j < len(keyframes)]
+        if any(abs(k - start_seconds) <= self.keyframe_tolerance for k in nearest):
+            return MODE_COPY
+        return MODE_REENCODE
+
+    def cut(self, source: str, start: float, end: Optional[float], output: str,
+            mode: str = MODE_COPY) -> Dict[str, Any]:
+        """
+        Cut one clip; start/end are in minutes
+
+        Returns:
+            Dict with 'success', 'filepath', 'mode', 'elapsed', 'size' and
+            optional 'error'
+        """
+        start_seconds = start * 60
+        cmd = [self.ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y',
+               '-ss', f'{start_seconds:.3f}', '-i', source]
+        if end:
+            cmd.extend(['-t', f'{end * 60 - start_seconds:.3f}'])
+        if mode == MODE_COPY:
+            cmd.extend(['-c', 'copy', '-avoid_negative_ts', 'make_zero'])
+        else:
+            cmd.extend(['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20', '-c:a', 'aac'])
+        cmd.extend(['-map', '0:v?', '-map', '0:a?', '-movflags', '+faststart', output])
+
+        started = time.time()
+        process = StreamingProcess(cmd, tail_lines=20)
+        # Stream copies are disk-bound; only re-encodes wait for a CPU slot
+        lease = None
+        if self.scheduler is not None and mode != MODE_COPY:
+            lease = self.scheduler.cpu(lambda: self.is_cancelled)
+        with self._lock:
+            if self.is_cancelled:
+                if lease is not None:
+                    lease.release()
+                return {'success': False, 'filepath': output, 'mode': mode,
+                        'error': 'Cancelled', 'elapsed': 0.0, 'size': 0}
+            self._processes.append(process)
+        try:
+            returncode = process.run(lambda line: None)
+        finally:
+            with self._lock:
+                self._processes.remove(process)
+            if lease is not None:
+                lease.release()
+
+        result = {
+            'success': returncode == 0 and not self.is_cancelled,
+            'filepath': output,
+            'mode': mode,
+            'elapsed': time.time() - started,
+            'size': os.path.getsize(output) if os.path.isfile(output) else 0,
+        }
+        if not result['success']:
+            result['error'] = 'Cancelled' if self.is_cancelled else process.output[-500:]
+        return result
+
+    def extract(self, source: str, clips: List[Tuple[float, Optional[float]]],
+                output_dir: Optional[str] = None, mode: str = MODE_AUTO,
+                log_callback=None) -> List[Dict[str, Any]]:
+        """
+        Cut every (start, end) minute range from `source` in parallel
+
+        Clips are written next to the source (or to `output_dir`) as
+        "<name> [clip N <start>-<end>s].<ext>". Results come back in the same
+        order as `clips`.
+        """
+        log_callback = log_callback or (lambda x: None)
+        self.is_cancelled = False
+        output_dir = output_dir or os.path.dirname(os.path.abspath(source))
+        stem, ext = os.path.splitext(os.path.basename(source))
+
+        keyframes = self.keyframes(source) if mode == MODE_AUTO else None
+        jobs = []
+        for n, (start, end) in enumerate(clips, 1):
+            clip_mode = mode if mode != MODE_AUTO else self.choose_mode(start * 60, keyframes)
+            label = f"{start * 60:g}-{end * 60:g}s" if end else f"{start * 60:g}s-end"
+            output = os.path.join(output_dir, f"{stem} [clip {n} {label}]{ext}")
+            jobs.append((start, end, output, clip_mode))
+
+        log_callback(f"Cutting {len(jobs)} clips with {min(self.max_workers, len(jobs))} workers "
+                     f"({sum(1 for j in jobs if j[3] == MODE_COPY)} stream copy)")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self.cut, source, *job) for job in jobs]
+            results = []
+            for (start, end, _, _), future in zip(jobs, futures):
+                result = future.result()
+                result.update({'start': start, 'end': end})
+                results.append(result)
+        return results
+
+    def cancel(self):
+        """Stop all running ffmpeg workers"""
+        with self._lock:
+            self.is_cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            process.cancel(grace=2.0)
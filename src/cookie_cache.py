@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Cookie jar cache
+Extracts browser cookies once and hands each job a private copy of the jar
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from typing import Optional, Dict, Any, Callable, Tuple
+
+try:
+    from .runner import StreamingProcess
+except ImportError:
+    from runner import StreamingProcess
+
+
+# yt-dlp errors that mean the cookies themselves were refused, so the jar
+# is re-extracted from the browser before the next job uses it
+_AUTH_FAILURE_RE = re.compile(
+    r'cookies are no longer valid|cookies? (?:have|has) expired|account cookies|'
+    r'Sign in to confirm|login required|HTTP Error 401',
+    re.I
+)
+
+_JAR_HEADER = b'# Netscape HTTP Cookie File'
+
+
+def is_auth_failure(text: Optional[str]) -> bool:
+    """Whether yt-dlp error output says the cookies were not accepted"""
+    return bool(text) and _AUTH_FAILURE_RE.search(text) is not None
+
+
+class CookieJarCache:
+    """
+    Browser cookies extracted once and shared by all jobs
+
+    --cookies-from-browser makes every yt-dlp run open, decrypt and parse
+    the browser's cookie database, which is slow and fails while the
+    browser holds a lock on it. Here the first job extracts the cookies
+    into a Netscape jar kept in memory; each job then gets its own copy
+    (yt-dlp writes the jar back when it exits) in a directory only the
+    current user can read, removed again by checkin(). The jar is
+    re-extracted after `ttl` seconds or when a job reports that the
+    cookies were refused. Safe to share between threads.
+    """
+
+    def __init__(self, ttl: float = 1800.0, retry_after: float = 60.0, timeout: float = 120.0):
+        """
+        Args:
+            ttl: Seconds an extracted jar is used before reading the browser again
+            retry_after: Seconds to fall back to --cookies-from-browser after
+                         a failed extraction before trying again
+            timeout: Seconds an extraction may take
+        """
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.timeout = timeout
+        self._jars: Dict[str, Dict[str, Any]] = {}
+        self._failed: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._directory: Optional[str] = None
+        self._finalizer = None
+        self._hits = 0
+        self._extractions = 0
+        self._failures = 0
+        self._refreshes = 0
+        self._invalidations = 0
+        self._extract_seconds = 0.0
+        self._saved_seconds = 0.0
+
+    def checkout(self, browser: str, ytdlp_path: str = 'yt-dlp',
+                 log_callback: Optional[Callable[[str], None]] = None
+                 ) -> Tuple[Optional[str], str, float]:
+        """
+        Private copy of a browser's cookies for one job
+
+        Returns:
+            Tuple of (path of the cookie file, or None if extraction failed
+            and the job should use --cookies-from-browser itself,
+            'hit'/'miss'/'failed', seconds of extraction the job was spared)
+        """
+        log_callback = log_callback or (lambda x: None)
+        with self._lock:
+            lock = self._locks.setdefault(browser, threading.Lock())
+        # One extraction per browser at a time; other jobs wait for its jar
+        with lock:
+            with self._lock:
+                jar = self._jars.get(browser)
+                expired = jar is not None and time.monotonic() - jar['extracted_at'] > self.ttl
+                if jar is not None and not expired:
+                    self._hits += 1
+                    self._saved_seconds += jar['extract_seconds']
+                    status, saved = 'hit', jar['extract_seconds']
+                elif time.monotonic() - self._failed.get(browser, float('-inf')) < self.retry_after:
+                    return None, 'failed', 0.0
+                else:
+                    if expired:
+                        self._refreshes += 1
+                    status, saved = 'miss', 0.0
+            if status == 'miss':
+                log_callback(f"Extracting cookies from {browser.capitalize()}...")
+                jar = self._extract(browser, ytdlp_path, log_callback)
+                if jar is None:
+                    return None, 'failed', 0.0
+            else:
+                log_callback(f"Using cached {browser.capitalize()} cookies")
+        return self._write_copy(jar['data']), status, saved
+
+    def checkin(self, path: Optional[str]):
+        """Delete a job's copy of the jar"""
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def invalidate(self, browser: str):
+        """Forget a browser's jar so the next job extracts it again"""
+        with self._lock:
+            if self._jars.pop(browser, None) is not None:
+                self._invalidations += 1
+
+    def report_failure(self, browser: str, error_text: Optional[str]) -> bool:
+        """Invalidate the jar if a job's error says the cookies were refused"""
+        if not is_auth_failure(error_text):
+            return False
+        self.invalidate(browser)
+        return True
+
+    def close(self):
+        """Remove the directory holding the job copies"""
+        with self._lock:
+            self._jars.clear()
+            finalizer, self._finalizer, self._directory = self._finalizer, None, None
+        if finalizer is not None:
+            finalizer()
+
+    def stats(self) -> Dict[str, Any]:
+        """Extraction counters and the extraction time saved by reusing jars"""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'extractions': self._extractions,
+                'failures': self._failures,
+                'refreshes': self._refreshes,
+                'invalidations': self._invalidations,
+                'extract_seconds': self._extract_seconds,
+                'saved_seconds': self._saved_seconds,
+            }
+
+    def _extract(self, browser: str, ytdlp_path: str,
+                 log_callback: Callable[[str], None]) -> Optional[Dict[str, Any]]:
+        """Have yt-dlp write the browser's cookies to a jar and load it into memory"""
+        path = os.path.join(self._private_dir(), f'extract-{threading.get_ident()}.txt')
+        # Without a URL yt-dlp exits with a usage error after saving the jar
+        cmd = [ytdlp_path, '--ignore-config', '--no-warnings',
+               '--cookies-from-browser', browser, '--cookies', path]
+        started = time.monotonic()
+        process = StreamingProcess(cmd, tail_lines=20)
+        try:
+            process.run(lambda line: None, timeout=self.timeout)
+            with open(path, 'rb') as f:
+                data = f.read()
+        except Exception:
+            data = b''
+        finally:
+            self.checkin(path)
+        elapsed = time.monotonic() - started
+
+        with self._lock:
+            self._extract_seconds += elapsed
+            if not data.startswith(_JAR_HEADER):
+                self._failures += 1
+                self._failed[browser] = time.monotonic()
+                jar = None
+            else:
+                self._extractions += 1
+                self._failed.pop(browser, None)
+                jar = self._jars[browser] = {'data': data, 'extracted_at': time.monotonic(),
+                                             'extract_seconds': elapsed}
+        if jar is None:
+            error = process.error_output.strip().splitlines()
+            log_callback(f"Could not extract {browser.capitalize()} cookies"
+                         f"{': ' + error[0] if error else ''}")
+        else:
+            log_callback(f"Cookies extracted in {elapsed:.1f}s, reused for "
+                         f"{self.ttl / 60:.0f} minutes")
+        return jar
+
+    def _write_copy(self, data: bytes) -> str:
+        """Write a jar readable only by the current user"""
+        fd, path = tempfile.mkstemp(prefix='cookies-', suffix='.txt', dir=self._private_dir())
+        # mkstemp already creates the file with mode 0600
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _private_dir(self) -> str:
+        """Directory for jars, created with mode 0700 and removed on exit"""
+        with self._lock:
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix='ytd-cookies-')
+                self._finalizer = weakref.finalize(self, shutil.rmtree, self._directory, True)
+            return self._directory
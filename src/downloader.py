@@ -4,49 +4,162 @@ YouTube Downloader using yt-dlp
 Handles video download, clip cutting, and cookie management
 """
 
+import glob
 import os
 import subprocess
 import json
+import tempfile
+import time
 from pathlib import Path
 import re
-from typing import Optional, Dict, Any, Callable
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+try:
+    from .archive import DownloadArchive, clip_key
+    from .clipper import MODE_AUTO, ClipExtractor
+    from .cookie_cache import CookieJarCache
+    from .engines import ENGINE_API, ENGINE_SUBPROCESS, ENGINES, YtDlpApiEngine, api_available
+    from .format_planner import FormatPlanner, describe
+    from .governor import RateGovernor
+    from .media_store import MediaStore
+    from .metrics import PhaseClock
+    from .probe_cache import ProbeCache
+    from .progress import (FILEPATH_TEMPLATE, FORMAT_TEMPLATE, PROGRESS_TEMPLATE, SIZE_TEMPLATE,
+                           ProgressTracker, parse_filepath_line, parse_format_line,
+                           parse_progress_line, parse_size_line)
+    from .runner import StreamingProcess
+    from .scheduler import ResourceScheduler
+    from .transfer import TransferTuner
+    from .urls import video_key
+    from .ytdlp_binary import find_ytdlp, missing_features
+except ImportError:
+    from archive import DownloadArchive, clip_key
+    from clipper import MODE_AUTO, ClipExtractor
+    from cookie_cache import CookieJarCache
+    from engines import ENGINE_API, ENGINE_SUBPROCESS, ENGINES, YtDlpApiEngine, api_available
+    from format_planner import FormatPlanner, describe
+    from governor import RateGovernor
+    from media_store import MediaStore
+    from metrics import PhaseClock
+    from probe_cache import ProbeCache
+    from progress import (FILEPATH_TEMPLATE, FORMAT_TEMPLATE, PROGRESS_TEMPLATE, SIZE_TEMPLATE,
+                          ProgressTracker, parse_filepath_line, parse_format_line,
+                          parse_progress_line, parse_size_line)
+    from runner import StreamingProcess
+    from scheduler import ResourceScheduler
+    from transfer import TransferTuner
+    from urls import video_key
+    from ytdlp_binary import find_ytdlp, missing_features
+
+
+# Files yt-dlp reports writing to, e.g. "[download] Destination: video.f137.mp4"
+_DESTINATION_RE = re.compile(
+    r'^\[(?:download|Merger|ExtractAudio|VideoConvertor|VideoRemuxer)\] '
+    r'(?:Destination: |Merging formats into ")(?P<path>.+?)"?$'
+)
+
+# Post-processing steps; from here on yt-dlp is busy with ffmpeg, not the network
+_POSTPROCESS_RE = re.compile(
+    r'^\[(?:Merger|ExtractAudio|VideoConvertor|VideoRemuxer|Fixup\w*|ModifyChapters)\] '
+)
+
+# yt-dlp retrying a request or fragment, e.g. "Retrying (2/3)..." or
+# "Retrying fragment 7 (1/10)..."
+_RETRY_RE = re.compile(r'Retrying (?:fragment \d+ )?\(\d+/\d+\)')
+
+# Per-format intermediate files that only exist until the merge step
+_INTERMEDIATE_RE = re.compile(r'\.f[\w-]+\.\w+$')
 
 
 class YouTubeDownloader:
-    def __init__(self):
+    def __init__(self, ytdlp_path: Optional[str] = None, cancel_grace: float = 5.0,
+                 engine: str = ENGINE_SUBPROCESS, probe_cache: Optional[ProbeCache] = None,
+                 archive: Optional[DownloadArchive] = None,
+                 governor: Optional[RateGovernor] = None,
+                 scheduler: Optional[ResourceScheduler] = None,
+                 cookie_cache: Optional[CookieJarCache] = None,
+                 media_store: Optional[MediaStore] = None,
+                 planner: Optional[FormatPlanner] = None,
+                 transfer: Optional[TransferTuner] = None):
+        """
+        Args:
+            ytdlp_path: yt-dlp executable; found automatically if omitted
+            cancel_grace: Seconds between SIGTERM and SIGKILL on cancel
+            engine: 'subprocess' to spawn the yt-dlp CLI per job, or 'api' to
+                    run yt-dlp in-process (falls back to 'subprocess' if the
+                    yt_dlp module is not importable)
+            probe_cache: Cache of extracted video info; when set, repeat and
+                         retried downloads skip extraction
+            archive: Index of finished downloads; when set, videos already
+                     downloaded with the same quality and clip range are skipped
+            governor: Request pacing and block backoff; share one between
+                      downloaders so a block seen by one job slows all of them
+            scheduler: Bandwidth budget, free disk space check and
+                       network/CPU slots shared with other downloaders
+            cookie_cache: Browser cookies extracted once and reused; share
+                          one between downloaders so only one job reads the
+                          browser's cookie database
+            media_store: Deduplicated store of finished files; when set,
+                         downloads are linked into it and a video it already
+                         holds is linked into the output folder instead of
+                         downloaded again
+            planner: Picks format IDs from the probed format list instead of
+                     leaving the choice to the preset's selector; when set,
+                     every download is probed first
+            transfer: Sizes concurrent fragment downloads (and an optional
+                      aria2c hand-off) per job; share one between
+                      downloaders so running jobs split its connection budget
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+        if engine == ENGINE_API and not api_available():
+            engine = ENGINE_SUBPROCESS
+        self.engine = engine
+        self.probe_cache = probe_cache
+        self.archive = archive
+        self.media_store = media_store
+        self.planner = planner
+        self.transfer = transfer
+        self.governor = governor or RateGovernor()
+        self.scheduler = scheduler
+        self.cookie_cache = cookie_cache or CookieJarCache()
         self.is_cancelled = False
-        self.ytdlp_path = self._find_ytdlp()
+        self.keep_partial = False
+        self.cancel_grace = cancel_grace
+        self._process = None
+        self._clipper = None
+        self._job_cookies: Dict[str, str] = {}
+        self._cookie_stats: Dict[str, Any] = {}
+        self._job_info: Optional[Dict[str, Any]] = None
+        self._planned_format: Optional[str] = None
+        self._clock = PhaseClock()
+        self._retries = 0
+        self._api_engine = YtDlpApiEngine() if engine == ENGINE_API else None
+        # An explicit path lets batch runs and tests point at a stub executable
+        if ytdlp_path or engine == ENGINE_SUBPROCESS:
+            self.ytdlp_path = ytdlp_path or self._find_ytdlp()
+        else:
+            self.ytdlp_path = 'yt-dlp'
         
     def _find_ytdlp(self) -> str:
         """Find yt-dlp executable in system"""
-        # Try to find yt-dlp in common locations or PATH
-        possible_paths = [
-            'yt-dlp',
-            'yt-dlp.exe',
-            os.path.expanduser('~/.local/bin/yt-dlp'),
-            'C:\\Program Files\\yt-dlp\\yt-dlp.exe',
-        ]
-        
-        for path in possible_paths:
-            if self._command_exists(path):
-                return path
-                
-        return 'yt-dlp'  # Default, will rely on PATH
-        
-    @staticmethod
-    def _command_exists(command: str) -> bool:
-        """Check if command exists in system"""
-        try:
-            if command.endswith('.exe'):
-                return os.path.exists(command)
-            result = subprocess.run(['which', command], capture_output=True, timeout=2)
-            return result.returncode == 0
-        except:
-            return False
+        return find_ytdlp()
             
-    def cancel_download(self):
-        """Cancel current download"""
+    def cancel_download(self, keep_partial: bool = False):
+        """
+        Cancel current download, stopping yt-dlp and its ffmpeg children
+        
+        Partial files are deleted unless `keep_partial` is set, in which case
+        a later download of the same link continues from them.
+        """
         self.is_cancelled = True
+        self.keep_partial = keep_partial
+        process = self._process
+        if process is not None:
+            process.cancel(self.cancel_grace)
+        clipper = self._clipper
+        if clipper is not None:
+            clipper.cancel()
         
     def download(self, url: str, options: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -57,24 +170,117 @@ class YouTubeDownloader:
             options: Download options including:
                 - quality: 'best', '1080', '720', 'audio'
                 - cookies_browser: 'chrome', 'firefox', or None
+                - proxy: Proxy URL for every yt-dlp request, e.g. a
+                  cache_proxy.CacheProxy shared by several workers
                 - start_time: Start time in minutes (for clipping)
                 - end_time: End time in minutes (for clipping)
+                - sections: List of (start, end) minute ranges to fetch in one
+                  job, each saved as its own file; end may be None for "to the end"
+                - accurate_cuts: Cut exactly at the given times by re-encoding
+                  around the cut points (--force-keyframes-at-cuts)
                 - output_path: Where to save the video
                 - log_callback: Function to call for logging
+                - progress_callback: Function called with progress event dicts
+                  (status, downloaded_bytes, total_bytes, speed, eta, percent)
+                - ignore_archive: Download even if the archive has the video
+                - verify_archive: How to check archived files (True: exists with
+                  the same size, 'checksum': re-hash, False: trust the index)
+                - postprocess_callback: Called (possibly more than once) when
+                  yt-dlp moves on to merging/post-processing
+                - merge: False to save video and audio as separate files
+                  (title.f<format id>.ext) instead of merging them, so the
+                  merge can run elsewhere (see pipeline.Pipeline)
                 
         Returns:
-            Dict with 'success', 'filepath', and optional 'error'
+            Dict with 'success', 'filepath', and optional 'error', plus
+            'downloaded_bytes', 'elapsed', 'average_speed', 'peak_speed' and
+            'format_ids' (the formats yt-dlp saved)
+            ('probe_cache' is 'hit' or 'miss' when a probe cache is used,
+            'archived' is True when the download was skipped, 'stored' when
+            it was linked from the media store instead, 'deduplicated_bytes'
+            the bytes the media store already held, 'full_size_bytes'
+            is the size of the whole media when yt-dlp knows it, 'blocked' is
+            the block reason if YouTube refused the download, 'strategy' the
+            fallback that got around it, 'backoff_seconds' the time spent
+            waiting on the governor, 'cookie_cache' is 'hit', 'miss' or
+            'failed' when browser cookies are used and
+            'cookie_seconds_saved' the extraction time a cached jar spared,
+            'format_plan' the format IDs and estimated bytes when a planner
+            chose the streams, 'concurrent_fragments' and 'transfer_downloader'
+            what a transfer tuner chose).
+            Every result has 'timings', seconds per phase (backoff,
+            slot_wait, spawn, extract, first_byte, transfer, merge, resolve;
+            summed over fallback attempts) and 'retries', the retries yt-dlp
+            made on its own
         """
+        self._clock = PhaseClock()
+        self._retries = 0
+        result = self._download(url, options)
+        self._clock.stop()
+        result['timings'] = self._clock.timings
+        result['retries'] = self._retries
+        return result
+        
+    def _download(self, url: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        """download() without the timing bookkeeping"""
         self.is_cancelled = False
+        self.keep_partial = False
+        self._job_cookies = {}
+        self._cookie_stats = {}
+        self._job_info = None
+        self._planned_format = None
+        info_file = None
+        cache_status = None
+        plan = None
         
         try:
             quality = options.get('quality', 'best')
             cookies_browser = options.get('cookies_browser')
-            start_time = options.get('start_time')
-            end_time = options.get('end_time')
+            sections = self._get_sections(options)
+            merge = options.get('merge', True)
             output_path = options.get('output_path', str(Path.home() / 'Downloads'))
             log_callback = options.get('log_callback', lambda x: None)
             
+            # Skip videos that are already on disk before any network work
+            if self.media_store is not None and not options.get('ignore_archive'):
+                filepaths = self._stored_files(url, quality, merge, sections, output_path)
+                if filepaths:
+                    for filepath in filepaths:
+                        log_callback(f"Linked from the media store: {filepath}")
+                    result = {
+                        'success': True,
+                        'filepath': filepaths[-1],
+                        'filepaths': filepaths,
+                        'archived': True,
+                        'stored': True,
+                        'downloaded_bytes': 0
+                    }
+                    self._archive_result(url, options, result)
+                    return result
+            if self.archive is not None and not options.get('ignore_archive'):
+                filepaths = self._archived_files(url, quality, sections,
+                                                 options.get('verify_archive', True))
+                if filepaths:
+                    for filepath in filepaths:
+                        log_callback(f"Already downloaded: {filepath}")
+                    return {
+                        'success': True,
+                        'filepath': filepaths[-1],
+                        'filepaths': filepaths,
+                        'archived': True,
+                        'downloaded_bytes': 0
+                    }
+            
+            if self._api_engine is None:
+                # Versions before these options report neither progress nor the saved file
+                required = ['progress_template', 'print_when']
+                if sections:
+                    required.append('download_sections')
+                too_old = missing_features(self.ytdlp_path, *required)
+                if too_old:
+                    log_callback(too_old)
+                    return {'success': False, 'error': too_old}
+            
             # Build yt-dlp command
             cmd = [self.ytdlp_path]
             
@@ -82,90 +288,146 @@ class YouTubeDownloader:
             log_callback("Configuring yt-dlp options...")
             cmd.extend([
                 '--no-warnings',
-                '--progress',
+                # A watch?v=...&list=... link means this one video; collections
+                # go through playlist.PlaylistExpander
+                '--no-playlist',
                 '--socket-timeout', '30',
-                '--retries', '3',
-                '--http-chunks', '10',
-                '-R', 'exponential:10',
-                '--quiet',
+                '--http-chunk-size', '10M',
+                # Resume from .part files left by an interrupted session
+                '--continue',
+                '--newline',
+                '--progress-template', PROGRESS_TEMPLATE,
+                # --print implies --quiet unless quiet mode is switched off explicitly
+                '--no-quiet',
+                '--print', SIZE_TEMPLATE,
+                '--print', FILEPATH_TEMPLATE,
+                '--print', FORMAT_TEMPLATE,
             ])
+            # Fewer, slower retries while the governor is backing off
+            cmd.extend(self.governor.retry_args())
+            if options.get('proxy'):
+                cmd.extend(['--proxy', options['proxy']])
             
-            # Add browser cookie extraction
-            if cookies_browser:
-                log_callback(f"Extracting cookies from {cookies_browser.capitalize()}...")
-                cmd.extend(['--cookies-from-browser', cookies_browser])
+            # Add browser cookies (extracted once, shared between jobs)
+            cmd.extend(self._cookie_args(cookies_browser, log_callback))
                 
             # Add User-Agent to avoid simple blocks
             cmd.extend([
-                '-U', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             ])
             
             # Configure quality format
-            format_string = self._get_format_string(quality)
+            format_string = self._get_format_string(quality, merge)
             log_callback(f"Using quality: {quality}")
             cmd.extend(['-f', format_string])
             
             # Output template
-            output_template = os.path.join(output_path, '%(title)s.%(ext)s')
-            cmd.extend(['-o', output_template])
+            cmd.extend(['-o', self._output_template(output_path, sections, merge)])
             
-            # Add clip cutting if enabled
+            # Add clip cutting if enabled; only the requested ranges are fetched
             clip_info = ""
-            if start_time is not None:
-                log_callback(f"Clip cutting enabled: {start_time}m to {end_time if end_time else 'end'}m")
-                start_seconds = int(start_time * 60)
-                cmd.extend(['--postprocessor-args', f'--cut_start {start_seconds}'])
-                if end_time:
-                    end_seconds = int(end_time * 60)
-                    duration = end_seconds - start_seconds
-                    cmd.extend(['--postprocessor-args', f'--cut_duration {duration}'])
-                clip_info = f" (cut from {start_time}m to {end_time if end_time else 'end'}m)"
+            if sections:
+                ranges = ', '.join(f"{start}m to {end if end else 'end'}m"
+                                   for start, end in sections)
+                log_callback(f"Clip cutting enabled: {ranges}")
+                cmd.extend(self._section_args(sections, options.get('accurate_cuts', False)))
+                clip_info = f" (cut from {ranges})"
                 
             # Add FFmpeg post-processor for merging audio/video
-            cmd.extend(['--merge-output-format', 'mp4'])
+            if merge:
+                cmd.extend(['--merge-output-format', 'mp4'])
             
-            # Add URL
-            cmd.append(url)
+            # Wait for the host's request budget and any running backoff
+            backoff = self.governor.acquire(url, lambda: self.is_cancelled, log_callback)
+            self._clock.add('backoff', backoff)
             
-            log_callback(f"Starting download...{clip_info}")
-            log_callback(f"Command: {' '.join([cmd[0]] + cmd[1:5])}... (additional options)")
-            
-            # Execute download
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=3600  # 1 hour timeout
-            )
+            # Add URL, or the cached info so yt-dlp skips extraction
+            error_msg = None
+            if self.probe_cache is not None or self.planner is not None:
+                self._clock.start('extract')
+                info_file, cache_status, error_msg = self._cached_info_file(url, options)
+            if info_file and self.planner is not None:
+                plan = self.planner.plan(self._job_info, quality, merge, format_string)
+                if plan is not None:
+                    self._planned_format = plan['format']
+                    cmd[cmd.index('-f') + 1] = plan['format']
+                    log_callback(f"Format plan: {describe(plan)}")
+            if info_file:
+                cmd.extend(['--load-info-json', info_file])
+            else:
+                cmd.append(url)
+                
+            if error_msg is None:
+                log_callback(f"Starting download...{clip_info}")
+                log_callback(f"Command: {' '.join([cmd[0]] + cmd[1:5])}... (additional options)")
+                
+                # Execute download
+                returncode, error_msg, stats = self._run_ytdlp(cmd, options)
+            else:
+                returncode, stats = 1, {}
+            self._clock.start('resolve')
+            if cache_status:
+                stats['probe_cache'] = cache_status
+            if plan is not None:
+                stats['format_plan'] = {'format': plan['format'],
+                                        'estimated_bytes': plan['estimated_bytes']}
+            stats['backoff_seconds'] = backoff
+            stats.update(self._cookie_stats)
             
             if self.is_cancelled:
                 return {
                     'success': False,
-                    'error': 'Download cancelled by user'
+                    'error': 'Download cancelled by user',
+                    **stats
                 }
             
-            if result.returncode == 0:
+            block_reason = self.governor.report(url, error_msg if returncode != 0 else None)
+            if (returncode != 0 and self._check_cookies(error_msg, log_callback)
+                    and not block_reason):
+                # Stale cookies, not a block: one more try with a fresh jar
+                result = self._download_with_fallback(url, options, info_file,
+                                                      {'name': 'fresh-cookies'})
+                result['backoff_seconds'] = backoff
+                result.update(self._cookie_stats)
+                self._archive_result(url, options, result)
+                return result
+            if returncode == 0:
                 log_callback("Video download and processing completed!")
                 
-                # Try to find the output file
-                output_file = self._find_downloaded_file(output_path)
+                # yt-dlp printed the final path(s); no need to scan the folder
+                filepaths = stats.get('filepaths') or []
+                if sections:
+                    self._report_section_savings(stats, log_callback)
                 
-                return {
+                result = {
                     'success': True,
-                    'filepath': output_file if output_file else output_path
+                    'filepath': filepaths[-1] if filepaths else output_path,
+                    **stats
                 }
+                self._archive_result(url, options, result)
+                return result
             else:
-                error_msg = result.stderr if result.stderr else result.stdout
                 
                 # Check for specific errors
-                if 'bot' in error_msg.lower() or '403' in error_msg:
-                    log_callback("Bot blocking detected. Trying alternative approach...")
-                    return self._download_with_fallback(url, options)
+                if block_reason:
+                    log_callback(f"Blocked by YouTube ({block_reason}). "
+                                 f"Trying alternative approaches...")
+                    result = self._escalate(url, options, info_file, block_reason)
+                    result['backoff_seconds'] = backoff + result.get('backoff_seconds', 0.0)
+                    result.update(self._cookie_stats)
+                    if not result['success'] and cache_status == 'hit':
+                        # Cached stream URLs may have been rejected; re-extract next time
+                        self.probe_cache.invalidate(video_key(url))
+                    if cache_status:
+                        result['probe_cache'] = cache_status
+                    self._archive_result(url, options, result)
+                    return result
                     
                 log_callback(f"Error output: {error_msg[:500]}")
                 return {
                     'success': False,
-                    'error': f'Download failed: {error_msg[:200]}'
+                    'error': f'Download failed: {error_msg[:200]}',
+                    **self._cookie_stats
                 }
                 
         except subprocess.TimeoutExpired:
@@ -183,43 +445,470 @@ class YouTubeDownloader:
                 'success': False,
                 'error': f'Unexpected error: {str(e)}'
             }
+        finally:
+            if info_file:
+                try:
+                    os.remove(info_file)
+                except OSError:
+                    pass
+            self._release_cookies()
+                    
+    def download_clips(self, url: str, clips: List[Tuple[float, Optional[float]]],
+                       options: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fetch a video once and cut several clips from the local copy
+        
+        Better than 'sections' when the clips cover much of the video or
+        overlap: the source is transferred a single time (or taken from the
+        archive) and the cuts run in parallel ffmpeg workers, stream-copied
+        when they start on a keyframe.
+        
+        Args:
+            url: YouTube URL, or the path of a local video to cut
+            clips: (start, end) minute ranges; end may be None for "to the end"
+            options: Same as download(), plus:
+                - clip_mode: 'auto', 'copy' (fast, snaps to keyframes) or
+                  'reencode' (exact, slower)
+                - clip_workers: Parallel ffmpeg processes (default: CPU count)
                 
-    def _download_with_fallback(self, url: str, options: Dict[str, Any]) -> Dict[str, Any]:
-        """Fallback download method with additional anti-bot measures"""
+        Returns:
+            Dict with 'success', 'source', 'filepaths', 'clips' (one result
+            dict per range with 'filepath', 'mode', 'elapsed', 'size'),
+            'timings' (the download's phases plus 'cut') and optional 'error'
+        """
+        quality = options.get('quality', 'best')
+        output_path = options.get('output_path', str(Path.home() / 'Downloads'))
+        log_callback = options.get('log_callback', lambda x: None)
+        clips = [(float(start), float(end) if end else None) for start, end in clips]
+        timings = {}
+        
+        if os.path.isfile(url):
+            source = url
+        else:
+            if self.archive is not None and not options.get('ignore_archive'):
+                filepaths = self._archived_files(url, quality, clips,
+                                                 options.get('verify_archive', True))
+                if filepaths:
+                    for filepath in filepaths:
+                        log_callback(f"Already downloaded: {filepath}")
+                    return {'success': True, 'source': None, 'filepath': filepaths[0],
+                            'filepaths': filepaths, 'clips': [], 'archived': True}
+                    
+            # Full-video download; the archive turns a repeat into a no-op
+            full_options = {k: v for k, v in options.items()
+                            if k not in ('sections', 'start_time', 'end_time', 'ignore_archive')}
+            result = self.download(url, full_options)
+            timings = dict(result['timings'])
+            if not result.get('success'):
+                return {'success': False, 'source': None, 'filepaths': [], 'clips': [],
+                        'timings': timings, 'error': result.get('error', 'Download failed')}
+            source = result['filepath']
+            
+        self._clipper = ClipExtractor(max_workers=options.get('clip_workers'),
+                                      scheduler=self.scheduler)
+        started = time.monotonic()
+        try:
+            results = self._clipper.extract(source, clips, output_path,
+                                            options.get('clip_mode', MODE_AUTO), log_callback)
+        finally:
+            self._clipper = None
+        timings['cut'] = time.monotonic() - started
+            
+        failed = [r for r in results if not r['success']]
+        filepaths = [r['filepath'] for r in results if r['success']]
+        for r in results:
+            if r['success']:
+                log_callback(f"Clip saved ({r['mode']}, {r['elapsed']:.1f}s): {r['filepath']}")
+                if self.archive is not None and not os.path.isfile(url):
+                    try:
+                        self.archive.record(url, r['filepath'], quality,
+                                            clip_key(r['start'], r['end']))
+                    except OSError:
+                        pass
+                        
+        response = {
+            'success': not failed,
+            'source': source,
+            'filepath': filepaths[0] if filepaths else None,
+            'filepaths': filepaths,
+            'clips': results,
+            'timings': timings,
+        }
+        if failed:
+            response['error'] = (f"{len(failed)} of {len(results)} clips failed: "
+                                 f"{failed[0].get('error', '')}")
+        return response
+        
+    def _archived_files(self, url: str, quality: str, sections: List[Tuple[float, Optional[float]]],
+                        verify) -> Optional[List[str]]:
+        """Archived paths for every requested section (or the full video), else None"""
+        filepaths = []
+        for start, end in sections or [(None, None)]:
+            entry = self.archive.lookup(url, quality, clip_key(start, end), verify=verify)
+            if entry is None:
+                return None
+            filepaths.append(entry['filepath'])
+        return filepaths
+        
+    def _stored_files(self, url: str, quality: str, merge: bool,
+                      sections: List[Tuple[float, Optional[float]]],
+                      output_path: str) -> Optional[List[str]]:
+        """Links in output_path to stored copies of every requested section, else None"""
+        planned = self._planned_format_ids(url, quality, merge)
+        filepaths = []
+        try:
+            for start, end in sections or [(None, None)]:
+                clip = clip_key(start, end)
+                format_ids = planned or self.media_store.formats_for(url, quality, clip)
+                if not format_ids:
+                    return None
+                filepath = self.media_store.materialize(url, output_path, format_ids, clip)
+                if filepath is None:
+                    return None
+                filepaths.append(filepath)
+        except OSError:
+            return None
+        return filepaths
+        
+    def _planned_format_ids(self, url: str, quality: str, merge: bool) -> Optional[List[str]]:
+        """Formats the planner would pick from cached info, without extracting"""
+        if self.planner is None or self.probe_cache is None:
+            return None
+        info = self.probe_cache.get(video_key(url))
+        if info is None:
+            return None
+        plan = self.planner.plan(info, quality, merge, self._get_format_string(quality, merge))
+        if plan is None:
+            return None
+        return [plan[role]['format_id'] for role in ('video', 'audio', 'combined') if role in plan]
+        
+    def _archive_result(self, url: str, options: Dict[str, Any], result: Dict[str, Any]):
+        """Record a successful download in the media store and the archive"""
+        if (self.archive is None and self.media_store is None) or not result.get('success'):
+            return
+        sections = self._get_sections(options) or [(None, None)]
+        filepaths = result.get('filepaths') or []
+        if len(filepaths) != len(sections):
+            # yt-dlp prints one path per section in order; anything else is ambiguous
+            return
+        try:
+            for (start, end), filepath in zip(sections, filepaths):
+                if not os.path.isfile(filepath):
+                    continue
+                checksum = None
+                # Without the format IDs the file cannot be keyed in the store
+                if (self.media_store is not None and not result.get('stored')
+                        and result.get('format_ids')):
+                    stored = self.media_store.adopt(url, filepath, result['format_ids'],
+                                                    clip_key(start, end),
+                                                    options.get('quality', 'best'))
+                    checksum = stored['hash']
+                    if stored['deduplicated']:
+                        result['deduplicated_bytes'] = (result.get('deduplicated_bytes', 0)
+                                                        + stored['size'])
+                if self.archive is not None:
+                    self.archive.record(url, filepath, options.get('quality', 'best'),
+                                        clip_key(start, end), checksum=checksum)
+        except OSError:
+            pass
+            
+    @staticmethod
+    def _get_sections(options: Dict[str, Any]) -> List[Tuple[float, Optional[float]]]:
+        """Requested clip ranges in minutes, from 'sections' or start_time/end_time"""
+        sections = options.get('sections')
+        if sections:
+            return [(float(start), float(end) if end else None) for start, end in sections]
+        if options.get('start_time') is not None:
+            end_time = options.get('end_time')
+            return [(float(options['start_time']), float(end_time) if end_time else None)]
+        return []
+        
+    def _cookie_args(self, browser: Optional[str],
+                     log_callback: Callable[[str], None]) -> List[str]:
+        """
+        yt-dlp options for a browser's cookies
+        
+        The job's copy of the cached jar is passed with --cookies and reused
+        by the probe and fallbacks of the same download; if the cache could
+        not extract the cookies, yt-dlp reads the browser itself.
+        """
+        if not browser:
+            return []
+        path = self._job_cookies.get(browser)
+        if path is None:
+            path, status, saved = self.cookie_cache.checkout(browser, self.ytdlp_path, log_callback)
+            self._cookie_stats.setdefault('cookie_cache', status)
+            self._cookie_stats['cookie_seconds_saved'] = (
+                self._cookie_stats.get('cookie_seconds_saved', 0.0) + saved)
+            if path is None:
+                return ['--cookies-from-browser', browser]
+            self._job_cookies[browser] = path
+        return ['--cookies', path]
+        
+    def _check_cookies(self, error_msg: str, log_callback: Callable[[str], None]) -> bool:
+        """
+        Drop cookies the site refused so the next attempt extracts fresh ones
+        
+        Returns:
+            True if any cookies were dropped
+        """
+        refused = False
+        for browser in list(self._job_cookies):
+            if self.cookie_cache.report_failure(browser, error_msg):
+                log_callback(f"{browser.capitalize()} cookies were refused; extracting them again")
+                self.cookie_cache.checkin(self._job_cookies.pop(browser))
+                refused = True
+        return refused
+                
+    def _release_cookies(self):
+        """Delete this download's copies of the cookie jars"""
+        for path in self._job_cookies.values():
+            self.cookie_cache.checkin(path)
+        self._job_cookies = {}
+        
+    @staticmethod
+    def _section_args(sections: List[Tuple[float, Optional[float]]],
+                      accurate_cuts: bool) -> List[str]:
+        """--download-sections arguments so only the requested ranges are fetched"""
+        args = []
+        for start, end in sections:
+            start_seconds = f'{start * 60:g}'
+            end_seconds = f'{end * 60:g}' if end else 'inf'
+            args.extend(['--download-sections', f'*{start_seconds}-{end_seconds}'])
+        if accurate_cuts:
+            args.append('--force-keyframes-at-cuts')
+        return args
+        
+    @staticmethod
+    def _output_template(output_path: str, sections: List[Tuple[float, Optional[float]]],
+                         merge: bool = True) -> str:
+        """Output template; several sections of one video need distinct names"""
+        # Unmerged video and audio may share an extension, so keep the format id
+        ext = '%(ext)s' if merge else 'f%(format_id)s.%(ext)s'
+        if len(sections) > 1:
+            # section_end is NA for open-ended ranges, so name clips by their start
+            return os.path.join(output_path, '%(title)s [%(section_start)ds].' + ext)
+        return os.path.join(output_path, '%(title)s.' + ext)
+        
+    @staticmethod
+    def _report_section_savings(stats: Dict[str, Any], log_callback: Callable[[str], None]):
+        """Compare bytes fetched for the clips against the full media size"""
+        transferred = stats.get('downloaded_bytes') or 0
+        if not transferred:
+            # ffmpeg section downloads may not report progress; use the result size
+            transferred = sum(os.path.getsize(p) for p in stats.get('filepaths', [])
+                              if os.path.isfile(p))
+            stats['downloaded_bytes'] = transferred
+        full_size = stats.get('full_size_bytes')
+        if full_size:
+            saved = max(0.0, 100.0 * (1 - transferred / full_size))
+            log_callback(f"Transferred {transferred / 1048576:.1f} MiB of "
+                         f"{full_size / 1048576:.1f} MiB full file ({saved:.0f}% saved)")
+            
+    def _cached_info_file(self, url: str,
+                          options: Dict[str, Any]) -> Tuple[Optional[str], str, Optional[str]]:
+        """
+        Get extracted info for a URL from the probe cache, probing on a miss
+        
+        The info is also kept in self._job_info for the format planner.
+        
+        Returns:
+            Tuple of (path of a temporary .info.json or None, 'hit'/'miss'
+            or None without a probe cache, error text if extraction failed)
+        """
+        log_callback = options.get('log_callback', lambda x: None)
+        key = video_key(url)
+        info = self.probe_cache.get(key) if self.probe_cache is not None else None
+        status = 'hit' if self.probe_cache is not None else None
+        if info is not None:
+            log_callback("Using cached video info (skipping extraction)")
+        else:
+            status = 'miss' if self.probe_cache is not None else None
+            log_callback("Extracting video info...")
+            info, error_msg = self._probe(url, options)
+            if info is None:
+                return None, status, error_msg
+            if self.probe_cache is not None:
+                self.probe_cache.put(key, info)
+        self._job_info = info
+            
+        fd, info_file = tempfile.mkstemp(prefix='ytd-', suffix='.info.json')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        return info_file, status, None
+        
+    def plan_formats(self, url: str, options: Dict[str, Any],
+                     info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Report the streams a download would fetch, without downloading
+        
+        Uses the downloader's planner (or a default FormatPlanner) on the
+        probed format list, or on `info` when given (a saved -J output).
+        
+        Returns:
+            Dict with 'success', 'plan' (see FormatPlanner.plan), 'title'
+            and optional 'error'
+        """
+        quality = options.get('quality', 'best')
+        merge = options.get('merge', True)
+        if info is None:
+            key = video_key(url)
+            info = self.probe_cache.get(key) if self.probe_cache is not None else None
+            if info is None:
+                info, error_msg = self._probe(url, options)
+                if info is None:
+                    return {'success': False, 'error': f'Extraction failed: {error_msg[:200]}'}
+                if self.probe_cache is not None:
+                    self.probe_cache.put(key, info)
+        planner = self.planner or FormatPlanner()
+        plan = planner.plan(info, quality, merge, self._get_format_string(quality, merge))
+        if plan is None:
+            return {'success': False, 'title': info.get('title'), 'error': 'No usable formats'}
+        return {'success': True, 'title': info.get('title'), 'plan': plan}
+        
+    def _probe(self, url: str, options: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Run extraction only; returns (info dict or None, error text)"""
+        cmd = [
+            self.ytdlp_path,
+            '--dump-single-json',
+            '--no-warnings',
+            '--no-playlist',
+            '--socket-timeout', '30',
+            '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        ]
+        if options.get('proxy'):
+            cmd.extend(['--proxy', options['proxy']])
+        cmd.extend(self._cookie_args(options.get('cookies_browser'),
+                                     options.get('log_callback', lambda x: None)))
+        cmd.append(url)
+        
+        if self._api_engine is not None:
+            try:
+                return self._api_engine.extract_info(cmd[1:]), ''
+            except Exception as e:
+                return None, str(e)
+                
+        lines = []
+        process = StreamingProcess(cmd)
+        self._process = process
+        try:
+            returncode = process.run(
+                lambda line: lines.append(line) if line.startswith('{') else None,
+                timeout=300
+            )
+        finally:
+            self._process = None
+        if returncode != 0 or not lines:
+            return None, process.error_output
+        try:
+            return json.loads(lines[-1]), ''
+        except ValueError as e:
+            return None, f'Invalid info JSON: {e}'
+            
+    def _escalate(self, url: str, options: Dict[str, Any], info_file: Optional[str],
+                  block_reason: str) -> Dict[str, Any]:
+        """
+        Climb the governor's fallback ladder after a block
+        
+        Each rung waits for the governor first, so a blocked job never
+        retries straight away. Stops at the first success, on cancel, or
+        when a rung fails for a reason other than a block.
+        """
+        log_callback = options.get('log_callback', lambda x: None)
+        result = {'success': False, 'blocked': block_reason,
+                  'error': f'Download blocked by YouTube ({block_reason})'}
+        backoff = 0.0
+        for strategy in self.governor.strategies(options):
+            waited = self.governor.acquire(url, lambda: self.is_cancelled, log_callback)
+            self._clock.add('backoff', waited)
+            backoff += waited
+            if self.is_cancelled:
+                return {'success': False, 'error': 'Download cancelled by user',
+                        'backoff_seconds': backoff}
+            result = self._download_with_fallback(
+                url, options, info_file if strategy.get('reuse_info') else None, strategy)
+            self.governor.record_rung(strategy['name'], result['success'])
+            if result['success'] or self.is_cancelled or not result.get('blocked'):
+                break
+        result['backoff_seconds'] = backoff
+        if not result['success'] and not self.is_cancelled:
+            # The job reports the block that started the escalation
+            result.setdefault('blocked', block_reason)
+        return result
+        
+    def _download_with_fallback(self, url: str, options: Dict[str, Any],
+                                info_file: Optional[str] = None,
+                                strategy: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fallback download using one strategy from the governor's ladder"""
+        strategy = strategy or self.governor.ladder[-1]
         try:
             output_path = options.get('output_path', str(Path.home() / 'Downloads'))
             log_callback = options.get('log_callback', lambda x: None)
+            sections = self._get_sections(options)
+            merge = options.get('merge', True)
             
-            log_callback("Using fallback with additional anti-bot measures...")
+            log_callback(f"Using fallback: {strategy['name']}...")
             
             cmd = [
                 self.ytdlp_path,
                 '--no-warnings',
-                '-f', 'best',
-                '--extractor-args', 'youtube:lang=en',
-                '--socket-timeout', '60',
-                '-U', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0',
-                '--http-chunks', '10',
-                '--fragment-retries', '5',
-                '--skip-unavailable-fragments',
-                '-o', os.path.join(output_path, '%(title)s.%(ext)s'),
-                '--merge-output-format', 'mp4',
-                url
+                '--no-playlist',
+                '--newline',
+                '--progress-template', PROGRESS_TEMPLATE,
+                '--no-quiet',
+                '--print', FILEPATH_TEMPLATE,
+                '--print', FORMAT_TEMPLATE,
+                '-f', (strategy.get('format') or self._planned_format
+                       or self._get_format_string(options.get('quality', 'best'), merge)),
+                '--socket-timeout', '30',
+                '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                '--http-chunk-size', '10M',
+                '--continue',
+                '-o', self._output_template(output_path, sections, merge),
             ]
+            if merge:
+                cmd.extend(['--merge-output-format', 'mp4'])
+            cmd.extend(self.governor.retry_args())
+            if options.get('proxy'):
+                cmd.extend(['--proxy', options['proxy']])
+            cookies_browser = strategy.get('cookies_browser') or options.get('cookies_browser')
+            cmd.extend(self._cookie_args(cookies_browser, log_callback))
+            # Later options override the defaults above
+            cmd.extend(strategy.get('args', []))
+            if sections:
+                cmd.extend(self._section_args(sections, options.get('accurate_cuts', False)))
+            cmd.extend(['--load-info-json', info_file] if info_file else [url])
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=3600)
+            returncode, error_msg, stats = self._run_ytdlp(cmd, options)
+            self._clock.start('resolve')
             
-            if result.returncode == 0:
-                log_callback("Fallback download successful!")
-                output_file = self._find_downloaded_file(output_path)
+            if self.is_cancelled:
+                return {
+                    'success': False,
+                    'error': 'Download cancelled by user',
+                    **stats
+                }
+            
+            block_reason = self.governor.report(url, error_msg if returncode != 0 else None)
+            if returncode != 0:
+                self._check_cookies(error_msg, log_callback)
+            if returncode == 0:
+                log_callback(f"Fallback download successful ({strategy['name']})!")
+                filepaths = stats.get('filepaths') or []
+                if sections:
+                    self._report_section_savings(stats, log_callback)
                 return {
                     'success': True,
-                    'filepath': output_file if output_file else output_path
+                    'filepath': filepaths[-1] if filepaths else output_path,
+                    'strategy': strategy['name'],
+                    **stats
                 }
             else:
                 return {
                     'success': False,
-                    'error': 'Download failed even with fallback method'
+                    'blocked': block_reason,
+                    'error': (f"Download failed even with fallback {strategy['name']}: "
+                              f"{error_msg[:200]}")
                 }
                 
         except Exception as e:
@@ -228,8 +917,185 @@ class YouTubeDownloader:
                 'error': f'Fallback failed: {str(e)}'
             }
             
+    def _run_ytdlp(self, cmd: List[str],
+                   options: Dict[str, Any]) -> Tuple[int, str, Dict[str, Any]]:
+        """
+        Run yt-dlp, streaming its output
+        
+        Progress lines are parsed into events for `progress_callback`, all
+        other lines go to `log_callback`. If the download gets cancelled,
+        partial files are removed (unless kept for resuming) and the stats
+        report what was reclaimed. With a scheduler, the download first
+        waits for a network slot and runs at its bandwidth share; once
+        yt-dlp starts merging it moves over to a CPU slot. The output also
+        drives the phase clock: spawn until the first line, extract until
+        the download starts, first_byte until data arrives, then transfer
+        and merge.
+        
+        Returns:
+            Tuple of (return code, error text, stats); stats hold the
+            throughput numbers, 'filepaths', the final paths yt-dlp printed,
+            and 'format_ids', the formats in them
+        """
+        log_callback = options.get('log_callback', lambda x: None)
+        progress_callback = options.get('progress_callback')
+        tracker = ProgressTracker()
+        destinations = []
+        filepaths = []
+        format_ids = []
+        full_sizes = []
+        leases = []
+        
+        if self.scheduler is not None:
+            self._clock.start('slot_wait')
+            lease = self.scheduler.network(options.get('output_path'), self._api_engine is not None,
+                                           lambda: self.is_cancelled, log_callback)
+            if lease is None:
+                return 1, '', {'filepaths': []}
+            leases.append(lease)
+            if lease.rate and self._api_engine is None:
+                cmd = cmd[:1] + ['--limit-rate', str(int(lease.rate))] + cmd[1:]
+        transfer = None
+        if self.transfer is not None:
+            # Before any strategy args in cmd, so a fallback rung can override it
+            transfer = self.transfer.begin(leases[0].rate if leases else None)
+            if '--http-chunk-size' in cmd:
+                # The built-in 10M would come later and win
+                cmd = list(cmd)
+                cmd[cmd.index('--http-chunk-size') + 1] = str(transfer['chunk_size'])
+            cmd = cmd[:1] + transfer['args'] + cmd[1:]
+            transfer_before = self._clock.timings.get('transfer', 0.0)
+                
+        def on_event(event: Dict[str, Any]):
+            tracker.update(event)
+            self._clock.advance('transfer' if event.get('downloaded_bytes') else 'first_byte')
+            if progress_callback:
+                progress_callback(event)
+                
+        def on_line(line: str):
+            self._clock.advance('extract')
+            event = parse_progress_line(line)
+            if event is not None:
+                on_event(event)
+                return
+            filepath = parse_filepath_line(line)
+            if filepath is not None:
+                filepaths.append(filepath)
+                return
+            ids = parse_format_line(line)
+            if ids is not None:
+                format_ids.extend(ids)
+                return
+            size = parse_size_line(line)
+            if size is not None:
+                if size:
+                    full_sizes.append(size)
+                return
+            line = line.strip()
+            if line:
+                match = _DESTINATION_RE.match(line)
+                if match:
+                    destinations.append(match.group('path'))
+                    self._clock.advance('first_byte')
+                if _RETRY_RE.search(line):
+                    self._retries += 1
+                if _POSTPROCESS_RE.match(line):
+                    self._clock.advance('merge')
+                    options.get('postprocess_callback', lambda: None)()
+                    if leases and leases[0].kind == 'network':
+                        # Free the download slot for the next job while ffmpeg runs
+                        leases[0].release()
+                        leases[0] = self.scheduler.cpu(block=False)
+                log_callback(line)
+                
+        self._clock.start('spawn')
+        try:
+            if self._api_engine is not None:
+                process = self._api_engine.prepare(cmd[1:], on_event)
+                if leases:
+                    leases[0].bind(process.set_rate_limit)
+            else:
+                process = StreamingProcess(cmd)
+            self._process = process
+            if self.is_cancelled:
+                process.cancelled = True
+            try:
+                returncode = process.run(on_line, timeout=3600)  # 1 hour timeout
+            finally:
+                self._process = None
+        finally:
+            for lease in leases:
+                lease.release()
+            self._clock.stop()
+            if transfer is not None:
+                # Only the transfer phase; spawn, extraction and merging do not depend on -N
+                self.transfer.finish(transfer, tracker.downloaded_bytes,
+                                     self._clock.timings.get('transfer', 0.0) - transfer_before)
+            
+        stats = tracker.summary()
+        stats['filepaths'] = filepaths
+        stats['format_ids'] = list(dict.fromkeys(format_ids))
+        if transfer is not None:
+            stats['concurrent_fragments'] = transfer['fragments']
+            stats['transfer_downloader'] = transfer['downloader']
+        if full_sizes:
+            # Every section reports the same whole-media size
+            stats['full_size_bytes'] = full_sizes[0]
+        if self.is_cancelled and self.keep_partial:
+            log_callback("Paused: partial files kept so the download can resume")
+        elif self.is_cancelled:
+            stats.update(self._reclaim_cancelled(destinations, tracker, log_callback))
+        return returncode, process.error_output, stats
+        
+    def _reclaim_cancelled(self, destinations: List[str], tracker: ProgressTracker,
+                           log_callback: Callable[[str], None]) -> Dict[str, Any]:
+        """Clean up after a cancelled download and report what was saved"""
+        freed = self._cleanup_partial_files(destinations)
+        last = tracker.last_event or {}
+        total = last.get('total_bytes') or 0
+        done = last.get('downloaded_bytes') or 0
+        skipped_bytes = max(0, total - done)
+        skipped_seconds = last.get('eta') or 0.0
+        
+        log_callback(f"Cancelled: removed {freed / 1048576:.1f} MiB of partial files, "
+                     f"skipped ~{skipped_bytes / 1048576:.1f} MiB "
+                     f"(~{skipped_seconds:.0f}s) of remaining transfer")
+        return {
+            'reclaimed_disk_bytes': freed,
+            'skipped_bytes': skipped_bytes,
+            'skipped_seconds': skipped_seconds,
+        }
+        
     @staticmethod
-    def _get_format_string(quality: str) -> str:
+    def _cleanup_partial_files(destinations: List[str]) -> int:
+        """Delete .part/.ytdl fragments and intermediate files; returns bytes freed"""
+        candidates = set()
+        for dest in destinations:
+            escaped = glob.escape(dest)
+            candidates.update(glob.glob(escaped + '.part*'))
+            candidates.update(glob.glob(escaped + '.ytdl'))
+            root, ext = os.path.splitext(dest)
+            candidates.update(glob.glob(glob.escape(root) + '.temp' + ext))
+            if _INTERMEDIATE_RE.search(dest):
+                candidates.add(dest)
+                
+        freed = 0
+        for path in candidates:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+        return freed
+        
+    def close(self):
+        """Release resources held by the in-process engine"""
+        if self._api_engine is not None:
+            self._api_engine.close()
+            
+    @staticmethod
+    def _get_format_string(quality: str, merge: bool = True) -> str:
         """Generate yt-dlp format string based on quality preference"""
         quality_formats = {
             'best': 'bv*+ba/b',  # Best video + best audio or best overall
@@ -237,21 +1103,12 @@ class YouTubeDownloader:
             '720': 'bestvideo[height<=720]+bestaudio/best[height<=720]',
             'audio': 'bestaudio[ext=m4a]/bestaudio',
         }
-        return quality_formats.get(quality, 'bv*+ba/b')
-        
-    @staticmethod
-    def _find_downloaded_file(output_path: str) -> Optional[str]:
-        """Find the most recently downloaded file"""
-        try:
-            files = []
-            for ext in ['*.mp4', '*.mkv', '*.webm', '*.m4a', '*.mp3']:
-                files.extend(Path(output_path).glob(ext))
-                
-            if files:
-                # Return most recently modified file
-                latest_file = max(files, key=lambda p: p.stat().st_mtime)
-                return str(latest_file)
-        except Exception:
-            pass
-            
-        return None
+        if not merge:
+            # ',' downloads each selection as its own file; both fall back to
+            # the same combined format when there are no separate streams
+            quality_formats.update({
+                'best': 'bv/b,ba/b',
+                '1080': 'bestvideo[height<=1080]/best[height<=1080],bestaudio/best[height<=1080]',
+                '720': 'bestvideo[height<=720]/best[height<=720],bestaudio/best[height<=720]',
+            })
+        return quality_formats.get(quality, quality_formats['best'])
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Download engines
+Runs yt-dlp in-process through the YoutubeDL Python API instead of spawning the CLI
+"""
+
+import importlib.util
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+try:
+    from .progress import FILEPATH_MARKER, FORMAT_MARKER, SIZE_MARKER, info_full_size, make_event
+except ImportError:
+    from progress import FILEPATH_MARKER, FORMAT_MARKER, SIZE_MARKER, info_full_size, make_event
+
+
+ENGINE_SUBPROCESS = 'subprocess'
+ENGINE_API = 'api'
+ENGINES = (ENGINE_SUBPROCESS, ENGINE_API)
+
+# Options whose values are applied to each run rather than the cached YoutubeDL
+PER_RUN_OPTIONS = ('--load-info-json', '--concurrent-fragments', '--cookies', '--limit-rate')
+
+
+def api_available() -> bool:
+    """Check whether the yt_dlp module is installed"""
+    return importlib.util.find_spec('yt_dlp') is not None
+
+
+class _HookLogger:
+    """yt-dlp logger that forwards messages to the current job"""
+
+    def __init__(self):
+        self.on_line: Callable[[str], None] = lambda line: None
+
+    def debug(self, msg):
+        # yt-dlp sends regular screen output through debug()
+        if not msg.startswith('[debug] '):
+            self.on_line(msg)
+
+    def info(self, msg):
+        self.on_line(msg)
+
+    def warning(self, msg):
+        self.on_line(f'WARNING: {msg}')
+
+    def error(self, msg):
+        self.on_line(msg if msg.startswith('ERROR') else f'ERROR: {msg}')
+
+
+class _Session:
+    """One YoutubeDL instance plus the hooks that route its events to a job"""
+
+    def __init__(self, ydl_opts: Dict[str, Any]):
+        import yt_dlp
+
+        self.logger = _HookLogger()
+        self.on_hook: Callable[[Dict[str, Any]], None] = lambda d: None
+        self.on_filepath: Callable[[str], None] = lambda path: None
+        params = dict(ydl_opts)
+        params['logger'] = self.logger
+        # Progress and final paths are reported through hooks; --print
+        # templates would go straight to stdout, bypassing the logger
+        params['noprogress'] = True
+        params.pop('forceprint', None)
+        params['progress_hooks'] = [lambda d: self.on_hook(d)]
+        params['postprocessor_hooks'] = [lambda d: self.on_hook(d)]
+        params['post_hooks'] = [lambda path: self.on_filepath(path)]
+        # Cookie files and speed limits differ per job, so they are applied
+        # to each run (use_cookies, set_rate_limit) instead of the session
+        params.pop('cookiefile', None)
+        params.pop('ratelimit', None)
+        self.cookiefile: Optional[str] = None
+        self.ydl = yt_dlp.YoutubeDL(params)
+
+    def use_cookies(self, path: Optional[str]):
+        """Swap the job's cookie file into the jar the HTTP handlers share"""
+        if path is None and self.cookiefile is None:
+            # Keep what the site set during earlier cookie-less jobs
+            return
+        jar = self.ydl.cookiejar
+        jar.clear()
+        if path and os.access(path, os.R_OK):
+            jar.load(path)
+        self.cookiefile = path
+
+    def close(self):
+        """Release the HTTP session and cookie jar"""
+        try:
+            self.ydl.close()
+        except Exception:
+            pass
+
+
+class InProcessRun:
+    """
+    A single download driven through YoutubeDL
+
+    Mirrors the StreamingProcess interface (run/cancel/error_output) so
+    YouTubeDownloader can treat both engines the same way.
+    """
+
+    def __init__(self, session: _Session, urls: List[str],
+                 on_event: Callable[[Dict[str, Any]], None], tail_lines: int = 50):
+        self.session = session
+        self.urls = urls
+        self.on_event = on_event
+        self.tail = deque(maxlen=tail_lines)
+        self.info_file: Optional[str] = None
+        self.on_line: Callable[[str], None] = lambda line: None
+        self.size_reported = False
+        self.cancelled = False
+        self.timed_out = False
+        self._deadline: Optional[float] = None
+
+    def run(self, on_line: Callable[[str], None], timeout: Optional[float] = None) -> int:
+        """
+        Download in the calling thread and return yt-dlp's exit code
+
+        Raises:
+            subprocess.TimeoutExpired: if the download ran longer than `timeout`
+        """
+        from yt_dlp.utils import DownloadCancelled, DownloadError
+
+        def log_line(line: str):
+            self.tail.append(line)
+            on_line(line)
+
+        self.on_line = on_line
+        self.session.logger.on_line = log_line
+        self.session.on_hook = self._hook
+        # Report final paths the same way the CLI does with FILEPATH_TEMPLATE
+        self.session.on_filepath = lambda path: on_line(f'{FILEPATH_MARKER} {path}')
+        self._deadline = time.time() + timeout if timeout else None
+        try:
+            if self.cancelled:
+                return 1
+            # download() returns this and only ever sets it, so a session
+            # that had one failed job would report every later job as failed
+            self.session.ydl._download_retcode = 0
+            if self.info_file:
+                returncode = self.session.ydl.download_with_info_file(self.info_file)
+            else:
+                returncode = self.session.ydl.download(self.urls)
+        except DownloadCancelled:
+            returncode = 1
+        except DownloadError:
+            # The error message already went through the logger
+            returncode = 1
+        finally:
+            self.session.logger.on_line = lambda line: None
+            self.session.on_hook = lambda d: None
+            self.session.on_filepath = lambda path: None
+
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.urls, timeout)
+        return returncode
+
+    def _hook(self, d: Dict[str, Any]):
+        """Progress/postprocessor hook; raising here aborts the download"""
+        from yt_dlp.utils import DownloadCancelled
+
+        if self._deadline and time.time() > self._deadline:
+            self.timed_out = True
+        if self.cancelled or self.timed_out:
+            raise DownloadCancelled()
+
+        if 'postprocessor' in d:
+            return
+        if not self.size_reported and d.get('info_dict'):
+            # Same report the CLI produces with SIZE_TEMPLATE
+            self.size_reported = True
+            size = info_full_size(d['info_dict'])
+            if size:
+                self.on_line(f'{SIZE_MARKER} {size}')
+        if d.get('status') == 'finished' and (d.get('info_dict') or {}).get('format_id'):
+            # What FORMAT_TEMPLATE reports; merged downloads report each part
+            self.on_line(f"{FORMAT_MARKER} {d['info_dict']['format_id']}")
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        self.on_event(make_event(d.get('status', 'downloading'), d.get('downloaded_bytes'),
+                                 total, d.get('speed'), d.get('eta')))
+
+    def cancel(self, grace: float = 5.0):
+        """Stop at the next progress hook; a running ffmpeg step finishes first"""
+        self.cancelled = True
+
+    def set_rate_limit(self, rate: Optional[float]):
+        """Change the download speed limit, also while the download is running"""
+        # yt-dlp's downloaders read the shared params on every block
+        if rate:
+            self.session.ydl.params['ratelimit'] = int(rate)
+        else:
+            self.session.ydl.params.pop('ratelimit', None)
+
+    @property
+    def output(self) -> str:
+        """The last lines logged by yt-dlp"""
+        return '\n'.join(self.tail)
+
+    @property
+    def error_output(self) -> str:
+        """Lines yt-dlp flagged as errors, or the whole tail if there are none"""
+        errors = [line for line in self.tail if line.startswith('ERROR')]
+        return '\n'.join(errors) if errors else self.output
+
+
+class YtDlpApiEngine:
+    """
+    In-process yt-dlp backend
+
+    Command lines built for the CLI are translated with yt_dlp.parse_options,
+    so both engines accept exactly the same options. YoutubeDL instances
+    (and with them their HTTP connections and extractor state) are kept
+    per option set and reused across jobs. An engine is not thread-safe;
+    use one per worker thread.
+    """
+
+    def __init__(self, max_sessions: int = 4):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[Tuple[str, ...], _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prepare(self, args: List[str], on_event: Callable[[Dict[str, Any]], None]) -> InProcessRun:
+        """Create a run for CLI-style arguments (without the executable)"""
+        parsed, key = self._parse(args)
+        session = self._session(key, parsed.ydl_opts)
+        session.use_cookies(parsed.ydl_opts.get('cookiefile'))
+        # Fragment concurrency is sized per job (see transfer.py), so it is not in the key
+        session.ydl.params['concurrent_fragment_downloads'] = \
+            parsed.ydl_opts.get('concurrent_fragment_downloads', 1)
+        run = InProcessRun(session, list(parsed.urls), on_event)
+        run.info_file = parsed.options.load_info_filename
+        run.set_rate_limit(parsed.ydl_opts.get('ratelimit'))
+        return run
+
+    def extract_info(self, args: List[str]) -> Dict[str, Any]:
+        """
+        Extract info for the single URL in `args` without downloading
+
+        Raises:
+            yt_dlp.utils.DownloadError, RuntimeError: if extraction failed
+        """
+        parsed, key = self._parse(args)
+        session = self._session(key, parsed.ydl_opts)
+        session.use_cookies(parsed.ydl_opts.get('cookiefile'))
+        errors = []
+        session.logger.on_line = \
+            lambda line: errors.append(line) if line.startswith('ERROR') else None
+        try:
+            info = session.ydl.extract_info(parsed.urls[0], download=False)
+        finally:
+            session.logger.on_line = lambda line: None
+        if info is None:
+            # yt-dlp reports instead of raising when errors are ignored
+            raise RuntimeError('\n'.join(errors) or 'Extraction failed')
+        return session.ydl.sanitize_info(info)
+
+    @staticmethod
+    def _parse(args: List[str]):
+        """Parse CLI arguments; returns (parsed options, session key)"""
+        import yt_dlp
+
+        try:
+            parsed = yt_dlp.parse_options(args)
+        except SystemExit as e:
+            # optparse exits on unknown options; surface it as a normal error
+            raise ValueError(f'Invalid yt-dlp options (exit code {e.code})')
+
+        # Per-job values (URLs, info files, cookie copies, speed limits)
+        # must not split the session cache
+        key = []
+        skip_next = False
+        for arg in args:
+            if skip_next:
+                skip_next = False
+            elif arg in PER_RUN_OPTIONS:
+                skip_next = True
+            elif arg not in parsed.urls:
+                key.append(arg)
+        return parsed, tuple(key)
+
+    def _session(self, key: Tuple[str, ...], ydl_opts: Dict[str, Any]) -> _Session:
+        """Reuse a YoutubeDL for identical options, evicting the oldest"""
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            if session is None:
+                session = _Session(ydl_opts)
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_sessions:
+                _, old = self._sessions.popitem(last=False)
+                old.close()
+            return session
+
+    def close(self):
+        """Close every cached YoutubeDL"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Format planner
+Picks the cheapest streams from a probed format list that satisfy a quality preset
+"""
+
+import re
+from typing import Optional, Dict, Any, List, Tuple
+
+
+# Highest video height each preset allows; None for no limit
+PRESET_HEIGHTS = {'best': None, '1080': 1080, '720': 720}
+
+# Codecs that go into an .mp4 by stream copy and play everywhere
+_MP4_VIDEO = ('avc1', 'h264')
+_MP4_AUDIO = ('mp4a', 'aac')
+
+# Segmented protocols: one request per fragment
+_FRAGMENTED = ('http_dash_segments', 'm3u8', 'm3u8_native', 'f4m', 'ism')
+
+# Seconds per fragment when the info does not list the fragments
+_FRAGMENT_SECONDS = 5.0
+
+
+def _codec(value: Optional[str]) -> Optional[str]:
+    """Codec family of a vcodec/acodec value, or None for 'none'/missing"""
+    if not value or value == 'none':
+        return None
+    return re.split(r'[.\s]', value.lower(), 1)[0]
+
+
+def format_bytes(fmt: Dict[str, Any], duration: Optional[float]) -> Optional[float]:
+    """Size of a format: filesize, yt-dlp's estimate, or bitrate x duration"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return float(size)
+    if fmt.get('tbr') and duration:
+        # tbr is in kbit/s
+        return fmt['tbr'] * 125.0 * duration
+    return None
+
+
+def fragment_count(fmt: Dict[str, Any], duration: Optional[float]) -> int:
+    """Requests needed to fetch a format"""
+    if fmt.get('fragments'):
+        return len(fmt['fragments'])
+    if fmt.get('protocol') in _FRAGMENTED and duration:
+        return max(1, int(duration / _FRAGMENT_SECONDS + 0.999))
+    return 1
+
+
+class FormatPlanner:
+    """
+    Cost model over the formats yt-dlp reported for a video
+
+    A preset is satisfied by the highest resolution (and frame rate) it
+    allows, and by audio within `audio_tolerance` of the best bitrate; among
+    the streams that satisfy it, the cheapest is chosen. Cost is the bytes
+    to transfer plus `fragment_cost` bytes per request for DASH/HLS.
+
+    With `prefer_mp4_native` (the default), H.264/AAC streams win over
+    smaller VP9/AV1/Opus ones, which make an .mp4 that older players reject
+    (or need a re-encode); the others are only chosen when a resolution has
+    no H.264/AAC option that fits the caps. Without it, those streams cost
+    `compat_penalty` more instead. With `max_bytes` or `max_bitrate`,
+    resolutions with no plan under the cap are skipped in favour of the
+    next lower one.
+    """
+
+    def __init__(self, max_bytes: Optional[float] = None, max_bitrate: Optional[float] = None,
+                 prefer_mp4_native: bool = True, compat_penalty: float = 0.15,
+                 fragment_cost: float = 16 * 1024, audio_tolerance: float = 0.25):
+        """
+        Args:
+            max_bytes: Largest estimated download to plan, or None
+            max_bitrate: Highest total bitrate in kbit/s, or None
+            prefer_mp4_native: Choose H.264/AAC over any smaller stream of
+                               the same resolution
+            compat_penalty: Extra cost, as a fraction of the bytes, for
+                            streams that are not native to .mp4 players
+            fragment_cost: Bytes one extra request is considered to cost
+            audio_tolerance: How far below the best audio bitrate the
+                             chosen audio may be (0.25 = 75% of it)
+        """
+        self.max_bytes = max_bytes
+        self.max_bitrate = max_bitrate
+        self.prefer_mp4_native = prefer_mp4_native
+        self.compat_penalty = compat_penalty
+        self.fragment_cost = fragment_cost
+        self.audio_tolerance = audio_tolerance
+
+    def plan(self, info: Dict[str, Any], quality: str = 'best', merge: bool = True,
+             fallback: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Choose the streams for a download
+
+        Args:
+            info: yt-dlp info dict with 'formats' (from -J or the probe cache)
+            quality: 'best', '1080', '720' or 'audio'
+            merge: Whether video and audio are merged into one .mp4 (False
+                   for the pipeline, which fetches them as separate files)
+            fallback: Selector to fall back on in case the chosen IDs are not
+                      offered when yt-dlp runs (the preset's own selector)
+
+        Returns:
+            Plan dict with 'format' (the -f value), 'estimated_bytes',
+            'video'/'audio'/'combined' (summaries of the chosen formats),
+            'height', 'fragments', 'mp4_compatible', 'over_cap' and
+            'candidates', or None if the info lists no usable formats
+        """
+        duration = info.get('duration')
+        formats = [f for f in info.get('formats') or []
+                   if f.get('format_id') and f.get('ext') != 'mhtml'
+                   and not (f.get('format_note') or '').startswith('storyboard')]
+        videos = [f for f in formats if _codec(f.get('vcodec')) and not _codec(f.get('acodec'))]
+        audios = [f for f in formats if _codec(f.get('acodec')) and not _codec(f.get('vcodec'))]
+        combined = [f for f in formats if _codec(f.get('vcodec')) and _codec(f.get('acodec'))]
+
+        if quality == 'audio':
+            audio = self._pick_audio(audios or combined, duration)
+            if audio is None:
+                return None
+            return self._result([audio], duration, None, len(formats), merge, fallback)
+
+        limit = PRESET_HEIGHTS.get(quality)
+        audio = self._pick_audio(audios, duration)
+        heights = sorted({f.get('height') or 0 for f in videos + combined
+                          if limit is None or (f.get('height') or 0) <= limit}, reverse=True)
+        cheapest = None
+        for height in heights:
+            options = []
+            fps = max((f.get('fps') or 0) for f in videos + combined
+                      if (f.get('height') or 0) == height)
+            for video in videos:
+                if (audio and (video.get('height') or 0) == height
+                        and (video.get('fps') or 0) >= fps):
+                    options.append([video, audio])
+            for single in combined:
+                if (single.get('height') or 0) == height and (single.get('fps') or 0) >= fps:
+                    options.append([single])
+            costs = [(self._cost(streams, duration), streams) for streams in options]
+            costs = sorted(((cost, streams) for cost, streams in costs if cost is not None),
+                           key=lambda pair: self._rank(pair[0], pair[1]))
+            if not costs:
+                continue
+            smallest = min(costs, key=lambda pair: pair[0])
+            if cheapest is None or smallest[0] < cheapest[0]:
+                cheapest = smallest
+            for cost, streams in costs:
+                if self._within_caps(streams, duration):
+                    return self._result(streams, duration, height, len(formats), merge, fallback)
+        if cheapest is None:
+            return None
+        # Nothing fits the caps: the cheapest plan seen, flagged
+        plan = self._result(cheapest[1], duration, cheapest[1][0].get('height'), len(formats),
+                            merge, fallback)
+        plan['over_cap'] = True
+        return plan
+
+    def _pick_audio(self, audios: List[Dict[str, Any]],
+                    duration: Optional[float]) -> Optional[Dict[str, Any]]:
+        """Cheapest audio within audio_tolerance of the best bitrate"""
+        if not audios:
+            return None
+        best = max((f.get('abr') or f.get('tbr') or 0) for f in audios)
+        good = [f for f in audios
+                if (f.get('abr') or f.get('tbr') or 0) >= best * (1 - self.audio_tolerance)]
+        costs = [(self._cost([f], duration), f) for f in good]
+        known = [(cost, f) for cost, f in costs if cost is not None]
+        if not known:
+            return good[0]
+        return min(known, key=lambda pair: self._rank(pair[0], [pair[1]]))[1]
+
+    def _rank(self, cost: float, streams: List[Dict[str, Any]]) -> Tuple[bool, float]:
+        """Sort key for plans: H.264/AAC first if preferred, then the cost"""
+        native = all(self._mp4_native(f) for f in streams)
+        return (self.prefer_mp4_native and not native, cost)
+
+    def _cost(self, streams: List[Dict[str, Any]], duration: Optional[float]) -> Optional[float]:
+        """Bytes plus the compatibility and per-request penalties, or None if a size is unknown"""
+        cost = 0.0
+        for fmt in streams:
+            size = format_bytes(fmt, duration)
+            if size is None:
+                return None
+            native = self.prefer_mp4_native or self._mp4_native(fmt)
+            penalty = 0.0 if native else self.compat_penalty
+            cost += size * (1.0 + penalty)
+            cost += (fragment_count(fmt, duration) - 1) * self.fragment_cost
+        return cost
+
+    def _within_caps(self, streams: List[Dict[str, Any]], duration: Optional[float]) -> bool:
+        """Whether the streams fit max_bytes and max_bitrate"""
+        size = sum(format_bytes(f, duration) or 0 for f in streams)
+        if self.max_bytes and size > self.max_bytes:
+            return False
+        bitrate = sum(f.get('tbr') or 0 for f in streams)
+        if self.max_bitrate and bitrate > self.max_bitrate:
+            return False
+        return True
+
+    @staticmethod
+    def _mp4_native(fmt: Dict[str, Any]) -> bool:
+        """Whether every codec in the format goes into .mp4 untouched"""
+        video, audio = _codec(fmt.get('vcodec')), _codec(fmt.get('acodec'))
+        return (video is None or video in _MP4_VIDEO) and (audio is None or audio in _MP4_AUDIO)
+
+    def _result(self, streams: List[Dict[str, Any]], duration: Optional[float],
+                height: Optional[int], candidates: int, merge: bool,
+                fallback: Optional[str]) -> Dict[str, Any]:
+        ids = [f['format_id'] for f in streams]
+        if merge:
+            selector = '+'.join(ids)
+            selector = f'{selector}/{fallback}' if fallback else selector
+        else:
+            # ',' binds looser than '/', so each file gets its own alternative
+            alternatives = fallback.split(',') if fallback else []
+            selector = ','.join(f'{format_id}/{alternatives[i]}' if i < len(alternatives)
+                                else format_id for i, format_id in enumerate(ids))
+        plan = {
+            'format': selector,
+            'estimated_bytes': int(sum(format_bytes(f, duration) or 0 for f in streams)),
+            'height': height,
+            'fragments': sum(fragment_count(f, duration) for f in streams),
+            'mp4_compatible': all(self._mp4_native(f) for f in streams),
+            'over_cap': False,
+            'candidates': candidates,
+        }
+        for fmt in streams:
+            role = 'combined' if len(streams) == 1 and _codec(fmt.get('vcodec')) else \
+                ('video' if _codec(fmt.get('vcodec')) else 'audio')
+            plan[role] = _summary(fmt, duration)
+        return plan
+
+
+def _summary(fmt: Dict[str, Any], duration: Optional[float]) -> Dict[str, Any]:
+    """The fields of a format a plan reports"""
+    return {
+        'format_id': fmt['format_id'],
+        'ext': fmt.get('ext'),
+        'vcodec': fmt.get('vcodec'),
+        'acodec': fmt.get('acodec'),
+        'height': fmt.get('height'),
+        'fps': fmt.get('fps'),
+        'tbr': fmt.get('tbr'),
+        'protocol': fmt.get('protocol'),
+        'bytes': format_bytes(fmt, duration),
+    }
+
+
+def describe(plan: Optional[Dict[str, Any]]) -> str:
+    """One log line for a plan"""
+    if plan is None:
+        return 'no usable formats'
+    parts: List[Tuple[str, Dict[str, Any]]] = [(role, plan[role])
+                                               for role in ('combined', 'video', 'audio')
+                                               if role in plan]
+    streams = ' + '.join(f"{s['format_id']} ({s['vcodec'] if role != 'audio' else s['acodec']})"
+                         for role, s in parts)
+    note = '' if plan['mp4_compatible'] else ', not H.264/AAC'
+    cap = ', over the size cap' if plan['over_cap'] else ''
+    return f"{streams}, about {plan['estimated_bytes'] / 1048576:.1f} MiB{note}{cap}"
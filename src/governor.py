@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Request governor
+Paces requests per host and backs off across all jobs when YouTube starts blocking
+"""
+
+import random
+import re
+import threading
+import time
+from typing import Optional, Dict, Any, Callable, List
+from urllib.parse import urlparse
+
+
+BLOCK_BOT = 'bot'
+BLOCK_FORBIDDEN = 'forbidden'
+BLOCK_RATE_LIMITED = 'rate-limited'
+
+# yt-dlp error text that means the remote refused us rather than the video
+# being unavailable; checked in order, first match wins
+_BLOCK_PATTERNS = [
+    (BLOCK_RATE_LIMITED, re.compile(r'HTTP Error 429|Too Many Requests|try again later', re.I)),
+    (BLOCK_BOT, re.compile(r"not a bot|\bbot\b|confirm you.re not", re.I)),
+    (BLOCK_FORBIDDEN, re.compile(r'HTTP Error 403|\b403\b|Forbidden', re.I)),
+]
+
+# Fallback strategies tried in order after a block. 'args' are added to the
+# yt-dlp command, 'format' replaces the quality format, 'cookies' needs a
+# browser to take cookies from and 'reuse_info' keeps the cached info JSON
+# instead of extracting again.
+DEFAULT_LADDER: List[Dict[str, Any]] = [
+    {
+        'name': 'alternate-client',
+        'args': ['--extractor-args', 'youtube:player_client=tv,mweb'],
+    },
+    {
+        'name': 'browser-cookies',
+        'cookies': True,
+    },
+    {
+        'name': 'single-file',
+        'format': 'best',
+        'reuse_info': True,
+        'args': [
+            '--extractor-args', 'youtube:lang=en',
+            '--socket-timeout', '60',
+            '--user-agent', ('Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) '
+                             'Gecko/20100101 Firefox/120.0'),
+            '--fragment-retries', '5',
+            '--skip-unavailable-fragments',
+        ],
+    },
+]
+
+
+def classify_error(text: str) -> Optional[str]:
+    """Block reason found in yt-dlp error output, or None for other failures"""
+    if not text:
+        return None
+    for reason, pattern in _BLOCK_PATTERNS:
+        if pattern.search(text):
+            return reason
+    return None
+
+
+def host_key(url: str) -> str:
+    """Host that rate limits apply to; YouTube's mirrors share one budget"""
+    host = (urlparse(url).hostname or '').lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if host in ('youtu.be', 'youtube-nocookie.com'):
+        return 'youtube.com'
+    return host or 'local'
+
+
+class TokenBucket:
+    """Allows `burst` requests at once, refilled at `rate` per second"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token; returns seconds to wait before it may be used (caller holds the lock)"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1.0
+        if self.tokens >= 0 or self.rate <= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class RateGovernor:
+    """
+    Shared pacing, backoff and fallback policy for every download
+
+    Each job asks acquire() before contacting a host: requests are spread
+    out by a per-host token bucket, and after any job reports a block all
+    jobs wait out a global, jittered exponential backoff instead of
+    retrying straight away. A blocked job then climbs the fallback ladder
+    one rung at a time, starting from the rung that worked last. Safe to
+    share between threads.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 5, base_backoff: float = 10.0,
+                 max_backoff: float = 300.0, jitter: float = 0.5, max_requeues: int = 2,
+                 ladder: Optional[List[Dict[str, Any]]] = None,
+                 cookies_browser: Optional[str] = None):
+        """
+        Args:
+            rate: Requests per second allowed per host
+            burst: Requests per host that may start at once
+            base_backoff: Seconds to pause everything after the first block;
+                          doubles with every further block until a success
+            max_backoff: Upper bound for a single backoff
+            jitter: Random spread applied to backoffs and requeue delays (0-1)
+            max_requeues: How often a blocked job is put back in the queue
+            ladder: Fallback strategies, see DEFAULT_LADDER
+            cookies_browser: Browser for the cookie rung when the job has none
+        """
+        self.rate = rate
+        self.burst = burst
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.max_requeues = max_requeues
+        self.ladder = list(DEFAULT_LADDER if ladder is None else ladder)
+        self.cookies_browser = cookies_browser
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._backoff_until = 0.0
+        self._streak = 0
+        self._preferred_rung = 0
+        self._requests = 0
+        self._blocks = 0
+        self._reasons: Dict[str, int] = {}
+        self._backoff_seconds = 0.0
+        self._throttle_seconds = 0.0
+        self._requeues = 0
+        self._rungs = {rung['name']: {'tried': 0, 'succeeded': 0} for rung in self.ladder}
+
+    def acquire(self, url: str, is_cancelled: Optional[Callable[[], bool]] = None,
+                log_callback: Optional[Callable[[str], None]] = None) -> float:
+        """
+        Wait until a request to the URL's host is allowed
+
+        Returns:
+            Seconds spent waiting; returns early if `is_cancelled` turns true
+        """
+        with self._lock:
+            self._requests += 1
+            backoff = max(0.0, self._backoff_until - time.monotonic())
+            bucket = self._buckets.get(host_key(url))
+            if bucket is None:
+                bucket = self._buckets[host_key(url)] = TokenBucket(self.rate, self.burst)
+            throttle = bucket.reserve()
+        if backoff >= 1 and log_callback:
+            log_callback(f"Backing off {backoff:.0f}s after a block signal...")
+        waited_backoff = self._sleep(backoff, is_cancelled)
+        waited_throttle = self._sleep(throttle, is_cancelled) if waited_backoff == backoff else 0.0
+        with self._lock:
+            self._backoff_seconds += waited_backoff
+            self._throttle_seconds += waited_throttle
+        return waited_backoff + waited_throttle
+
+    def report(self, url: str, error_text: Optional[str] = None) -> Optional[str]:
+        """
+        Record the outcome of a request
+
+        A block reason in `error_text` starts (or lengthens) the global
+        backoff; a success (`error_text` None) resets it. A failure with no
+        error text, such as a cancelled job, leaves it as it is.
+
+        Returns:
+            The block reason, or None
+        """
+        reason = classify_error(error_text) if error_text else None
+        with self._lock:
+            if reason is None:
+                if error_text is None:
+                    self._streak = 0
+                return None
+            self._blocks += 1
+            self._reasons[reason] = self._reasons.get(reason, 0) + 1
+            self._streak += 1
+            delay = self._jittered(min(self.max_backoff,
+                                       self.base_backoff * 2 ** (self._streak - 1)))
+            self._backoff_until = max(self._backoff_until, time.monotonic() + delay)
+        return reason
+
+    def strategies(self, options: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Ladder rungs that apply to a job, starting from the one that worked last"""
+        with self._lock:
+            start = self._preferred_rung
+        rungs = self.ladder[start:] + self.ladder[:start]
+        applicable = []
+        for rung in rungs:
+            if rung.get('cookies'):
+                # Nothing to escalate to if the job already used cookies
+                if options.get('cookies_browser') or not self.cookies_browser:
+                    continue
+                rung = dict(rung, cookies_browser=self.cookies_browser)
+            applicable.append(rung)
+        return applicable
+
+    def record_rung(self, name: str, success: bool):
+        """Count a fallback attempt; a successful rung is tried first next time"""
+        with self._lock:
+            counts = self._rungs.setdefault(name, {'tried': 0, 'succeeded': 0})
+            counts['tried'] += 1
+            if success:
+                counts['succeeded'] += 1
+                for index, rung in enumerate(self.ladder):
+                    if rung['name'] == name:
+                        self._preferred_rung = index
+
+    def retry_args(self) -> List[str]:
+        """
+        yt-dlp retry options for the current conditions
+
+        While a backoff is running, yt-dlp's own retries would only hit the
+        blocking host again, so they are cut down and spaced further apart.
+        """
+        with self._lock:
+            blocked = self._streak > 0
+        if blocked:
+            return ['--retries', '1', '--retry-sleep', 'http:exp=5:60',
+                    '--retry-sleep', 'fragment:exp=2:30']
+        return ['--retries', '3', '--retry-sleep', 'exp=1:10']
+
+    def requeue_delay(self, attempt: int) -> Optional[float]:
+        """Jittered delay before a blocked job's next attempt, or None when out of attempts"""
+        if attempt > self.max_requeues:
+            return None
+        with self._lock:
+            self._requeues += 1
+        return self._jittered(min(self.max_backoff, self.base_backoff * 3 * 2 ** (attempt - 1)))
+
+    def stats(self) -> Dict[str, Any]:
+        """Request, block and backoff counters"""
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'blocks': self._blocks,
+                'block_rate': self._blocks / self._requests if self._requests else 0.0,
+                'block_reasons': dict(self._reasons),
+                'backoff_seconds': self._backoff_seconds,
+                'throttle_seconds': self._throttle_seconds,
+                'backoff_remaining': max(0.0, self._backoff_until - time.monotonic()),
+                'requeues': self._requeues,
+                'rungs': {name: dict(counts) for name, counts in self._rungs.items()},
+            }
+
+    def _jittered(self, delay: float) -> float:
+        """Spread a delay so that jobs blocked together do not retry together"""
+        return delay * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+    @staticmethod
+    def _sleep(seconds: float, is_cancelled: Optional[Callable[[], bool]]) -> float:
+        """Sleep in short steps so cancelling stays responsive; returns seconds slept"""
+        if seconds <= 0:
+            return 0.0
+        started = time.monotonic()
+        deadline = started + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (is_cancelled is not None and is_cancelled()):
+                break
+            time.sleep(min(remaining, 0.25))
+        return min(seconds, time.monotonic() - started)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Persistent job store
+Journals queued downloads in SQLite so an interrupted batch resumes on the next start
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Union
+
+try:
+    from .paths import user_file
+except ImportError:
+    from paths import user_file
+
+
+KIND_VIDEO = 'video'
+KIND_PLAYLIST = 'playlist'
+
+# States written by DownloadQueue (batch.JobState values)
+UNFINISHED_STATES = ('queued', 'running')
+
+
+def _storable_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    """Options that survive a restart; callbacks and other live objects are dropped"""
+    stored = {}
+    for key, value in options.items():
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        stored[key] = value
+    return stored
+
+
+class JobStore:
+    """
+    Durable record of every submitted job
+
+    Each job's URL, options and state are written on every state change
+    (not on progress), in WAL mode so the writes stay cheap. Jobs that
+    were queued or running when the process stopped are returned by
+    unfinished() and can be submitted again; yt-dlp then continues from
+    the .part files left on disk. Safe to share between threads.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        self.path = str(path or user_file('jobs.db'))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # A lost last write only means one job is retried; skip the fsync per update
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' kind TEXT NOT NULL,'
+            ' url TEXT NOT NULL,'
+            ' options TEXT NOT NULL,'
+            ' state TEXT NOT NULL,'
+            ' error TEXT,'
+            ' filepath TEXT,'
+            ' bytes INTEGER NOT NULL DEFAULT 0,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' created REAL NOT NULL,'
+            ' updated REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)')
+        self._db.commit()
+
+    def add(self, url: str, options: Dict[str, Any], kind: str = KIND_VIDEO) -> int:
+        """Journal a new job; returns its store id"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO jobs (kind, url, options, state, created, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (kind, url, json.dumps(_storable_options(options)), 'queued', now, now)
+            )
+            self._db.commit()
+            return cursor.lastrowid
+
+    def update(self, store_id: int, state: str, error: Optional[str] = None,
+               filepath: Optional[str] = None, bytes_downloaded: int = 0):
+        """Record a state change; entering 'running' counts as an attempt"""
+        with self._lock:
+            self._db.execute(
+                'UPDATE jobs SET state = ?, error = ?, filepath = ?, bytes = ?, updated = ?,'
+                ' attempts = attempts + ? WHERE id = ?',
+                (state, error, filepath, bytes_downloaded, time.time(),
+                 1 if state == 'running' else 0, store_id)
+            )
+            self._db.commit()
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Jobs that were queued or running when the last session ended, oldest first"""
+        placeholders = ', '.join('?' * len(UNFINISHED_STATES))
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT id, kind, url, options, state, attempts FROM jobs '
+                f'WHERE state IN ({placeholders}) ORDER BY id',
+                UNFINISHED_STATES
+            ).fetchall()
+        return [{'id': row[0], 'kind': row[1], 'url': row[2], 'options': json.loads(row[3]),
+                 'state': row[4], 'attempts': row[5]} for row in rows]
+
+    def discard_unfinished(self) -> int:
+        """Give up on every unfinished job; returns how many were dropped"""
+        placeholders = ', '.join('?' * len(UNFINISHED_STATES))
+        with self._lock:
+            cursor = self._db.execute(
+                f"UPDATE jobs SET state = 'cancelled', error = 'Discarded', updated = ? "
+                f'WHERE state IN ({placeholders})',
+                (time.time(),) + UNFINISHED_STATES
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def purge(self, older_than: float = 30 * 86400) -> int:
+        """Delete finished jobs last updated more than `older_than` seconds ago"""
+        placeholders = ', '.join('?' * len(UNFINISHED_STATES))
+        with self._lock:
+            cursor = self._db.execute(
+                f'DELETE FROM jobs WHERE state NOT IN ({placeholders}) AND updated < ?',
+                UNFINISHED_STATES + (time.time() - older_than,)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Job counts per state"""
+        with self._lock:
+            rows = self._db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        return {state: count for state, count in rows}
+
+    def close(self):
+        """Close the database"""
+        with self._lock:
+            self._db.close()
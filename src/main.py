@@ -14,9 +14,23 @@ import json
 from datetime import datetime
 
 from downloader import YouTubeDownloader
+from archive import DownloadArchive, clip_key
+from batch import DownloadQueue, JobState
+from cookie_cache import CookieJarCache
+from governor import RateGovernor
+from job_store import JobStore
+from playlist import PlaylistExpander, is_collection_url
+from probe_cache import ProbeCache
+from ui_events import LOG, UIEventBus
+from urls import parse_url_list, read_url_file
 
 
 class YouTubeDownloaderGUI:
+    # Log widget cap and event-drain cadence; keeps long sessions responsive
+    LOG_MAX_LINES = 5000
+    UI_POLL_MS = 50
+    UI_MAX_EVENTS = 2000
+    
     def __init__(self, root):
         self.root = root
         self.root.title("YouTube Video Downloader")
@@ -27,12 +41,37 @@ class YouTubeDownloaderGUI:
         style = ttk.Style()
         style.theme_use('clam')
         
-        self.downloader = YouTubeDownloader()
+        try:
+            self.probe_cache = ProbeCache()
+        except Exception as e:
+            print(f"Could not open probe cache: {e}")
+            self.probe_cache = None
+        try:
+            self.archive = DownloadArchive()
+        except Exception as e:
+            print(f"Could not open download archive: {e}")
+            self.archive = None
+        try:
+            self.job_store = JobStore()
+        except Exception as e:
+            print(f"Could not open job store: {e}")
+            self.job_store = None
+        # One governor for single and batch downloads, so a block slows both
+        self.governor = RateGovernor()
+        # Browser cookies are read once and reused until they expire
+        self.cookie_cache = CookieJarCache()
+        self.downloader = YouTubeDownloader(probe_cache=self.probe_cache, archive=self.archive,
+                                            governor=self.governor, cookie_cache=self.cookie_cache)
         self.is_downloading = False
         self.download_thread = None
+        self.download_queue = None
+        self.is_suspending = False
+        self.events = UIEventBus()
         
         self.setup_ui()
         self.load_config()
+        self.root.after(self.UI_POLL_MS, self._drain_events)
+        self.root.after(500, self._offer_resume)
         
     def setup_ui(self):
         """Setup the user interface"""
@@ -50,9 +89,16 @@ class YouTubeDownloaderGUI:
         title_label.grid(row=0, column=0, columnspan=3, pady=10)
         
         # YouTube Link
-        ttk.Label(main_frame, text="YouTube Link:").grid(row=1, column=0, sticky=tk.W, pady=5)
-        self.link_entry = ttk.Entry(main_frame, width=80)
-        self.link_entry.grid(row=1, column=1, columnspan=2, sticky=(tk.W, tk.E), padx=5)
+        ttk.Label(main_frame, text="YouTube Link(s):").grid(row=1, column=0, sticky=tk.W, pady=5)
+        link_frame = ttk.Frame(main_frame)
+        link_frame.grid(row=1, column=1, columnspan=2, sticky=(tk.W, tk.E), padx=5)
+        link_frame.columnconfigure(0, weight=1)
+        
+        self.link_entry = ttk.Entry(link_frame, width=80)
+        self.link_entry.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        
+        list_btn = ttk.Button(link_frame, text="Load List", command=self.load_url_list)
+        list_btn.grid(row=0, column=1, padx=5)
         
         # Download Folder
         ttk.Label(main_frame, text="Download Folder:").grid(row=2, column=0, sticky=tk.W, pady=5)
@@ -87,6 +133,11 @@ class YouTubeDownloaderGUI:
         self.end_time_entry = ttk.Entry(self.clip_frame, width=20)
         self.end_time_entry.grid(row=1, column=1, sticky=tk.W, padx=5)
         
+        self.accurate_cuts_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.clip_frame, text="Exact cut points (slower, re-encodes around cuts)",
+                        variable=self.accurate_cuts_var).grid(row=2, column=0, columnspan=2,
+                                                              sticky=tk.W, pady=5)
+        
         # Browser Cookie Automation
         ttk.Label(main_frame, text="Browser Cookie Handling:").grid(row=5, column=0, sticky=tk.W, pady=5)
         
@@ -100,6 +151,10 @@ class YouTubeDownloaderGUI:
                        value="chrome").pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(cookie_frame, text="Firefox", variable=self.cookie_var, 
                        value="firefox").pack(side=tk.LEFT, padx=5)
+        # Cookies stay unused until YouTube blocks a download (the governor's cookie step)
+        self.cookies_when_blocked_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(cookie_frame, text="Only when YouTube blocks",
+                        variable=self.cookies_when_blocked_var).pack(side=tk.LEFT, padx=(20, 5))
         
         # Download Quality Options
         ttk.Label(main_frame, text="Quality:").grid(row=6, column=0, sticky=tk.W, pady=5)
@@ -116,6 +171,11 @@ class YouTubeDownloaderGUI:
         ttk.Radiobutton(quality_frame, text="Audio Only", variable=self.quality_var, 
                        value="audio").pack(side=tk.LEFT, padx=5)
         
+        ttk.Label(quality_frame, text="Parallel downloads:").pack(side=tk.LEFT, padx=(20, 5))
+        self.workers_var = tk.IntVar(value=3)
+        ttk.Spinbox(quality_frame, from_=1, to=8, width=4,
+                    textvariable=self.workers_var).pack(side=tk.LEFT)
+        
         # Download Button
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=7, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=20)
@@ -159,24 +219,76 @@ class YouTubeDownloaderGUI:
             self.folder_entry.delete(0, tk.END)
             self.folder_entry.insert(0, folder)
             
+    def load_url_list(self):
+        """Load links from a text file into the link field"""
+        path = filedialog.askopenfilename(
+            title="Select URL List",
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            urls = read_url_file(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not read URL list: {e}")
+            return
+        self.link_entry.delete(0, tk.END)
+        self.link_entry.insert(0, " ".join(urls))
+        self.status_label.config(text=f"Loaded {len(urls)} links")
+        
     def log_message(self, message):
-        """Add message to log"""
+        """Add message to log; safe to call from any thread"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        self.events.log(f"[{timestamp}] {message}")
+        
+    def _drain_events(self):
+        """Apply queued log lines and widget updates on the Tk thread"""
+        try:
+            lines = []
+            for kind, payload in self.events.drain(self.UI_MAX_EVENTS):
+                if kind == LOG:
+                    lines.append(payload)
+                    continue
+                if lines:
+                    self._append_log(lines)
+                    lines = []
+                fn, args = payload
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"UI update failed: {e}")
+            if lines:
+                self._append_log(lines)
+        finally:
+            self.root.after(self.UI_POLL_MS, self._drain_events)
+            
+    def _append_log(self, lines):
+        """Insert a batch of lines, dropping the oldest beyond LOG_MAX_LINES"""
+        lines = lines[-self.LOG_MAX_LINES:]
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > self.LOG_MAX_LINES:
+            self.log_text.delete('1.0', f'{line_count - self.LOG_MAX_LINES + 1}.0')
         self.log_text.see(tk.END)
-        self.root.update()
+        
+    def _set_status(self, text):
+        """Status bar text (Tk thread)"""
+        self.status_label.config(text=text)
+        
+    def _finish_download(self):
+        """Re-enable the controls once a download or batch ended (Tk thread)"""
+        self.download_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.progress.stop()
         
     def start_download(self):
         """Start download in a separate thread"""
-        url = self.link_entry.get().strip()
+        urls = parse_url_list(self.link_entry.get())
         
-        if not url:
+        if not urls:
             messagebox.showerror("Error", "Please enter a YouTube link")
             return
             
-        if not url.startswith(("http://", "https://")):
-            url = "https://" + url
-            
         download_path = self.folder_entry.get().strip()
         if not download_path:
             messagebox.showerror("Error", "Please select a download folder")
@@ -198,23 +310,41 @@ class YouTubeDownloaderGUI:
                 messagebox.showerror("Error", "Invalid time values. Please enter numbers.")
                 return
                 
+        # Read every Tk variable here; worker threads only get plain values
+        browser = self.cookie_var.get() if self.cookie_var.get() != "none" else None
+        when_blocked = self.cookies_when_blocked_var.get()
+        self.governor.cookies_browser = browser if when_blocked else None
+        options = {
+            'quality': self.quality_var.get(),
+            'cookies_browser': None if when_blocked else browser,
+            'start_time': start_time,
+            'end_time': end_time,
+            'accurate_cuts': self.accurate_cuts_var.get(),
+            'output_path': download_path,
+            'log_callback': self.log_message
+        }
+        
         # Disable UI during download
         self.is_downloading = True
         self.download_btn.config(state=tk.DISABLED)
         self.cancel_btn.config(state=tk.NORMAL)
+        self.progress.config(mode='indeterminate', value=0)
         self.progress.start()
         self.log_text.delete(1.0, tk.END)
         
         # Start download in thread
-        self.download_thread = threading.Thread(
-            target=self._download_worker,
-            args=(url, download_path, start_time, end_time),
-            daemon=True
-        )
+        if len(urls) == 1 and not is_collection_url(urls[0]):
+            target, args = self._download_worker, (urls[0], options)
+        else:
+            target, args = self._batch_worker, (urls, options, self._get_workers())
+        self.download_thread = threading.Thread(target=target, args=args, daemon=True)
         self.download_thread.start()
         
-    def _download_worker(self, url, download_path, start_time, end_time):
+    def _download_worker(self, url, options):
         """Worker thread for downloading"""
+        download_path = options['output_path']
+        store_id = self.job_store.add(url, options) if self.job_store else None
+        state, error = JobState.FAILED, None
         try:
             self.log_message(f"Starting download from: {url}")
             self.log_message(f"Download folder: {download_path}")
@@ -222,47 +352,202 @@ class YouTubeDownloaderGUI:
             # Create download folder if it doesn't exist
             os.makedirs(download_path, exist_ok=True)
             
-            # Prepare options
-            options = {
-                'quality': self.quality_var.get(),
-                'cookies_browser': self.cookie_var.get() if self.cookie_var.get() != "none" else None,
-                'start_time': start_time,
-                'end_time': end_time,
-                'output_path': download_path,
-                'log_callback': self.log_message
-            }
-            
             # Download
+            options = dict(options, progress_callback=self._on_progress)
+            if store_id:
+                self.job_store.update(store_id, JobState.RUNNING)
             result = self.downloader.download(url, options)
-            
+            error = result.get('error')
+            if result['success']:
+                state = JobState.DONE
+            elif self.downloader.is_cancelled:
+                state = JobState.CANCELLED
+                
             if result['success']:
                 self.log_message(f"✓ Download completed successfully!")
                 self.log_message(f"File saved to: {result.get('filepath', download_path)}")
-                self.status_label.config(text="Download completed successfully!")
-                messagebox.showinfo("Success", f"Video downloaded successfully!\n\nSaved to: {download_path}")
+                self.events.call(self._set_status, "Download completed successfully!")
+                self.events.call(messagebox.showinfo, "Success",
+                                 f"Video downloaded successfully!\n\nSaved to: {download_path}")
             else:
                 error_msg = result.get('error', 'Unknown error')
                 self.log_message(f"✗ Download failed: {error_msg}")
-                self.status_label.config(text="Download failed!")
-                messagebox.showerror("Download Failed", error_msg)
+                self.events.call(self._set_status, "Download failed!")
+                self.events.call(messagebox.showerror, "Download Failed", error_msg)
                 
         except Exception as e:
             error_msg = f"Error: {str(e)}"
             self.log_message(error_msg)
-            self.status_label.config(text="Download failed!")
-            messagebox.showerror("Error", error_msg)
+            self.events.call(self._set_status, "Download failed!")
+            self.events.call(messagebox.showerror, "Error", error_msg)
         finally:
+            # A download paused by closing the window stays unfinished in the store
+            if store_id and not self.is_suspending:
+                self.job_store.update(store_id, state, error)
             self.is_downloading = False
-            self.download_btn.config(state=tk.NORMAL)
-            self.cancel_btn.config(state=tk.DISABLED)
+            self.events.call(self._finish_download)
+            
+    def _on_progress(self, event):
+        """Forward yt-dlp progress to the Tk thread, keeping only the newest event"""
+        if event.get('percent') is not None:
+            self.events.call_latest('progress', self._show_progress, event)
+            
+    def _show_progress(self, event):
+        """Show yt-dlp progress on a determinate progress bar (Tk thread)"""
+        percent = event['percent']
+        if str(self.progress.cget('mode')) != 'determinate':
             self.progress.stop()
+            self.progress.config(mode='determinate', maximum=100)
+        self.progress['value'] = percent
+        
+        status = f"Downloading: {percent:.1f}%"
+        if event.get('speed'):
+            status += f" at {event['speed'] / 1048576:.2f} MiB/s"
+        if event.get('eta') is not None:
+            status += f", ETA {int(event['eta']) // 60}:{int(event['eta']) % 60:02d}"
+        self.status_label.config(text=status)
+        
+    def _batch_worker(self, urls, options, workers, resume=False):
+        """Worker thread for downloading a list of links in parallel"""
+        try:
+            self.download_queue = DownloadQueue(
+                max_workers=workers,
+                downloader_factory=lambda: YouTubeDownloader(probe_cache=self.probe_cache,
+                                                             archive=self.archive),
+                on_job_update=self._on_job_update,
+                job_store=self.job_store,
+                governor=self.governor,
+                cookie_cache=self.cookie_cache
+            )
+            if resume:
+                jobs = self.download_queue.resume({'log_callback': self.log_message},
+                                                  self._make_expander)
+                self.log_message(f"Resuming {len(jobs)} unfinished downloads "
+                                 f"with {workers} parallel downloads")
+            else:
+                self.log_message(f"Queued {len(urls)} links with {workers} parallel downloads")
+                self.log_message(f"Download folder: {options['output_path']}")
+                os.makedirs(options['output_path'], exist_ok=True)
+                
+            for url in urls:
+                if is_collection_url(url):
+                    # Videos are queued while the playlist is still being listed
+                    self.log_message(f"Listing playlist: {url}")
+                    self.download_queue.submit_playlist(url, options, self._make_expander(options))
+                else:
+                    self.download_queue.submit(url, options)
+            self.download_queue.wait()
             
+            stats = self.download_queue.stats()
+            states = stats['states']
+            summary = (f"{states[JobState.DONE]} done ({stats['archived']} already downloaded), "
+                       f"{states[JobState.FAILED]} failed, {states[JobState.CANCELLED]} cancelled")
+            self.log_message(f"Batch finished: {summary} in {stats['elapsed']:.0f}s "
+                             f"({stats['bytes'] / 1048576:.1f} MiB, "
+                             f"{stats['jobs_per_minute']:.1f} jobs/min)")
+            governor = stats['governor']
+            if governor['blocks']:
+                self.log_message(f"Blocked {governor['blocks']} times "
+                                 f"({governor['block_rate']:.0%} of requests), "
+                                 f"backed off {governor['backoff_seconds']:.0f}s, "
+                                 f"requeued {governor['requeues']} jobs")
+            self.events.call(self._set_status, f"Batch finished: {summary}")
+            if states[JobState.FAILED]:
+                self.events.call(messagebox.showwarning, "Batch Finished",
+                                 f"Batch finished with errors:\n\n{summary}")
+            else:
+                self.events.call(messagebox.showinfo, "Batch Finished",
+                                 f"Batch finished:\n\n{summary}")
+                
+        except Exception as e:
+            error_msg = f"Error: {str(e)}"
+            self.log_message(error_msg)
+            self.events.call(self._set_status, "Batch failed!")
+            self.events.call(messagebox.showerror, "Error", error_msg)
+        finally:
+            if self.download_queue:
+                self.download_queue.shutdown(wait=False)
+            self.is_downloading = False
+            self.events.call(self._finish_download)
+            
+    def _make_expander(self, options):
+        """Playlist expander that skips videos already in the archive"""
+        return PlaylistExpander(
+            ytdlp_path=self.downloader.ytdlp_path,
+            archive=self.archive,
+            format_key=options.get('quality', 'best'),
+            clip=clip_key(options.get('start_time'), options.get('end_time')),
+            cookies_browser=options.get('cookies_browser')
+        )
+        
+    def _offer_resume(self):
+        """Ask whether to continue downloads interrupted in an earlier session"""
+        if self.job_store is None or self.is_downloading:
+            return
+        unfinished = self.job_store.unfinished()
+        if not unfinished:
+            return
+        if not messagebox.askyesno(
+                "Resume Downloads",
+                f"{len(unfinished)} downloads from the last session did not finish.\n\n"
+                "Resume them now? Partially downloaded files are continued."):
+            self.job_store.discard_unfinished()
+            return
+        self.is_downloading = True
+        self.download_btn.config(state=tk.DISABLED)
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.progress.config(mode='indeterminate', value=0)
+        self.progress.start()
+        self.download_thread = threading.Thread(
+            target=self._batch_worker, args=([], {}, self._get_workers(), True), daemon=True
+        )
+        self.download_thread.start()
+        
+    def _get_workers(self):
+        """Parallel download count from the spinbox, falling back to 3"""
+        try:
+            return max(1, min(8, int(self.workers_var.get())))
+        except (tk.TclError, ValueError):
+            return 3
+            
+    def _on_job_update(self, job):
+        """Report per-job state changes from the batch queue (any thread)"""
+        if job.state == JobState.DONE:
+            self.log_message(f"✓ [job {job.job_id}] {job.result.get('filepath', job.url)}")
+        elif job.state in (JobState.FAILED, JobState.CANCELLED):
+            self.log_message(f"✗ [job {job.job_id}] {job.state}: {job.error}")
+        stats = self.download_queue.stats() if self.download_queue else None
+        if stats:
+            self.events.call_latest('batch', self._show_batch_status, stats)
+            
+    def _show_batch_status(self, stats):
+        """Batch progress bar and counters (Tk thread)"""
+        states = stats['states']
+        finished = states[JobState.DONE] + states[JobState.FAILED] + states[JobState.CANCELLED]
+        if finished:
+            self.progress.stop()
+            self.progress.config(mode='determinate', maximum=stats['total'], value=finished)
+        self.status_label.config(
+            text=f"Running {states[JobState.RUNNING]}, queued {states[JobState.QUEUED]}, "
+                 f"done {states[JobState.DONE]}/{stats['total']}"
+        )
+        
     def cancel_download(self):
         """Cancel current download"""
         self.downloader.cancel_download()
+        if self.download_queue:
+            self.download_queue.cancel_all()
         self.log_message("Download cancelled by user")
         self.is_downloading = False
         
+    def suspend_downloads(self):
+        """Stop everything but keep partial files and unfinished jobs for the next start"""
+        self.is_suspending = True
+        self.downloader.cancel_download(keep_partial=True)
+        if self.download_queue:
+            self.download_queue.suspend()
+        self.is_downloading = False
+        
     def load_config(self):
         """Load saved configuration"""
         config_file = Path.home() / ".youtube_downloader_config.json"
@@ -277,6 +562,10 @@ class YouTubeDownloaderGUI:
                         self.quality_var.set(config['quality'])
                     if 'cookies_browser' in config:
                         self.cookie_var.set(config['cookies_browser'])
+                    if 'cookies_when_blocked' in config:
+                        self.cookies_when_blocked_var.set(config['cookies_when_blocked'])
+                    if 'max_workers' in config:
+                        self.workers_var.set(config['max_workers'])
             except Exception as e:
                 print(f"Could not load config: {e}")
                 
@@ -285,7 +574,9 @@ class YouTubeDownloaderGUI:
         config = {
             'download_path': self.folder_entry.get(),
             'quality': self.quality_var.get(),
-            'cookies_browser': self.cookie_var.get()
+            'cookies_browser': self.cookie_var.get(),
+            'cookies_when_blocked': self.cookies_when_blocked_var.get(),
+            'max_workers': self._get_workers()
         }
         config_file = Path.home() / ".youtube_downloader_config.json"
         try:
@@ -297,8 +588,11 @@ class YouTubeDownloaderGUI:
     def on_closing(self):
         """Handle window closing"""
         if self.is_downloading:
-            if messagebox.askokcancel("Download in Progress", "A download is in progress. Do you want to cancel and exit?"):
-                self.cancel_download()
+            if messagebox.askokcancel(
+                    "Download in Progress",
+                    "A download is in progress. Do you want to stop and exit?\n\n"
+                    "Unfinished downloads will be offered for resuming next time."):
+                self.suspend_downloads()
                 self.save_config()
                 self.root.destroy()
         else:
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Content-addressed media store
+Keeps each downloaded file once and links it into every output folder
+"""
+
+import errno
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Union
+
+try:
+    from .archive import file_checksum
+    from .urls import video_key
+except ImportError:
+    from archive import file_checksum
+    from urls import video_key
+
+
+LINK_MODES = ('auto', 'reflink', 'hardlink', 'copy')
+
+# ioctl that makes dst share src's extents (btrfs, XFS, bcachefs)
+_FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str):
+    """Copy-on-write clone of src at dst; raises OSError where unsupported"""
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'reflinks need Linux')
+    import fcntl
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        try:
+            fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(dst)
+            raise
+
+
+def formats_key(format_ids: List[str]) -> str:
+    """Index key of a set of format IDs, e.g. ['140', '137'] -> '137+140'"""
+    return '+'.join(sorted(set(format_ids)))
+
+
+def link_file(src: str, dst: str, mode: str = 'auto') -> str:
+    """
+    Make dst a reflink, hard link or copy of src, replacing dst atomically
+
+    'auto' tries a reflink (edits to one copy never reach the others), then
+    a hard link, then a plain copy. Returns the method that was used.
+    """
+    temp_path = f'{dst}.ytd-link-{os.getpid()}-{threading.get_ident()}'
+    methods = ('reflink', 'hardlink', 'copy') if mode == 'auto' else (mode,)
+    error: Optional[OSError] = None
+    for method in methods:
+        try:
+            if method == 'reflink':
+                _reflink(src, temp_path)
+            elif method == 'hardlink':
+                os.link(src, temp_path)
+            else:
+                shutil.copy2(src, temp_path)
+            os.replace(temp_path, dst)
+            return method
+        except OSError as e:
+            error = e
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+    raise error
+
+
+class MediaStore:
+    """
+    Deduplicated store for finished downloads
+
+    Files are kept once under `root`/objects, named by their SHA-256, and
+    output folders get reflinks or hard links to them, so the same video
+    downloaded into several users' folders takes the space of one copy and
+    a repeat request anywhere is linked instead of downloaded. An index maps
+    (video, format IDs, clip, content hash) to the stored name, so quality
+    presets that resolve to the same streams share an entry and presets
+    that resolve to different ones never do. It records every link with
+    its inode, so references can be counted: gc() drops links whose file
+    was deleted or replaced and then the objects nobody links to. Output
+    folders must be on the same filesystem as `root` to share space; on
+    another filesystem the store falls back to copying, which still saves
+    the download. Safe to share between threads.
+    """
+
+    def __init__(self, root: Union[str, Path], link_mode: str = 'auto'):
+        """
+        Args:
+            root: Directory of the store (created if missing)
+            link_mode: 'auto', 'reflink', 'hardlink' or 'copy', see link_file
+        """
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode '{link_mode}', "
+                             f"expected one of {', '.join(LINK_MODES)}")
+        self.root = str(root)
+        self.link_mode = link_mode
+        self.hits = 0
+        self.misses = 0
+        self.adopted = 0
+        self.deduplicated = 0
+        os.makedirs(os.path.join(self.root, 'objects'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.root, 'store.db'), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(entries)')}
+        if columns and 'formats' not in columns:
+            # Stores from before format IDs were recorded: their entries
+            # cannot be matched to a request, gc() collects the objects
+            self._db.execute('DROP TABLE entries')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS objects ('
+            ' hash TEXT PRIMARY KEY,'
+            ' ext TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' created REAL NOT NULL)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' video TEXT NOT NULL,'
+            ' formats TEXT NOT NULL,'
+            ' clip TEXT NOT NULL,'
+            ' hash TEXT NOT NULL,'
+            ' preset TEXT NOT NULL,'
+            ' name TEXT NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' PRIMARY KEY (video, formats, clip, hash, preset))'
+        )
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS entries_preset ON entries (video, preset, clip)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS links ('
+            ' path TEXT PRIMARY KEY,'
+            ' hash TEXT NOT NULL,'
+            ' device INTEGER NOT NULL,'
+            ' inode INTEGER NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' method TEXT NOT NULL,'
+            ' created REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS links_hash ON links (hash)')
+        self._db.commit()
+
+    def object_path(self, digest: str, ext: str) -> str:
+        """Where the object with this hash lives"""
+        return os.path.join(self.root, 'objects', digest[:2], digest + ext)
+
+    def adopt(self, url: str, filepath: str, format_ids: List[str], clip: str = '',
+              preset: str = 'best') -> Dict[str, Any]:
+        """
+        Take a freshly downloaded file into the store
+
+        The file is hashed; if the store already has the content, the file
+        is replaced by a link to it (freeing its space), otherwise the file
+        becomes the stored object. Either way `filepath` stays where it is.
+
+        Args:
+            url: Video link
+            filepath: The downloaded file
+            format_ids: Formats yt-dlp saved in it (result['format_ids'])
+            clip: Clip range key (see archive.clip_key)
+            preset: Quality preset it was downloaded with, see formats_for
+
+        Returns:
+            Dict with 'hash', 'size', 'method' (how filepath is now linked)
+            and 'deduplicated' (True if the content was already stored)
+
+        Raises:
+            ValueError: if format_ids is empty
+        """
+        if not format_ids:
+            raise ValueError('A stored file needs the IDs of the formats in it')
+        digest = file_checksum(filepath)
+        ext = os.path.splitext(filepath)[1].lower()
+        size = os.path.getsize(filepath)
+        target = self.object_path(digest, ext)
+        with self._lock:
+            known = self._db.execute('SELECT 1 FROM objects WHERE hash = ?', (digest,)).fetchone()
+        deduplicated = known is not None and os.path.isfile(target)
+        if deduplicated:
+            method = link_file(target, filepath, self.link_mode)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # The object becomes a link to the download, so nothing is copied
+            # when both are on one filesystem
+            method = link_file(filepath, target, self.link_mode)
+        key = video_key(url)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR IGNORE INTO objects (hash, ext, size, created) VALUES (?, ?, ?, ?)',
+                (digest, ext, size, now))
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries '
+                '(video, formats, clip, hash, preset, name, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, formats_key(format_ids), clip, digest, preset, os.path.basename(filepath),
+                 now)
+            )
+            self._record_link(filepath, digest, method, now)
+            self._db.commit()
+            self.adopted += 1
+            if deduplicated:
+                self.deduplicated += 1
+        return {'hash': digest, 'size': size, 'method': method, 'deduplicated': deduplicated}
+
+    def formats_for(self, url: str, preset: str = 'best', clip: str = '') -> Optional[List[str]]:
+        """
+        Format IDs the last stored download of a video with this preset had
+
+        Lets a repeat request be looked up without extracting the video
+        first; presets can resolve differently once new formats appear.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT formats FROM entries WHERE video = ? AND preset = ? AND clip = ? '
+                'ORDER BY created DESC LIMIT 1',
+                (video_key(url), preset, clip)
+            ).fetchone()
+        return row[0].split('+') if row is not None else None
+
+    def materialize(self, url: str, output_path: str, format_ids: List[str],
+                    clip: str = '') -> Optional[str]:
+        """
+        Link a stored download into `output_path` instead of downloading it
+
+        The file keeps the name it was first downloaded under; if that name
+        is taken by different content, the video key is added to it.
+
+        Returns:
+            Path of the file in `output_path`, or None if the store does not
+            have this video with exactly these formats and clip range
+        """
+        key = video_key(url)
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT e.hash, e.name, o.ext, o.size '
+                'FROM entries e JOIN objects o ON o.hash = e.hash '
+                'WHERE e.video = ? AND e.formats = ? AND e.clip = ? '
+                'ORDER BY e.created DESC',
+                (key, formats_key(format_ids), clip)
+            ).fetchall()
+        row = next((row for row in rows if self._intact(self.object_path(row[0], row[2]), row[3])),
+                   None)
+        if row is None:
+            self.misses += 1
+            return None
+
+        source = self.object_path(row[0], row[2])
+        digest, name = row[0], row[1]
+        output_path = os.path.abspath(output_path)
+        os.makedirs(output_path, exist_ok=True)
+        dest = os.path.join(output_path, name)
+        if os.path.exists(dest):
+            if os.path.samefile(dest, source) or self._same_link(dest, digest):
+                self.hits += 1
+                return dest
+            stem, ext = os.path.splitext(name)
+            tag = re.sub(r'[^\w-]+', '_', key.split(':', 1)[-1])[-32:]
+            dest = os.path.join(output_path, f'{stem} [{tag}]{ext}')
+        method = link_file(source, dest, self.link_mode)
+        with self._lock:
+            self._record_link(dest, digest, method, time.time())
+            self._db.commit()
+            self.hits += 1
+        return dest
+
+    def refcount(self, digest: str) -> int:
+        """Links to an object that still exist unchanged"""
+        with self._lock:
+            rows = self._db.execute('SELECT path, device, inode, size FROM links WHERE hash = ?',
+                                    (digest,)).fetchall()
+        return sum(1 for row in rows if self._link_alive(*row))
+
+    def gc(self, grace: float = 3600.0, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Drop dead links and the objects no live link refers to
+
+        A link is dead when its file was deleted or replaced by another
+        file. Objects younger than `grace` seconds are kept, so a download
+        being adopted right now is not collected.
+
+        Returns:
+            Dict with 'links_removed', 'objects_removed' and 'bytes_freed'
+        """
+        with self._lock:
+            links = self._db.execute('SELECT path, hash, device, inode, size FROM links').fetchall()
+            objects = self._db.execute('SELECT hash, ext, size, created FROM objects').fetchall()
+        dead_links = {row[0] for row in links
+                      if not self._link_alive(row[0], row[2], row[3], row[4])}
+        live_hashes = {row[1] for row in links if row[0] not in dead_links}
+        cutoff = time.time() - grace
+        dead_objects = [row for row in objects if row[0] not in live_hashes and row[3] < cutoff]
+        report = {'links_removed': len(dead_links), 'objects_removed': len(dead_objects),
+                  'bytes_freed': sum(row[2] for row in dead_objects)}
+        if dry_run:
+            return report
+
+        for digest, ext, size, created in dead_objects:
+            path = self.object_path(digest, ext)
+            try:
+                os.remove(path)
+                # Drop the two-letter prefix folder once it is empty
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+        with self._lock:
+            self._db.executemany('DELETE FROM links WHERE path = ?',
+                                 [(path,) for path in dead_links])
+            for digest, ext, size, created in dead_objects:
+                self._db.execute('DELETE FROM objects WHERE hash = ?', (digest,))
+                self._db.execute('DELETE FROM entries WHERE hash = ?', (digest,))
+            self._db.commit()
+        report['orphans_removed'] = self._remove_orphans(cutoff)
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        """Stored vs. linked bytes and lookup counters"""
+        with self._lock:
+            objects, stored = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects').fetchone()
+            links, linked = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM links').fetchone()
+            methods = dict(self._db.execute(
+                'SELECT method, COUNT(*) FROM links GROUP BY method').fetchall())
+        return {
+            'objects': objects,
+            'stored_bytes': stored,
+            'links': links,
+            'linked_bytes': linked,
+            # Copies take space of their own, so they save nothing on disk
+            'saved_bytes': max(0, linked - stored - self._copied_bytes()),
+            'link_methods': methods,
+            'hits': self.hits,
+            'misses': self.misses,
+            'adopted': self.adopted,
+            'deduplicated': self.deduplicated,
+        }
+
+    def close(self):
+        """Close the index"""
+        with self._lock:
+            self._db.close()
+
+    def _record_link(self, path: str, digest: str, method: str, now: float):
+        """Remember a link (lock held)"""
+        st = os.stat(path)
+        self._db.execute(
+            'INSERT OR REPLACE INTO links (path, hash, device, inode, size, method, created) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (os.path.abspath(path), digest, st.st_dev, st.st_ino, st.st_size, method, now)
+        )
+
+    def _same_link(self, path: str, digest: str) -> bool:
+        """Whether path is a still-intact link we made to this object"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT device, inode, size FROM links WHERE path = ? AND hash = ?',
+                (os.path.abspath(path), digest)).fetchone()
+        return row is not None and self._link_alive(path, *row)
+
+    def _copied_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM links WHERE method = 'copy'").fetchone()[0]
+
+    @staticmethod
+    def _link_alive(path: str, device: int, inode: int, size: int) -> bool:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return st.st_dev == device and st.st_ino == inode and st.st_size == size
+
+    @staticmethod
+    def _intact(path: str, size: int) -> bool:
+        try:
+            return os.path.getsize(path) == size
+        except OSError:
+            return False
+
+    def _remove_orphans(self, cutoff: float) -> int:
+        """Delete object files the index does not know, e.g. after a crash"""
+        with self._lock:
+            known = {digest for (digest,) in self._db.execute('SELECT hash FROM objects')}
+        removed = 0
+        for path in Path(self.root, 'objects').glob('*/*'):
+            try:
+                if path.stem not in known and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        return removed
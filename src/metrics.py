@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Job metrics
+Per-phase timings of downloads, written as JSON lines and Prometheus text
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+
+# Phases of one yt-dlp run, in the order they happen
+PHASES = ('slot_wait', 'spawn', 'extract', 'first_byte', 'transfer', 'merge', 'resolve')
+
+# Histogram buckets in seconds
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+
+class PhaseClock:
+    """Splits one download's wall-clock time into consecutive phases"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._phase: Optional[str] = None
+        self._since = 0.0
+
+    def start(self, phase: str):
+        """Begin a phase, ending the current one"""
+        self._close()
+        self._phase = phase
+        self._since = time.monotonic()
+
+    def advance(self, phase: str):
+        """Move on to a later phase; ignored if the clock is already at or past it"""
+        if self._phase in PHASES and phase in PHASES and \
+                PHASES.index(phase) <= PHASES.index(self._phase):
+            return
+        self.start(phase)
+
+    def stop(self):
+        """End the current phase"""
+        self._close()
+        self._phase = None
+
+    def add(self, phase: str, seconds: float):
+        """Count time spent outside the clock, e.g. waiting on the governor"""
+        if seconds > 0:
+            self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def _close(self):
+        if self._phase is not None:
+            self.add(self._phase, time.monotonic() - self._since)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Count one value"""
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    """Prometheus label set, e.g. {phase="merge"}"""
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _number(value: float) -> str:
+    """Sample value; integers stay integers"""
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRecorder:
+    """
+    Collects one record per finished job
+
+    Every record is appended to a JSON-lines file (for offline analysis of
+    where the time goes) and folded into counters and histograms that
+    prometheus_text() renders in the Prometheus text format; with
+    `prometheus_path` the same text is rewritten after every job for a
+    node_exporter textfile collector. Safe to share between threads.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, prometheus_path: Optional[str] = None,
+                 prefix: str = 'ytd', buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            jsonl_path: File to append one JSON object per job to, or None
+            prometheus_path: File to keep the Prometheus text in, or None
+            prefix: Prefix of every metric name
+            buckets: Histogram bucket bounds in seconds
+        """
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._jsonl = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+        self._jobs: Dict[str, int] = {}
+        self._duration = Histogram(self.buckets)
+        self._phases: Dict[str, Histogram] = {}
+        self._bytes = 0
+        self._retries = 0
+        self._attempts = 0
+        self._fallbacks: Dict[str, int] = {}
+        self._blocks: Dict[str, int] = {}
+        self._caches: Dict[tuple, int] = {}
+
+    def record(self, record: Dict[str, Any]):
+        """
+        Add one finished job
+
+        Understood keys: 'state', 'duration', 'bytes', 'attempts',
+        'retries', 'strategy', 'blocked', 'probe_cache', 'cookie_cache' and
+        'timings' (phase -> seconds); everything is written to the JSON lines.
+        """
+        record = dict(record, ts=time.time())
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.write(json.dumps(record, default=str) + '\n')
+                self._jsonl.flush()
+            state = record.get('state') or 'unknown'
+            self._jobs[state] = self._jobs.get(state, 0) + 1
+            if record.get('duration') is not None:
+                self._duration.observe(record['duration'])
+            for phase, seconds in (record.get('timings') or {}).items():
+                histogram = self._phases.get(phase)
+                if histogram is None:
+                    histogram = self._phases[phase] = Histogram(self.buckets)
+                histogram.observe(seconds)
+            self._bytes += record.get('bytes') or 0
+            self._retries += record.get('retries') or 0
+            self._attempts += record.get('attempts') or 0
+            if record.get('strategy'):
+                self._fallbacks[record['strategy']] = self._fallbacks.get(record['strategy'], 0) + 1
+            if record.get('blocked'):
+                self._blocks[record['blocked']] = self._blocks.get(record['blocked'], 0) + 1
+            for cache in ('probe', 'cookie'):
+                result = record.get(f'{cache}_cache')
+                if result:
+                    self._caches[(cache, result)] = self._caches.get((cache, result), 0) + 1
+            text = self._render() if self.prometheus_path else None
+        if text is not None:
+            self._write_prometheus(text)
+
+    def prometheus_text(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """
+        Counters and histograms in the Prometheus text format
+
+        Args:
+            gauges: Extra current values (name without prefix -> value),
+                    e.g. queued jobs
+        """
+        with self._lock:
+            return self._render(gauges)
+
+    def summary(self) -> Dict[str, Any]:
+        """Job counts and total/mean seconds per phase"""
+        with self._lock:
+            return {
+                'jobs': dict(self._jobs),
+                'bytes': self._bytes,
+                'retries': self._retries,
+                'phases': {phase: {'count': h.count, 'seconds': h.sum,
+                                   'mean': h.sum / h.count if h.count else 0.0}
+                           for phase, h in self._phases.items()},
+            }
+
+    def close(self):
+        """Close the JSON-lines file"""
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+
+    def _render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Build the exposition text (lock held)"""
+        p = self.prefix
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples):
+            lines.append(f'# HELP {p}_{name} {help_text}')
+            lines.append(f'# TYPE {p}_{name} {kind}')
+            for suffix, labels, value in samples:
+                lines.append(f'{p}_{name}{suffix}{_labels(labels)} {_number(value)}')
+
+        def histogram_samples(histogram: Histogram, labels: Dict[str, Any]):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                yield '_bucket', dict(labels, le=f'{bound:g}'), count
+            yield '_bucket', dict(labels, le='+Inf'), histogram.count
+            yield '_sum', labels, histogram.sum
+            yield '_count', labels, histogram.count
+
+        metric('jobs_total', 'counter', 'Finished jobs by final state',
+               [('', {'state': state}, count) for state, count in sorted(self._jobs.items())])
+        metric('job_duration_seconds', 'histogram', 'Wall-clock time of the last attempt of a job',
+               histogram_samples(self._duration, {}))
+        metric('phase_seconds', 'histogram', 'Time spent per job in each phase',
+               [sample for phase, histogram in sorted(self._phases.items())
+                for sample in histogram_samples(histogram, {'phase': phase})])
+        metric('downloaded_bytes_total', 'counter', 'Bytes downloaded by finished jobs',
+               [('', {}, self._bytes)])
+        metric('attempts_total', 'counter', 'Attempts of finished jobs, including requeues',
+               [('', {}, self._attempts)])
+        metric('ytdlp_retries_total', 'counter', 'Retries yt-dlp made inside a run',
+               [('', {}, self._retries)])
+        metric('fallbacks_total', 'counter', 'Jobs that succeeded with a fallback strategy',
+               [('', {'strategy': name}, count) for name, count in sorted(self._fallbacks.items())])
+        metric('blocked_jobs_total', 'counter', 'Jobs that ended blocked, by reason',
+               [('', {'reason': reason}, count) for reason, count in sorted(self._blocks.items())])
+        metric('cache_lookups_total', 'counter', 'Probe and cookie cache results',
+               [('', {'cache': cache, 'result': result}, count)
+                for (cache, result), count in sorted(self._caches.items())])
+        for name, value in sorted((gauges or {}).items()):
+            metric(name, 'gauge', name.replace('_', ' ').capitalize(), [('', {}, value)])
+        return '\n'.join(lines) + '\n'
+
+    def _write_prometheus(self, text: str):
+        """Replace the textfile atomically so scrapers never see half a file"""
+        temp_path = f'{self.prometheus_path}.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(temp_path, self.prometheus_path)
+        except OSError:
+            pass
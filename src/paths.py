@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+"""
+Per-user file locations
+Keeps every persistent file next to .youtube_downloader_config.json
+"""
+
+from pathlib import Path
+
+
+def user_file(name: str) -> Path:
+    """Path of a per-user file, e.g. user_file('config.json')"""
+    return Path.home() / f".youtube_downloader_{name}"
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""
+Staged download pipeline
+Overlaps network fetches with ffmpeg merge, cut and transcode work across many videos
+"""
+
+import itertools
+import os
+import queue
+import threading
+import time
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+try:
+    from .archive import clip_key
+    from .clipper import MODE_AUTO, ClipExtractor
+    from .cookie_cache import CookieJarCache
+    from .downloader import YouTubeDownloader
+    from .governor import RateGovernor
+    from .metrics import MetricsRecorder
+    from .runner import StreamingProcess
+    from .scheduler import ResourceScheduler
+except ImportError:
+    from archive import clip_key
+    from clipper import MODE_AUTO, ClipExtractor
+    from cookie_cache import CookieJarCache
+    from downloader import YouTubeDownloader
+    from governor import RateGovernor
+    from metrics import MetricsRecorder
+    from runner import StreamingProcess
+    from scheduler import ResourceScheduler
+
+
+STAGE_FETCH = 'fetch'
+STAGE_MERGE = 'merge'
+STAGE_CUT = 'cut'
+STAGE_TRANSCODE = 'transcode'
+STAGES = (STAGE_FETCH, STAGE_MERGE, STAGE_CUT, STAGE_TRANSCODE)
+CPU_STAGES = (STAGE_MERGE, STAGE_CUT, STAGE_TRANSCODE)
+
+# Output extension and ffmpeg arguments per 'transcode' option
+TRANSCODE_PRESETS: Dict[str, Tuple[str, List[str]]] = {
+    'h264': ('.mp4', ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+                      '-c:a', 'aac', '-movflags', '+faststart']),
+    'mp3': ('.mp3', ['-vn', '-c:a', 'libmp3lame', '-q:a', '2']),
+}
+
+
+def _stream_stem(path: str, format_ids: List[str]) -> Optional[str]:
+    """
+    "title.f137.mp4" -> "title" if 137 is a format the job downloaded
+
+    Only the formats yt-dlp reported count, so a title such as
+    "Intro.final.mp4" is never taken for an unmerged stream.
+    """
+    stem = os.path.splitext(path)[0]
+    for format_id in format_ids:
+        if stem.endswith(f'.f{format_id}'):
+            return stem[:-len(format_id) - 2]
+    return None
+
+
+class PipelineJob:
+    """One video travelling through the stages"""
+
+    def __init__(self, job_id: int, url: str, options: Dict[str, Any]):
+        self.job_id = job_id
+        self.url = url
+        self.options = options
+        self.stage = STAGE_FETCH
+        self.state = 'queued'
+        self.files: List[str] = []
+        self.filepaths: List[str] = []
+        self.error: Optional[str] = None
+        self.archived = False
+        self.timings: Dict[str, float] = {}
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.is_cancelled = False
+        self._done = threading.Event()
+        self._process: Optional[StreamingProcess] = None
+        self._downloader: Optional[YouTubeDownloader] = None
+        self._clipper: Optional[ClipExtractor] = None
+        self._archive = None
+        self._fetch_result: Dict[str, Any] = {}
+
+    def cancel(self):
+        """Stop whatever the job is running right now"""
+        self.is_cancelled = True
+        for worker in (self._downloader, self._process, self._clipper):
+            if worker is None:
+                continue
+            if isinstance(worker, YouTubeDownloader):
+                worker.cancel_download()
+            else:
+                worker.cancel()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job left the pipeline"""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly snapshot of the job"""
+        return {
+            'id': self.job_id,
+            'url': self.url,
+            'state': self.state,
+            'stage': self.stage,
+            'filepath': self.filepaths[-1] if self.filepaths else None,
+            'filepaths': self.filepaths,
+            'error': self.error,
+            'archived': self.archived,
+            'timings': dict(self.timings),
+        }
+
+
+class Pipeline:
+    """
+    Download many videos with fetching and ffmpeg work overlapped
+
+    Fetch workers only transfer data: yt-dlp saves video and audio as
+    separate files (merge=False) and the job moves on to the merge, cut
+    and transcode stages, which share the scheduler's CPU slots (one per
+    core by default). Stages are joined by bounded queues, so fetching
+    pauses when the CPU side falls behind instead of filling the disk
+    with unmerged streams. For a batch, the total time approaches the
+    larger of network and CPU time instead of their sum.
+    """
+
+    def __init__(self, fetch_workers: int = 3, cpu_workers: Optional[int] = None,
+                 downloader_factory: Optional[Callable[[], YouTubeDownloader]] = None,
+                 ffmpeg_path: str = 'ffmpeg', queue_size: Optional[int] = None,
+                 scheduler: Optional[ResourceScheduler] = None,
+                 governor: Optional[RateGovernor] = None,
+                 cookie_cache: Optional[CookieJarCache] = None,
+                 metrics: Optional[MetricsRecorder] = None,
+                 on_job_update: Optional[Callable[[PipelineJob], None]] = None):
+        """
+        Args:
+            fetch_workers: Parallel downloads
+            cpu_workers: Parallel ffmpeg processes (default: the scheduler's
+                         CPU slots, i.e. the core count)
+            downloader_factory: Creates the downloader of each fetch worker
+            ffmpeg_path: ffmpeg executable for merging and transcoding
+            queue_size: Jobs that may wait between two stages (default: 2 per CPU worker)
+            scheduler: Shared bandwidth, disk and slot limits
+            governor: Shared request pacing and block backoff
+            cookie_cache: Browser cookies shared by the fetch workers
+            metrics: Records every finished job with the download's phases
+                     and the time of each CPU stage
+            on_job_update: Called on every stage change, from worker threads
+        """
+        self.scheduler = scheduler or ResourceScheduler(network_slots=fetch_workers,
+                                                        cpu_slots=cpu_workers)
+        self.governor = governor or RateGovernor()
+        self.cookie_cache = cookie_cache or CookieJarCache()
+        self.metrics = metrics
+        self.fetch_workers = max(1, int(fetch_workers))
+        self.cpu_workers = max(1, int(cpu_workers or self.scheduler.cpu_slots))
+        self.downloader_factory = downloader_factory or YouTubeDownloader
+        self.ffmpeg_path = ffmpeg_path
+        self.on_job_update = on_job_update
+        queue_size = queue_size or 2 * self.cpu_workers
+
+        self._queues: Dict[str, "queue.Queue[Optional[PipelineJob]]"] = {
+            STAGE_FETCH: queue.Queue(),
+        }
+        for stage in CPU_STAGES:
+            self._queues[stage] = queue.Queue(maxsize=queue_size)
+        self._jobs: Dict[int, PipelineJob] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._unfinished = 0
+        self._busy = {stage: 0.0 for stage in STAGES}
+        self._processed = {stage: 0 for stage in STAGES}
+        self._started_at: Optional[float] = None
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        self._start_threads()
+
+    def submit(self, url: str, options: Optional[Dict[str, Any]] = None) -> PipelineJob:
+        """
+        Queue one video
+
+        Options are the same as YouTubeDownloader.download() (without
+        'sections'), plus:
+            - clips: (start, end) minute ranges cut from the merged video
+            - clip_mode: 'auto', 'copy' or 'reencode', see ClipExtractor
+            - transcode: a TRANSCODE_PRESETS name applied to every output
+        """
+        options = dict(options or {})
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Pipeline has been shut down')
+            job = PipelineJob(next(self._ids), url, options)
+            self._jobs[job.job_id] = job
+            self._unfinished += 1
+            if self._started_at is None:
+                self._started_at = time.time()
+        self._queues[STAGE_FETCH].put(job)
+        self._notify(job)
+        return job
+
+    def run(self, urls: List[str], options: Optional[Dict[str, Any]] = None) -> List[PipelineJob]:
+        """Submit every URL and wait for all of them"""
+        jobs = [self.submit(url, options) for url in urls]
+        self.wait()
+        return jobs
+
+    def jobs(self) -> List[PipelineJob]:
+        """All jobs in submission order"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every submitted job finished; returns False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def cancel_all(self):
+        """Cancel every job that has not finished"""
+        for job in self.jobs():
+            if job.state not in ('done', 'failed', 'cancelled'):
+                job.cancel()
+
+    def shutdown(self, wait: bool = True, cancel: bool = False):
+        """Stop the stage threads once the queued jobs are through"""
+        if cancel:
+            self.cancel_all()
+        with self._lock:
+            self._closed = True
+        if wait:
+            self.wait()
+        # Jobs only flow forward, so by now every stage has drained
+        for stage in STAGES:
+            workers = self.fetch_workers if stage == STAGE_FETCH else self.cpu_workers
+            for _ in range(workers):
+                self._queues[stage].put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-stage busy time, and how much of it overlapped"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+            busy = dict(self._busy)
+            processed = dict(self._processed)
+            started_at = self._started_at
+        states: Dict[str, int] = {}
+        for job in jobs:
+            states[job.state] = states.get(job.state, 0) + 1
+        finished = [job.finished_at for job in jobs if job.finished_at]
+        end = max(finished) if finished and len(finished) == len(jobs) else time.time()
+        elapsed = end - started_at if started_at else 0.0
+        network = busy[STAGE_FETCH] / self.fetch_workers
+        cpu = sum(busy[stage] for stage in CPU_STAGES) / self.cpu_workers
+        return {
+            'total': len(jobs),
+            'states': states,
+            'elapsed': elapsed,
+            'busy_seconds': busy,
+            'processed': processed,
+            'queued': {stage: self._queues[stage].qsize() for stage in STAGES},
+            # Wall time each side would need on its own with these workers
+            'network_seconds': network,
+            'cpu_seconds': cpu,
+            'overlap': (network + cpu) / elapsed if elapsed else 0.0,
+        }
+
+    def _start_threads(self):
+        """One thread per fetch worker, and one per CPU worker for each CPU stage"""
+        handlers = {
+            STAGE_FETCH: self._fetch,
+            STAGE_MERGE: self._merge,
+            STAGE_CUT: self._cut,
+            STAGE_TRANSCODE: self._transcode,
+        }
+        for stage in STAGES:
+            workers = self.fetch_workers if stage == STAGE_FETCH else self.cpu_workers
+            for n in range(workers):
+                thread = threading.Thread(target=self._stage_loop, args=(stage, handlers[stage]),
+                                          name=f'pipeline-{stage}-{n + 1}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def _stage_loop(self, stage: str,
+                    handler: Callable[[PipelineJob, Dict[str, Any]], Optional[str]]):
+        """Take jobs from a stage queue, run the handler and pass them on"""
+        context: Dict[str, Any] = {}
+        while True:
+            job = self._queues[stage].get()
+            if job is None:
+                downloader = context.get('downloader')
+                if downloader is not None:
+                    downloader.close()
+                return
+            if job.is_cancelled:
+                self._finish(job, 'cancelled', 'Cancelled')
+                continue
+            job.stage = stage
+            job.state = 'running'
+            self._notify(job)
+            started = time.time()
+            try:
+                next_stage = handler(job, context)
+            except Exception as e:
+                job.error = f'{stage} failed: {e}'
+                next_stage = None
+            elapsed = time.time() - started
+            job.timings[stage] = job.timings.get(stage, 0.0) + elapsed
+            with self._lock:
+                self._busy[stage] += elapsed
+                self._processed[stage] += 1
+            if job.is_cancelled:
+                self._finish(job, 'cancelled', 'Cancelled')
+            elif job.error:
+                self._finish(job, 'failed', job.error)
+            elif next_stage is None:
+                self._finish(job, 'done')
+            else:
+                # Blocks while the next stage is full; that is the backpressure
+                job.state = 'queued'
+                self._queues[next_stage].put(job)
+
+    def _next_stage(self, job: PipelineJob, after: str) -> Optional[str]:
+        """Stage a job goes to after `after`, or None when it is finished"""
+        order = [STAGE_MERGE]
+        if job.options.get('clips'):
+            order.append(STAGE_CUT)
+        if job.options.get('transcode'):
+            order.append(STAGE_TRANSCODE)
+        following = order[order.index(after) + 1:] if after in order else order
+        return following[0] if following else None
+
+    def _fetch(self, job: PipelineJob, context: Dict[str, Any]) -> Optional[str]:
+        """Network stage: download the streams without merging them"""
+        downloader = context.get('downloader')
+        if downloader is None:
+            downloader = context['downloader'] = self.downloader_factory()
+            downloader.governor = self.governor
+            downloader.scheduler = self.scheduler
+            downloader.cookie_cache = self.cookie_cache
+        options = {k: v for k, v in job.options.items()
+                   if k not in ('sections', 'start_time', 'end_time', 'clips', 'clip_mode',
+                                'transcode')}
+        options['merge'] = False
+        if job.options.get('transcode'):
+            # The archive only knows untouched downloads
+            options['ignore_archive'] = True
+        log_callback = options.get('log_callback')
+        if log_callback:
+            options['log_callback'] = lambda msg, n=job.job_id: log_callback(f"[job {n}] {msg}")
+        job._downloader = downloader
+        job._archive = downloader.archive
+        try:
+            result = downloader.download(job.url, options)
+        finally:
+            job._downloader = None
+        job._fetch_result = result
+        if not result.get('success'):
+            job.error = result.get('error', 'Download failed')
+            return None
+        # Both selections fall back to one combined file when there are no separate streams
+        job.files = list(dict.fromkeys(result.get('filepaths') or [result['filepath']]))
+        job.archived = bool(result.get('archived'))
+        return self._next_stage(job, STAGE_FETCH)
+
+    def _merge(self, job: PipelineJob, context: Dict[str, Any]) -> Optional[str]:
+        """CPU stage: mux video and audio into one mp4 (stream copy)"""
+        files = [f for f in job.files if os.path.isfile(f)]
+        if not files:
+            job.error = 'Downloaded files are missing'
+            return None
+        format_ids = job._fetch_result.get('format_ids') or []
+        stem = _stream_stem(files[0], format_ids)
+        if job.archived or stem is None:
+            # Archived (never renamed) or already a single finished file
+            job.filepaths = files
+            return self._next_stage(job, STAGE_MERGE)
+        if len(files) == 1:
+            output = stem + os.path.splitext(files[0])[1]
+            os.replace(files[0], output)
+        else:
+            output = stem + '.mp4'
+            args = []
+            for path in files:
+                args.extend(['-i', path])
+            args.extend(['-map', '0:v:0?', '-map', '1:a:0?', '-c', 'copy',
+                         '-movflags', '+faststart'])
+            if not self._ffmpeg(job, args, output):
+                return None
+            for path in files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        job.filepaths = [output]
+        if not job.options.get('clips') and not job.options.get('transcode'):
+            self._archive(job, output, '')
+        return self._next_stage(job, STAGE_MERGE)
+
+    def _cut(self, job: PipelineJob, context: Dict[str, Any]) -> Optional[str]:
+        """CPU stage: cut the requested clips out of the merged file"""
+        clips = [(float(start), float(end) if end else None) for start, end in job.options['clips']]
+        source = job.filepaths[0]
+        job._clipper = ClipExtractor(self.ffmpeg_path, max_workers=len(clips),
+                                     scheduler=self.scheduler)
+        try:
+            results = job._clipper.extract(source, clips, job.options.get('output_path'),
+                                           job.options.get('clip_mode', MODE_AUTO))
+        finally:
+            job._clipper = None
+        failed = [r for r in results if not r['success']]
+        if failed:
+            job.error = (f"{len(failed)} of {len(results)} clips failed: "
+                         f"{failed[0].get('error', '')}")
+            return None
+        job.filepaths = [r['filepath'] for r in results]
+        if not job.options.get('transcode'):
+            for r in results:
+                self._archive(job, r['filepath'], clip_key(r['start'], r['end']))
+        return self._next_stage(job, STAGE_CUT)
+
+    def _transcode(self, job: PipelineJob, context: Dict[str, Any]) -> Optional[str]:
+        """CPU stage: re-encode every output with a preset"""
+        preset = job.options['transcode']
+        if preset not in TRANSCODE_PRESETS:
+            job.error = (f"Unknown transcode preset '{preset}', "
+                         f"expected one of {sorted(TRANSCODE_PRESETS)}")
+            return None
+        ext, codec_args = TRANSCODE_PRESETS[preset]
+        outputs = []
+        for source in job.filepaths:
+            stem = os.path.splitext(source)[0]
+            output = stem + ext
+            # Same name: write next to it first, then replace the source
+            target = f'{stem}.{preset}{ext}' if output == source else output
+            if not self._ffmpeg(job, ['-i', source] + codec_args, target):
+                return None
+            if target != output:
+                os.replace(target, output)
+            else:
+                os.remove(source)
+            outputs.append(output)
+        job.filepaths = outputs
+        return self._next_stage(job, STAGE_TRANSCODE)
+
+    def _ffmpeg(self, job: PipelineJob, args: List[str], output: str) -> bool:
+        """Run ffmpeg on a CPU slot; sets job.error and returns False on failure"""
+        lease = self.scheduler.cpu(lambda: job.is_cancelled)
+        if lease is None:
+            return False
+        cmd = ([self.ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y']
+               + args + [output])
+        process = StreamingProcess(cmd, tail_lines=20)
+        job._process = process
+        try:
+            returncode = process.run(lambda line: None)
+        finally:
+            job._process = None
+            lease.release()
+        if returncode != 0 and not job.is_cancelled:
+            job.error = f'ffmpeg failed: {process.output[-300:]}'
+            try:
+                os.remove(output)
+            except OSError:
+                pass
+        return returncode == 0
+
+    def _archive(self, job: PipelineJob, filepath: str, clip: str):
+        """Record a finished output in the fetch downloader's archive"""
+        if job._archive is None or job.archived:
+            return
+        try:
+            job._archive.record(job.url, filepath, job.options.get('quality', 'best'), clip)
+        except OSError:
+            pass
+
+    def _finish(self, job: PipelineJob, state: str, error: Optional[str] = None):
+        """Take a job out of the pipeline"""
+        job.state = state
+        job.error = error
+        job.finished_at = time.time()
+        if self.metrics is not None:
+            try:
+                self.metrics.record(self._metrics_record(job))
+            except Exception:
+                pass
+        self._notify(job)
+        job._done.set()
+        with self._idle:
+            self._unfinished -= 1
+            self._idle.notify_all()
+
+    @staticmethod
+    def _metrics_record(job: PipelineJob) -> Dict[str, Any]:
+        """Flat record of a finished job: download phases plus CPU stage times"""
+        result = job._fetch_result
+        record = job.to_dict()
+        record['duration'] = sum(job.timings.values())
+        record['bytes'] = result.get('downloaded_bytes') or 0
+        for key in ('average_speed', 'peak_speed', 'retries', 'strategy', 'blocked', 'probe_cache',
+                    'cookie_cache'):
+            if result.get(key) is not None:
+                record[key] = result[key]
+        timings = dict(result.get('timings') or {})
+        timings.update((stage, seconds) for stage, seconds in job.timings.items()
+                       if stage != STAGE_FETCH)
+        record['timings'] = timings
+        return record
+
+    def _notify(self, job: PipelineJob):
+        """Forward a job change to the listener, ignoring its errors"""
+        if self.on_job_update:
+            try:
+                self.on_job_update(job)
+            except Exception:
+                pass
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Playlist and channel expansion
+Lists collection entries lazily with yt-dlp --flat-playlist and yields them as they arrive
+"""
+
+import json
+import re
+from typing import Optional, Dict, Any, Iterable, Iterator
+
+try:
+    from .runner import StreamingProcess
+    from .urls import video_key
+except ImportError:
+    from runner import StreamingProcess
+    from urls import video_key
+
+
+# Links that name a collection rather than a single video
+_COLLECTION_RE = re.compile(
+    r'^https?://(?:www\.|m\.)?youtube\.com/'
+    r'(?:playlist\?|channel/|c/|user/|@[\w.-]+)'
+)
+
+# ie_key yt-dlp uses for channel tabs and playlists inside a flat listing
+_NESTED_IE_KEYS = ('YoutubeTab', 'YoutubePlaylist')
+
+
+def is_collection_url(url: str) -> bool:
+    """True for playlist and channel links (a watch?v=...&list=... link is one video)"""
+    return bool(_COLLECTION_RE.match(url.strip()))
+
+
+def parse_flat_entry(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Turn one line of `yt-dlp --flat-playlist -j` output into an entry
+
+    Returns:
+        Dict with 'url', 'id', 'title', 'index', 'duration' and 'nested'
+        (True for channel tabs / sub-playlists), or None for non-JSON lines
+    """
+    line = line.strip()
+    if not line.startswith('{'):
+        return None
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    url = data.get('url') or data.get('webpage_url')
+    if not url:
+        return None
+    if not url.startswith(('http://', 'https://')) and data.get('ie_key') == 'Youtube':
+        url = f'https://www.youtube.com/watch?v={url}'
+    return {
+        'url': url,
+        'id': data.get('id'),
+        'title': data.get('title'),
+        'index': data.get('playlist_index'),
+        'duration': data.get('duration'),
+        'nested': data.get('ie_key') in _NESTED_IE_KEYS or is_collection_url(url),
+    }
+
+
+class PlaylistExpander:
+    """
+    Lazy enumeration of playlist and channel entries
+
+    yt-dlp pages through the collection with --lazy-playlist and prints
+    one JSON line per entry, which is parsed and yielded immediately, so
+    the first video can start downloading while a long channel is still
+    being listed. Entries already seen in this listing or present in the
+    download archive are skipped. Closing the generator stops yt-dlp.
+    """
+
+    def __init__(self, ytdlp_path: str = 'yt-dlp', archive=None, format_key: str = 'best',
+                 clip: str = '', cookies_browser: Optional[str] = None, max_depth: int = 2,
+                 cookie_cache=None):
+        """
+        Args:
+            ytdlp_path: yt-dlp executable
+            archive: DownloadArchive to skip finished videos, or None
+            format_key: Quality preset the archive is checked against
+            clip: Clip range key the archive is checked against
+            cookies_browser: Browser to take cookies from (private playlists)
+            max_depth: How deep channel tabs / nested playlists are followed
+            cookie_cache: CookieJarCache to take the browser cookies from
+                          instead of reading the browser for every listing
+        """
+        self.ytdlp_path = ytdlp_path
+        self.archive = archive
+        self.format_key = format_key
+        self.clip = clip
+        self.cookies_browser = cookies_browser
+        self.max_depth = max_depth
+        self.cookie_cache = cookie_cache
+        self._cookie_file: Optional[str] = None
+        self.listed = 0
+        self.duplicates = 0
+        self.archived = 0
+        self.error: Optional[str] = None
+        self._seen = set()
+        self._process: Optional[StreamingProcess] = None
+        self.is_cancelled = False
+
+    def exclude(self, urls: Iterable[str]):
+        """Treat these links as already listed, e.g. videos queued by other means"""
+        for url in urls:
+            self._seen.add(video_key(url))
+
+    def expand(self, url: str, log_callback=None) -> Iterator[Dict[str, Any]]:
+        """Yield new video entries of a playlist or channel as yt-dlp lists them"""
+        log_callback = log_callback or (lambda x: None)
+        self.is_cancelled = False
+        if self.cookies_browser and self.cookie_cache is not None:
+            self._cookie_file = self.cookie_cache.checkout(self.cookies_browser, self.ytdlp_path,
+                                                           log_callback)[0]
+        try:
+            yield from self._expand(url, 0, log_callback)
+        finally:
+            if self._cookie_file:
+                self.cookie_cache.checkin(self._cookie_file)
+                self._cookie_file = None
+
+    def expand_lines(self, lines: Iterable[str], log_callback=None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield new entries from already captured --flat-playlist -j output
+
+        Useful for replaying recorded listings offline; nested entries are
+        yielded as-is instead of being listed.
+        """
+        log_callback = log_callback or (lambda x: None)
+        for line in lines:
+            entry = parse_flat_entry(line)
+            if entry is not None and (entry['nested'] or self._is_new(entry, log_callback)):
+                yield entry
+
+    def _expand(self, url: str, depth: int, log_callback) -> Iterator[Dict[str, Any]]:
+        """List one collection, descending into tabs and sub-playlists"""
+        process = StreamingProcess(self._command(url), tail_lines=20)
+        self._process = process
+        for line in process.iter_lines():
+            if self.is_cancelled:
+                break
+            entry = parse_flat_entry(line)
+            if entry is None:
+                if line.startswith('ERROR'):
+                    log_callback(line)
+                continue
+            if entry['nested']:
+                if depth < self.max_depth and entry['url'] != url:
+                    log_callback(f"Listing {entry['title'] or entry['url']}")
+                    yield from self._expand(entry['url'], depth + 1, log_callback)
+                continue
+            if self._is_new(entry, log_callback):
+                yield entry
+        if process.returncode and not self.is_cancelled and depth == 0:
+            self.error = process.error_output[-500:]
+            log_callback(f"Listing ended with errors ({self.listed} entries found)")
+
+    def _is_new(self, entry: Dict[str, Any], log_callback) -> bool:
+        """Count an entry and check it against this listing and the archive"""
+        self.listed += 1
+        key = video_key(entry['url'])
+        if key in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen.add(key)
+        if self.archive is not None and self.archive.lookup(key, self.format_key, self.clip):
+            self.archived += 1
+            log_callback(f"Already downloaded: {entry['title'] or entry['url']}")
+            return False
+        return True
+
+    def _command(self, url: str):
+        """yt-dlp command that prints one JSON line per entry without resolving videos"""
+        cmd = [
+            self.ytdlp_path,
+            '--flat-playlist',
+            '--lazy-playlist',
+            '--dump-json',
+            '--ignore-errors',
+            '--no-warnings',
+            '--socket-timeout', '30',
+        ]
+        if self._cookie_file:
+            cmd.extend(['--cookies', self._cookie_file])
+        elif self.cookies_browser:
+            cmd.extend(['--cookies-from-browser', self.cookies_browser])
+        cmd.append(url)
+        return cmd
+
+    def cancel(self):
+        """Stop listing; the generator ends at the next entry"""
+        self.is_cancelled = True
+        process = self._process
+        if process is not None:
+            process.cancel(grace=0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry counters of the listing so far"""
+        return {
+            'listed': self.listed,
+            'new': self.listed - self.duplicates - self.archived,
+            'duplicates': self.duplicates,
+            'archived': self.archived,
+        }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Metadata probe cache
+Stores yt-dlp's extracted info JSON in SQLite so repeat downloads skip extraction
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Optional, Dict, Any, Union
+
+try:
+    from .paths import user_file
+except ImportError:
+    from paths import user_file
+
+
+# Signed googlevideo URLs carry their expiry as ?expire=<ts> or /expire/<ts>/
+_EXPIRE_RE = re.compile(r'[?&/]expire[=/](\d{9,})')
+
+
+def stream_expiry(info: Dict[str, Any]) -> Optional[float]:
+    """Earliest expiry timestamp of the signed stream URLs in an info dict"""
+    expiries = []
+    formats = list(info.get('formats') or [])
+    formats.extend(info.get('requested_formats') or [])
+    for fmt in formats:
+        for key in ('url', 'manifest_url', 'fragment_base_url'):
+            match = _EXPIRE_RE.search(fmt.get(key) or '')
+            if match:
+                expiries.append(float(match.group(1)))
+    return min(expiries) if expiries else None
+
+
+class ProbeCache:
+    """
+    On-disk cache of extracted video info, keyed by video ID
+
+    Entries expire after `ttl` seconds, or earlier when the signed stream
+    URLs inside them are about to expire. When the cache grows past
+    `max_entries` or `max_bytes`, the least recently used entries are
+    evicted. Safe to share between threads.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, ttl: float = 6 * 3600,
+                 max_entries: int = 1000, max_bytes: int = 256 * 1024 * 1024,
+                 expiry_margin: float = 600):
+        self.path = str(path or user_file('probe_cache.db'))
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.expiry_margin = expiry_margin
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS probes ('
+            ' key TEXT PRIMARY KEY,'
+            ' info BLOB NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' expires REAL NOT NULL,'
+            ' last_used REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS probes_last_used ON probes (last_used)')
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return cached info for a key, or None if missing or stale"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT info, expires FROM probes WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if row[1] <= now:
+                self._db.execute('DELETE FROM probes WHERE key = ?', (key,))
+                self._db.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE probes SET last_used = ? WHERE key = ?', (now, key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, info: Dict[str, Any]):
+        """Store info for a key and evict old entries if over budget"""
+        now = time.time()
+        expires = now + self.ttl
+        stream_expires = stream_expiry(info)
+        if stream_expires is not None:
+            expires = min(expires, stream_expires - self.expiry_margin)
+        if expires <= now:
+            return
+        blob = zlib.compress(json.dumps(info).encode('utf-8'))
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO probes (key, info, size, created, expires, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, blob, len(blob), now, expires, now)
+            )
+            self._evict()
+            self._db.commit()
+
+    def invalidate(self, key: str):
+        """Drop a cached entry, e.g. after its stream URLs were rejected"""
+        with self._lock:
+            self._db.execute('DELETE FROM probes WHERE key = ?', (key,))
+            self._db.commit()
+
+    def _evict(self):
+        """Remove expired entries, then least recently used ones (lock held)"""
+        self._db.execute('DELETE FROM probes WHERE expires <= ?', (time.time(),))
+        count, total = self._db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM probes'
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = self._db.execute('SELECT key, size FROM probes ORDER BY last_used').fetchall()
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM probes WHERE key = ?', (key,))
+            count -= 1
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            count, total = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM probes'
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': count,
+            'bytes': total,
+        }
+
+    def close(self):
+        """Close the database"""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Progress parsing for yt-dlp output
+Turns --progress-template / --newline lines into structured progress events
+and picks up the file sizes and final paths reported with --print
+"""
+
+import re
+import time
+from typing import Optional, Dict, Any, List
+
+
+# Marker prefixed to every progress line so it never collides with log output
+PROGRESS_MARKER = '__YTD_PROGRESS__'
+
+# Fields are space separated; yt-dlp prints NA for unknown values
+PROGRESS_TEMPLATE = (
+    'download:' + PROGRESS_MARKER +
+    ' %(progress.status)s'
+    ' %(progress.downloaded_bytes)s'
+    ' %(progress.total_bytes)s'
+    ' %(progress.total_bytes_estimate)s'
+    ' %(progress.speed)s'
+    ' %(progress.eta)s'
+)
+
+# Printed once the file reached its final location (after merging/moving)
+FILEPATH_MARKER = '__YTD_FILEPATH__'
+FILEPATH_TEMPLATE = 'after_move:' + FILEPATH_MARKER + ' %(filepath)s'
+
+# Printed with the final path: the format ID(s) in the file, e.g. 137 or 137+140
+FORMAT_MARKER = '__YTD_FORMAT__'
+FORMAT_TEMPLATE = 'after_move:' + FORMAT_MARKER + ' %(format_id)s'
+
+# Printed before downloading: size of the complete (unclipped) media
+SIZE_MARKER = '__YTD_SIZE__'
+SIZE_TEMPLATE = 'before_dl:' + SIZE_MARKER + ' %(filesize,filesize_approx)s'
+
+_UNITS = {
+    'B': 1, 'KIB': 1024, 'MIB': 1024 ** 2, 'GIB': 1024 ** 3, 'TIB': 1024 ** 4,
+    'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3, 'TB': 1000 ** 4,
+}
+
+# Default human readable progress, e.g.
+# [download]  12.3% of ~ 45.67MiB at  1.23MiB/s ETA 00:12 (frag 3/40)
+_DEFAULT_PROGRESS = re.compile(
+    r'^\[download\]\s+(?P<percent>[\d.]+)%\s+of\s+~?\s*(?P<total>[\d.]+\s*[KMGT]?i?B)'
+    r'(?:\s+at\s+(?P<speed>[\d.]+\s*[KMGT]?i?B)/s)?'
+    r'(?:\s+ETA\s+(?P<eta>[\d:]+))?'
+)
+
+
+def _to_float(value: str) -> Optional[float]:
+    """Parse a template field, returning None for NA"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_size(text: str) -> Optional[float]:
+    """Parse sizes like '45.67MiB' into bytes"""
+    match = re.match(r'([\d.]+)\s*([KMGT]?i?B)', text.strip(), re.IGNORECASE)
+    if not match:
+        return None
+    return float(match.group(1)) * _UNITS.get(match.group(2).upper(), 1)
+
+
+def _parse_eta(text: str) -> Optional[float]:
+    """Parse 'HH:MM:SS' / 'MM:SS' into seconds"""
+    seconds = 0
+    try:
+        for part in text.split(':'):
+            seconds = seconds * 60 + int(part)
+    except ValueError:
+        return None
+    return float(seconds)
+
+
+def make_event(status: str, downloaded: Optional[float], total: Optional[float],
+               speed: Optional[float], eta: Optional[float]) -> Dict[str, Any]:
+    """
+    Build a progress event
+
+    Keys mirror yt-dlp's progress hook dictionaries so both the CLI and
+    in-process code paths produce the same events.
+    """
+    percent = None
+    if downloaded is not None and total:
+        percent = min(100.0, downloaded * 100.0 / total)
+    return {
+        'status': status,
+        'downloaded_bytes': int(downloaded) if downloaded is not None else None,
+        'total_bytes': int(total) if total else None,
+        'speed': speed,
+        'eta': eta,
+        'percent': percent,
+    }
+
+
+def parse_progress_line(line: str) -> Optional[Dict[str, Any]]:
+    """Return a progress event for a progress line, or None for any other line"""
+    line = line.strip()
+    if line.startswith(PROGRESS_MARKER):
+        fields = line[len(PROGRESS_MARKER):].split()
+        if len(fields) < 6:
+            return None
+        status, downloaded, total, estimate, speed, eta = fields[:6]
+        total_bytes = _to_float(total) or _to_float(estimate)
+        return make_event(status, _to_float(downloaded), total_bytes,
+                          _to_float(speed), _to_float(eta))
+
+    match = _DEFAULT_PROGRESS.match(line)
+    if match:
+        total = _parse_size(match.group('total'))
+        percent = float(match.group('percent'))
+        downloaded = total * percent / 100.0 if total else None
+        speed = _parse_size(match.group('speed')) if match.group('speed') else None
+        eta = _parse_eta(match.group('eta')) if match.group('eta') else None
+        status = 'finished' if percent >= 100.0 else 'downloading'
+        return make_event(status, downloaded, total, speed, eta)
+    return None
+
+
+def parse_filepath_line(line: str) -> Optional[str]:
+    """Return the path from a FILEPATH_TEMPLATE line, or None for any other line"""
+    line = line.strip()
+    if line.startswith(FILEPATH_MARKER):
+        path = line[len(FILEPATH_MARKER):].strip()
+        return path if path and path != 'NA' else None
+    return None
+
+
+def parse_format_line(line: str) -> Optional[List[str]]:
+    """Return the format IDs from a FORMAT_TEMPLATE line, or None for any other line"""
+    line = line.strip()
+    if line.startswith(FORMAT_MARKER):
+        value = line[len(FORMAT_MARKER):].strip()
+        return [] if not value or value == 'NA' else value.split('+')
+    return None
+
+
+def parse_size_line(line: str) -> Optional[int]:
+    """
+    Return the size from a SIZE_TEMPLATE line (0 if yt-dlp did not know
+    it), or None for any other line
+    """
+    line = line.strip()
+    if line.startswith(SIZE_MARKER):
+        size = _to_float(line[len(SIZE_MARKER):].strip())
+        return int(size) if size else 0
+    return None
+
+
+def info_full_size(info: Dict[str, Any]) -> Optional[int]:
+    """Size of the complete media described by an info dict, if known"""
+    formats = info.get('requested_formats') or [info]
+    sizes = [f.get('filesize') or f.get('filesize_approx') for f in formats]
+    if not all(sizes):
+        return None
+    return int(sum(sizes))
+
+
+class ProgressTracker:
+    """
+    Accumulates progress events for one job
+
+    yt-dlp reports each file (e.g. video and audio stream) separately, so
+    completed files are added up to get the bytes transferred by the job.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.completed_bytes = 0
+        self.current_bytes = 0
+        self.peak_speed = 0.0
+        self.last_event: Optional[Dict[str, Any]] = None
+
+    def update(self, event: Dict[str, Any]):
+        """Record a progress event"""
+        downloaded = event.get('downloaded_bytes') or 0
+        if downloaded < self.current_bytes:
+            # A new file started without a 'finished' event for the previous one
+            self.completed_bytes += self.current_bytes
+        self.current_bytes = downloaded
+        if event.get('status') == 'finished':
+            self.completed_bytes += self.current_bytes
+            self.current_bytes = 0
+        if event.get('speed'):
+            self.peak_speed = max(self.peak_speed, event['speed'])
+        self.last_event = event
+
+    @property
+    def downloaded_bytes(self) -> int:
+        """Bytes transferred so far across all files of the job"""
+        return self.completed_bytes + self.current_bytes
+
+    def summary(self) -> Dict[str, Any]:
+        """Throughput numbers for the job result"""
+        elapsed = time.time() - self.started_at
+        return {
+            'downloaded_bytes': self.downloaded_bytes,
+            'elapsed': elapsed,
+            'average_speed': self.downloaded_bytes / elapsed if elapsed else 0.0,
+            'peak_speed': self.peak_speed,
+        }
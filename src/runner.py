@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Streaming process runner
+Runs yt-dlp with subprocess.Popen and hands its output over line by line
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import threading
+from collections import deque
+from typing import Callable, Iterator, List, Optional
+
+
+IS_WINDOWS = sys.platform == 'win32'
+
+
+class StreamingProcess:
+    """
+    Run a command and stream its merged stdout/stderr
+
+    Only the last `tail_lines` lines are kept, so memory stays bounded no
+    matter how much a long download prints. The command runs in its own
+    process group so that cancelling also stops the ffmpeg children
+    yt-dlp spawns for merging and cutting.
+    """
+
+    def __init__(self, cmd: List[str], tail_lines: int = 50):
+        self.cmd = cmd
+        self.tail = deque(maxlen=tail_lines)
+        self.process: Optional[subprocess.Popen] = None
+        self.returncode: Optional[int] = None
+        self.timed_out = False
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def run(self, on_line: Callable[[str], None], timeout: Optional[float] = None) -> int:
+        """
+        Start the process and block until it exits
+
+        Raises:
+            subprocess.TimeoutExpired: if the process ran longer than `timeout`
+            FileNotFoundError: if the executable does not exist
+        """
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, self._expire)
+            timer.daemon = True
+            timer.start()
+
+        try:
+            for line in self.iter_lines():
+                on_line(line)
+        finally:
+            if timer:
+                timer.cancel()
+
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.cmd, timeout)
+        return self.returncode
+
+    def iter_lines(self) -> Iterator[str]:
+        """
+        Start the process and yield output lines as they arrive
+
+        Closing the generator before the output ends (or an exception in
+        the consumer) stops the process tree. The exit code is stored in
+        `returncode` once the output is exhausted.
+
+        Raises:
+            FileNotFoundError: if the executable does not exist
+        """
+        self._start()
+        finished = False
+        try:
+            for line in self.process.stdout:
+                line = line.rstrip('\r\n')
+                self.tail.append(line)
+                yield line
+            self.returncode = self.process.wait()
+            finished = True
+        finally:
+            if not finished:
+                self.terminate_tree(grace=0)
+                self.returncode = self.process.wait()
+            self.process.stdout.close()
+
+    def _start(self):
+        """Spawn the command in its own process group"""
+        if IS_WINDOWS:
+            group_args = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            group_args = {'start_new_session': True}
+
+        with self._lock:
+            self.process = subprocess.Popen(
+                self.cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                bufsize=1,
+                **group_args
+            )
+            stopped_early = self.cancelled or self.timed_out
+        if stopped_early:
+            self.terminate_tree(grace=0)
+
+    def _expire(self):
+        """Timer callback: kill the process tree once the timeout elapsed"""
+        self.timed_out = True
+        self.terminate_tree(grace=0)
+
+    def cancel(self, grace: float = 5.0):
+        """
+        Stop the process tree without blocking the caller
+
+        The group gets SIGTERM first so yt-dlp and ffmpeg can exit cleanly,
+        and SIGKILL after `grace` seconds if anything is still alive.
+        """
+        with self._lock:
+            self.cancelled = True
+            if self.process is None:
+                return
+        killer = threading.Thread(target=self.terminate_tree, args=(grace,), daemon=True)
+        killer.start()
+
+    def terminate_tree(self, grace: float = 5.0):
+        """Terminate the whole process group, escalating to a hard kill"""
+        process = self.process
+        if process is None:
+            return
+
+        if IS_WINDOWS:
+            # taskkill /T takes the children down with the parent
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return
+
+        try:
+            pgid = os.getpgid(process.pid)
+        except (ProcessLookupError, PermissionError):
+            # Leader already reaped; its pid doubles as the group id
+            pgid = process.pid
+
+        if grace > 0:
+            self._signal_group(pgid, signal.SIGTERM)
+            try:
+                process.wait(timeout=grace)
+            except subprocess.TimeoutExpired:
+                pass
+        # Children such as ffmpeg may outlive the leader, so always sweep the group
+        self._signal_group(pgid, signal.SIGKILL)
+
+    @staticmethod
+    def _signal_group(pgid: int, sig: int):
+        """Send a signal to a process group, ignoring groups that are gone"""
+        try:
+            os.killpg(pgid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    @property
+    def output(self) -> str:
+        """The last lines printed by the process"""
+        return '\n'.join(self.tail)
+
+    @property
+    def error_output(self) -> str:
+        """Lines yt-dlp flagged as errors, or the whole tail if there are none"""
+        errors = [line for line in self.tail if line.startswith('ERROR')]
+        return '\n'.join(errors) if errors else self.output
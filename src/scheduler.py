@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Resource scheduler
+Shares a bandwidth budget, free disk space and network/CPU slots between jobs
+"""
+
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Optional, Dict, Any, Callable, List
+
+
+_RATE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?(?:/s)?\s*$', re.I)
+_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_rate(text: Optional[str]) -> Optional[float]:
+    """
+    Parse a size such as '500K' or '2.5M' (yt-dlp style, binary units)
+
+    Returns:
+        Bytes (per second for rates), or None for an empty value
+
+    Raises:
+        ValueError: if the text is not a size
+    """
+    if text is None or str(text).strip() == '':
+        return None
+    match = _RATE_RE.match(str(text))
+    if not match:
+        raise ValueError(f"Invalid size '{text}', expected e.g. 500K or 2M")
+    return float(match.group(1)) * _UNITS[match.group(2).lower()]
+
+
+def free_space(path: str) -> Optional[int]:
+    """Free bytes on the disk holding `path` (or its nearest existing parent)"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+class Lease:
+    """A network or CPU slot held by one job; release() gives it back"""
+
+    def __init__(self, scheduler: 'ResourceScheduler', kind: str, live: bool = False):
+        self.scheduler = scheduler
+        self.kind = kind
+        self.live = live
+        self.rate: Optional[float] = None
+        self.acquired_at = time.monotonic()
+        self._setter: Optional[Callable[[Optional[float]], None]] = None
+        self._released = False
+
+    def bind(self, setter: Callable[[Optional[float]], None]):
+        """Apply rate changes to a running download (live leases only)"""
+        self._setter = setter
+        setter(self.rate)
+
+    def _apply(self, rate: Optional[float]):
+        self.rate = rate
+        if self._setter is not None:
+            try:
+                self._setter(rate)
+            except Exception:
+                pass
+
+    def release(self):
+        """Give the slot back; safe to call more than once"""
+        if not self._released:
+            self._released = True
+            self.scheduler._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ResourceScheduler:
+    """
+    Admission control for parallel downloads
+
+    A download needs a network slot, its share of the bandwidth budget and
+    enough free disk space in its output folder; new jobs wait until all
+    three are available. Bandwidth is split evenly across active
+    downloads. Live leases (the in-process engine) are rebalanced whenever
+    a download starts or finishes; subprocess downloads get a fixed
+    --limit-rate, sized for the number of jobs waiting when they start and
+    never more than the unallocated budget. Merging and
+    cutting run on separate CPU slots, so a job that is post-processing
+    does not hold a download slot. Safe to share between threads.
+    """
+
+    def __init__(self, network_slots: int = 3, cpu_slots: Optional[int] = None,
+                 bandwidth_limit: Optional[float] = None, min_free_bytes: int = 500 * 1024 ** 2,
+                 min_rate: float = 64 * 1024, disk_poll: float = 5.0):
+        """
+        Args:
+            network_slots: Downloads transferring data at the same time
+            cpu_slots: ffmpeg merges/re-encodes at the same time (default: CPU count)
+            bandwidth_limit: Total bytes per second across all downloads, or None
+            min_free_bytes: New downloads wait while the output disk has less free space
+            min_rate: Smallest share a download is started with
+            disk_poll: Seconds between free space checks while waiting
+        """
+        self.network_slots = max(1, int(network_slots))
+        self.cpu_slots = max(1, int(cpu_slots or os.cpu_count() or 2))
+        self.bandwidth_limit = bandwidth_limit
+        self.min_free_bytes = min_free_bytes
+        self.min_rate = min_rate
+        self.disk_poll = disk_poll
+        self._network: List[Lease] = []
+        self._cpu: List[Lease] = []
+        self._cond = threading.Condition()
+        self._demand: List[Callable[[], int]] = []
+        self._peak_network = 0
+        self._peak_cpu = 0
+        self._slot_wait = 0.0
+        self._disk_wait = 0.0
+        self._cpu_wait = 0.0
+        self._disk_pauses = 0
+
+    def network(self, output_path: Optional[str] = None, live: bool = False,
+                is_cancelled: Optional[Callable[[], bool]] = None,
+                log_callback: Optional[Callable[[str], None]] = None) -> Optional[Lease]:
+        """
+        Wait for a download slot, bandwidth and disk space
+
+        Returns:
+            The lease (its `rate` is the --limit-rate to use, None for no
+            limit), or None if `is_cancelled` turned true while waiting
+        """
+        if not self._wait_for_disk(output_path, is_cancelled, log_callback):
+            return None
+        started = time.monotonic()
+        lease = Lease(self, 'network', live)
+        with self._cond:
+            while not self._admit(lease):
+                if is_cancelled is not None and is_cancelled():
+                    return None
+                self._cond.wait(0.25)
+            self._network.append(lease)
+            self._peak_network = max(self._peak_network, len(self._network))
+            self._slot_wait += time.monotonic() - started
+            self._rebalance()
+        return lease
+
+    def cpu(self, is_cancelled: Optional[Callable[[], bool]] = None,
+            block: bool = True) -> Optional[Lease]:
+        """
+        Take a CPU slot for ffmpeg work
+
+        With block=False the slot is taken even when all are busy; that is
+        for post-processing that has already started inside yt-dlp.
+        """
+        started = time.monotonic()
+        lease = Lease(self, 'cpu')
+        with self._cond:
+            while block and len(self._cpu) >= self.cpu_slots:
+                if is_cancelled is not None and is_cancelled():
+                    return None
+                self._cond.wait(0.25)
+            self._cpu.append(lease)
+            self._peak_cpu = max(self._peak_cpu, len(self._cpu))
+            self._cpu_wait += time.monotonic() - started
+        return lease
+
+    def add_demand_source(self, source: Callable[[], int]):
+        """
+        Register a count of jobs that want to download (running or queued)
+
+        Fixed-rate downloads cannot be rebalanced later, so they start with
+        the share they would get once every waiting job is running.
+        """
+        with self._cond:
+            self._demand.append(source)
+
+    def set_bandwidth_limit(self, bandwidth_limit: Optional[float]):
+        """Change the budget; live downloads follow immediately"""
+        with self._cond:
+            self.bandwidth_limit = bandwidth_limit
+            self._rebalance()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Slot usage, bandwidth allocation and waiting time"""
+        with self._cond:
+            rates = [lease.rate for lease in self._network if lease.rate]
+            return {
+                'network_active': len(self._network),
+                'network_slots': self.network_slots,
+                'cpu_active': len(self._cpu),
+                'cpu_slots': self.cpu_slots,
+                'peak_network': self._peak_network,
+                'peak_cpu': self._peak_cpu,
+                'bandwidth_limit': self.bandwidth_limit,
+                'bandwidth_allocated': sum(rates),
+                'slot_wait_seconds': self._slot_wait,
+                'cpu_wait_seconds': self._cpu_wait,
+                'disk_wait_seconds': self._disk_wait,
+                'disk_pauses': self._disk_pauses,
+            }
+
+    def _admit(self, lease: Lease) -> bool:
+        """Whether a new download fits right now (lock held)"""
+        if len(self._network) >= self.network_slots:
+            return False
+        if not self.bandwidth_limit:
+            return True
+        fixed = sum(held.rate or 0.0 for held in self._network if not held.live)
+        live = sum(1 for held in self._network if held.live)
+        available = self.bandwidth_limit - fixed
+        if lease.live:
+            return available >= (live + 1) * self.min_rate
+        # A fixed rate cannot be lowered later, so it only takes what is left
+        # after every live download keeps its minimum
+        spare = available - live * self.min_rate
+        if spare < self.min_rate:
+            return False
+        demand = len(self._network) + 1
+        for source in self._demand:
+            try:
+                demand = max(demand, source())
+            except Exception:
+                pass
+        lease.rate = min(self.bandwidth_limit / min(demand, self.network_slots), spare)
+        return True
+
+    def _rebalance(self):
+        """Split the bandwidth left by fixed-rate downloads across live ones (lock held)"""
+        live = [lease for lease in self._network if lease.live]
+        if not live:
+            return
+        if not self.bandwidth_limit:
+            share = None
+        else:
+            fixed = sum(lease.rate or 0.0 for lease in self._network if not lease.live)
+            share = max(self.min_rate, (self.bandwidth_limit - fixed) / len(live))
+        for lease in live:
+            if lease.rate != share:
+                lease._apply(share)
+
+    def _release(self, lease: Lease):
+        with self._cond:
+            pool = self._network if lease.kind == 'network' else self._cpu
+            if lease in pool:
+                pool.remove(lease)
+            if lease.kind == 'network':
+                self._rebalance()
+            self._cond.notify_all()
+
+    def _wait_for_disk(self, output_path: Optional[str],
+                       is_cancelled: Optional[Callable[[], bool]],
+                       log_callback: Optional[Callable[[str], None]]) -> bool:
+        """Block while the output disk is below the free space threshold"""
+        if not output_path or not self.min_free_bytes:
+            return True
+        started = time.monotonic()
+        paused = False
+        while True:
+            free = free_space(output_path)
+            if free is None or free >= self.min_free_bytes:
+                break
+            if not paused:
+                paused = True
+                with self._cond:
+                    self._disk_pauses += 1
+                if log_callback:
+                    log_callback(f"Waiting for disk space: {free / 1048576:.0f} MiB free, "
+                                 f"{self.min_free_bytes / 1048576:.0f} MiB needed")
+            deadline = time.monotonic() + self.disk_poll
+            while time.monotonic() < deadline:
+                if is_cancelled is not None and is_cancelled():
+                    return False
+                time.sleep(0.25)
+        if paused:
+            with self._cond:
+                self._disk_wait += time.monotonic() - started
+        return True
@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+"""
+Local job service
+Runs a warm download queue behind a small asyncio HTTP/JSON API
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from http import HTTPStatus
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlsplit
+
+try:
+    from .batch import DownloadQueue, JobState
+    from .playlist import PlaylistExpander, is_collection_url
+    from .urls import parse_url_list
+except ImportError:
+    from batch import DownloadQueue, JobState
+    from playlist import PlaylistExpander, is_collection_url
+    from urls import parse_url_list
+
+
+# Options a client may set per job; everything else comes from the service
+JOB_OPTIONS = ('quality', 'cookies_browser', 'start_time', 'end_time', 'sections',
+               'accurate_cuts', 'output_path', 'ignore_archive', 'verify_archive')
+QUALITIES = ('best', '1080', '720', 'audio')
+
+MAX_BODY = 1024 * 1024
+MAX_HEADERS = 100
+
+
+class HTTPError(Exception):
+    """Turned into a JSON error response"""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class JobService:
+    """
+    HTTP front end for a long-lived DownloadQueue
+
+    Routes:
+        GET    /health               liveness and uptime
+        GET    /stats                queue counters and throughput
+        GET    /metrics              Prometheus metrics (needs a MetricsRecorder)
+        GET    /jobs                 all jobs
+        POST   /jobs                 {"url": ...} or {"urls": [...]} plus options
+        GET    /jobs/<id>            one job
+        DELETE /jobs/<id>            cancel a job
+        GET    /jobs/<id>/events     server-sent events for one job
+        GET    /events               server-sent events for every job
+
+    Worker threads report through the queue callbacks; events are handed
+    to the event loop with call_soon_threadsafe and fanned out to the SSE
+    subscribers. Progress is throttled per job so fast downloads do not
+    flood slow clients.
+    """
+
+    def __init__(self, queue_factory, defaults: Optional[Dict[str, Any]] = None,
+                 token: Optional[str] = None, archive=None, ytdlp_path: str = 'yt-dlp',
+                 progress_interval: float = 0.25, metrics=None):
+        """
+        Args:
+            queue_factory: Callable(on_job_update, on_job_progress) -> DownloadQueue
+            defaults: Options applied to every job before the client's options;
+                      its 'output_path' is also the folder clients' own
+                      output paths must stay in
+            token: When set, requests need "Authorization: Bearer <token>"
+            archive: DownloadArchive used to skip finished playlist entries
+            ytdlp_path: yt-dlp executable for playlist listings
+            progress_interval: Minimum seconds between progress events per job
+            metrics: MetricsRecorder the queue records jobs in, served at /metrics
+        """
+        self.queue: DownloadQueue = queue_factory(self._on_job_update, self._on_job_progress)
+        self.defaults = dict(defaults or {})
+        self.token = token
+        self.archive = archive
+        self.ytdlp_path = ytdlp_path
+        self.progress_interval = progress_interval
+        self.metrics = metrics
+        self.started_at = time.time()
+        self.dropped_events = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: List[Tuple[Optional[int], asyncio.Queue]] = []
+        self._last_progress: Dict[int, float] = {}
+        self._routes = [
+            ('GET', re.compile(r'^/health$'), self._health),
+            ('GET', re.compile(r'^/stats$'), self._stats),
+            ('GET', re.compile(r'^/metrics$'), self._metrics),
+            ('GET', re.compile(r'^/jobs$'), self._list_jobs),
+            ('POST', re.compile(r'^/jobs$'), self._create_jobs),
+            ('GET', re.compile(r'^/jobs/(\d+)$'), self._get_job),
+            ('DELETE', re.compile(r'^/jobs/(\d+)$'), self._cancel_job),
+            ('GET', re.compile(r'^/jobs/(\d+)/events$'), self._job_events),
+            ('GET', re.compile(r'^/events$'), self._all_events),
+        ]
+
+    # -- queue callbacks (worker threads) --
+
+    def _on_job_update(self, job):
+        """Publish state changes"""
+        self._post({'type': 'state', 'id': job.job_id, 'job': job.to_dict()})
+
+    def _on_job_progress(self, job, event):
+        """Publish progress, at most once per progress_interval per job"""
+        now = time.time()
+        if (event.get('status') != 'finished'
+                and now - self._last_progress.get(job.job_id, 0) < self.progress_interval):
+            return
+        self._last_progress[job.job_id] = now
+        self._post({'type': 'progress', 'id': job.job_id, 'progress': event})
+
+    def _post(self, event: Dict[str, Any]):
+        """Hand an event to the loop thread"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._publish, event)
+            except RuntimeError:
+                # Loop shut down between the check and the call
+                pass
+
+    def _publish(self, event: Dict[str, Any]):
+        """Fan an event out to matching subscribers (loop thread)"""
+        if event['type'] == 'state' and event['job']['state'] in JobState.FINISHED:
+            self._last_progress.pop(event['id'], None)
+        for job_id, queue in list(self._subscribers):
+            if job_id is not None and job_id != event['id']:
+                continue
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped_events += 1
+
+    # -- HTTP plumbing --
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one connection (one request, then close)"""
+        try:
+            method, path, headers, body = await self._read_request(reader)
+            self._check_auth(headers)
+            handler, args = self._route(method, path)
+            await handler(writer, body, *args)
+        except HTTPError as e:
+            await self._respond(writer, e.status, {'error': str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            await self._respond(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """Parse the request line, headers and JSON body"""
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        if not request_line:
+            raise ConnectionError('Empty request')
+        try:
+            method, target, _ = request_line.split(' ', 2)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Malformed request line')
+
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Too many headers')
+
+        body = None
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Content-Length must be a number')
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Content-Length must not be negative')
+        if length > MAX_BODY:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large')
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, 'Body must be JSON')
+        return method.upper(), urlsplit(target).path, headers, body
+
+    def _check_auth(self, headers: Dict[str, str]):
+        """Reject requests without the bearer token, if one is configured"""
+        if self.token and headers.get('authorization') != f'Bearer {self.token}':
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, 'Missing or wrong token')
+
+    def _route(self, method: str, path: str):
+        """Find the handler for a request"""
+        path_known = False
+        for route_method, pattern, handler in self._routes:
+            match = pattern.match(path)
+            if match:
+                path_known = True
+                if route_method == method:
+                    return handler, match.groups()
+        if path_known:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f'{method} not allowed on {path}')
+        raise HTTPError(HTTPStatus.NOT_FOUND, f'No route for {path}')
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: HTTPStatus, data: Any,
+                       content_type: str = 'application/json'):
+        """Write a complete response; data is JSON-encoded unless it is already text"""
+        body = (data if isinstance(data, str) else json.dumps(data)).encode('utf-8')
+        head = (f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                'Connection: close\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    # -- handlers --
+
+    async def _health(self, writer, body):
+        await self._respond(writer, HTTPStatus.OK,
+                            {'status': 'ok', 'uptime': time.time() - self.started_at})
+
+    async def _stats(self, writer, body):
+        stats = self.queue.stats()
+        stats['dropped_events'] = self.dropped_events
+        stats['subscribers'] = len(self._subscribers)
+        await self._respond(writer, HTTPStatus.OK, stats)
+
+    async def _metrics(self, writer, body):
+        if self.metrics is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'Metrics are not enabled')
+        stats = self.queue.stats()
+        gauges = {
+            'jobs_queued': stats['states'][JobState.QUEUED],
+            'jobs_running': stats['states'][JobState.RUNNING],
+            'jobs_retrying': stats['retrying'],
+            'network_slots_active': stats['scheduler']['network_active'],
+            'cpu_slots_active': stats['scheduler']['cpu_active'],
+            'bandwidth_allocated_bytes': stats['scheduler']['bandwidth_allocated'],
+            'governor_backoff_remaining_seconds': stats['governor']['backoff_remaining'],
+            'sse_subscribers': len(self._subscribers),
+        }
+        await self._respond(writer, HTTPStatus.OK, self.metrics.prometheus_text(gauges),
+                            'text/plain; version=0.0.4; charset=utf-8')
+
+    async def _list_jobs(self, writer, body):
+        await self._respond(writer, HTTPStatus.OK,
+                            {'jobs': [job.to_dict() for job in self.queue.jobs()]})
+
+    async def _create_jobs(self, writer, body):
+        if not isinstance(body, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Expected a JSON object')
+        urls = list(body.get('urls') or [])
+        if body.get('url'):
+            urls.insert(0, body['url'])
+        if not all(isinstance(url, str) for url in urls):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'urls' must be strings")
+        urls = parse_url_list(' '.join(urls))
+        if not urls:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Give a link in 'url' or 'urls'")
+        options = self._job_options(body)
+
+        jobs, playlists = [], []
+        for url in urls:
+            if is_collection_url(url):
+                expander = PlaylistExpander(
+                    ytdlp_path=self.ytdlp_path,
+                    archive=None if options.get('ignore_archive') else self.archive,
+                    format_key=options.get('quality', 'best'),
+                    cookies_browser=options.get('cookies_browser')
+                )
+                self.queue.submit_playlist(url, options, expander)
+                playlists.append(url)
+            else:
+                jobs.append(self.queue.submit(url, options).to_dict())
+        await self._respond(writer, HTTPStatus.ACCEPTED, {'jobs': jobs, 'playlists': playlists})
+
+    def _job_options(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Service defaults overlaid with the client's (whitelisted) options"""
+        options = dict(self.defaults)
+        options.update({key: body[key] for key in JOB_OPTIONS if key in body})
+        if 'output_path' in body:
+            options['output_path'] = self._output_path(body['output_path'])
+        if options.get('quality', 'best') not in QUALITIES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"'quality' must be one of {QUALITIES}")
+        for key in ('start_time', 'end_time'):
+            if options.get(key) is not None and not isinstance(options[key], (int, float)):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"'{key}' must be a number of minutes")
+        return options
+
+    def _output_path(self, path: Any) -> str:
+        """
+        A client's download folder, which must lie under the default one
+
+        Relative paths are taken from the default folder. Symlinks are
+        resolved first, so a link cannot lead out of it either.
+        """
+        root = self.defaults.get('output_path')
+        if not root:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'output_path' cannot be set on this service")
+        if not isinstance(path, str) or not path or '\0' in path:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'output_path' must be a folder name")
+        root = os.path.realpath(root)
+        resolved = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, resolved]) != root:
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            "'output_path' must be inside the service's download folder")
+        return resolved
+
+    def _job_or_404(self, job_id: str):
+        job = self.queue.get(int(job_id))
+        if job is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f'No job {job_id}')
+        return job
+
+    async def _get_job(self, writer, body, job_id):
+        job = self._job_or_404(job_id)
+        data = job.to_dict()
+        data['progress'] = job.progress
+        await self._respond(writer, HTTPStatus.OK, data)
+
+    async def _cancel_job(self, writer, body, job_id):
+        job = self._job_or_404(job_id)
+        if not self.queue.cancel(job.job_id):
+            raise HTTPError(HTTPStatus.CONFLICT, f'Job {job_id} already {job.state}')
+        await self._respond(writer, HTTPStatus.OK, job.to_dict())
+
+    async def _job_events(self, writer, body, job_id):
+        job = self._job_or_404(job_id)
+        await self._stream(writer, job.job_id)
+
+    async def _all_events(self, writer, body):
+        await self._stream(writer, None)
+
+    async def _stream(self, writer: asyncio.StreamWriter, job_id: Optional[int]):
+        """Server-sent events until the job finishes (or the client leaves)"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+        subscriber = (job_id, queue)
+        self._subscribers.append(subscriber)
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\n'
+                     b'Connection: close\r\n\r\n')
+        try:
+            if job_id is not None:
+                # Current state first, so late subscribers still see where the job is
+                job = self.queue.get(job_id)
+                await self._send_event(writer, {'type': 'state', 'id': job_id,
+                                                'job': job.to_dict()})
+                if job.state in JobState.FINISHED:
+                    return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies and idle clients from timing out
+                    writer.write(b': keep-alive\n\n')
+                    await writer.drain()
+                    continue
+                await self._send_event(writer, event)
+                if (job_id is not None and event['type'] == 'state'
+                        and event['job']['state'] in JobState.FINISHED):
+                    return
+        finally:
+            self._subscribers.remove(subscriber)
+
+    @staticmethod
+    async def _send_event(writer: asyncio.StreamWriter, event: Dict[str, Any]):
+        """Write one SSE frame"""
+        frame = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        writer.write(frame.encode('utf-8'))
+        await writer.drain()
+
+    # -- lifecycle --
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, ready=None):
+        """Accept connections until cancelled"""
+        self._loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle, host, port)
+        if ready is not None:
+            ready(server.sockets[0].getsockname())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._loop = None
+
+    def close(self, cancel: bool = True):
+        """Stop the queue's workers"""
+        self.queue.shutdown(wait=True, cancel=cancel)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the service until interrupted"""
+    parser = argparse.ArgumentParser(prog='youtube-downloader-cli serve',
+                                     description='Run the downloader as a local HTTP job service')
+    parser.add_argument('--host', default='127.0.0.1', help='bind address (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8765, help='port (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=3, metavar='N',
+                        help='parallel downloads (default: %(default)s)')
+    parser.add_argument('-o', '--output', default=str(Path.home() / 'Downloads' / 'YouTube'),
+                        metavar='DIR', help='default download folder (default: %(default)s)')
+    parser.add_argument('--limit-rate', metavar='RATE',
+                        help='total download speed across all jobs, e.g. 500K or 4M')
+    parser.add_argument('--min-free', default='500M', metavar='SIZE',
+                        help='pause new downloads while the output disk has less free space '
+                             '(default: %(default)s, 0 to disable)')
+    parser.add_argument('--engine', choices=('subprocess', 'api'), default='api',
+                        help='yt-dlp engine; api keeps yt-dlp loaded between jobs '
+                             '(default: %(default)s)')
+    parser.add_argument('--ytdlp', metavar='PATH', help='yt-dlp executable to use')
+    parser.add_argument('--token', help='require "Authorization: Bearer TOKEN" on every request')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the probe cache')
+    parser.add_argument('--cookies-from-browser', choices=('chrome', 'firefox'), metavar='BROWSER',
+                        help='retry downloads YouTube blocked with cookies from chrome or firefox')
+    parser.add_argument('--store', metavar='DIR',
+                        help='keep finished files once in a shared store under DIR and link them '
+                             'into output folders')
+    parser.add_argument('--concurrent-fragments', metavar='N',
+                        help="DASH/HLS fragments each download fetches at once, or 'auto' to size "
+                             'it per job from measured throughput and the number of running jobs')
+    parser.add_argument('--external-downloader', choices=('aria2c',),
+                        help='hand transfers to aria2c (implies --concurrent-fragments auto)')
+    parser.add_argument('--resume', action='store_true',
+                        help='journal jobs, continue unfinished ones at start-up and keep '
+                             'partial files when stopped')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='also append one JSON line per finished job to FILE')
+    args = parser.parse_args(argv)
+
+    try:
+        from .archive import DownloadArchive
+        from .downloader import YouTubeDownloader
+        from .governor import RateGovernor
+        from .job_store import JobStore
+        from .media_store import MediaStore
+        from .metrics import MetricsRecorder
+        from .probe_cache import ProbeCache
+        from .scheduler import ResourceScheduler, parse_rate
+        from .transfer import TransferTuner
+        from .ytdlp_binary import find_ytdlp
+    except ImportError:
+        from archive import DownloadArchive
+        from downloader import YouTubeDownloader
+        from governor import RateGovernor
+        from job_store import JobStore
+        from media_store import MediaStore
+        from metrics import MetricsRecorder
+        from probe_cache import ProbeCache
+        from scheduler import ResourceScheduler, parse_rate
+        from transfer import TransferTuner
+        from ytdlp_binary import find_ytdlp
+    try:
+        bandwidth_limit = parse_rate(args.limit_rate)
+        min_free = parse_rate(args.min_free) or 0
+    except ValueError as e:
+        parser.error(str(e))
+    transfer = None
+    if args.concurrent_fragments or args.external_downloader:
+        fragments = args.concurrent_fragments or 'auto'
+        if fragments != 'auto' and not (fragments.isdigit() and int(fragments) > 0):
+            parser.error("--concurrent-fragments must be a positive number or 'auto'")
+        transfer = TransferTuner(fixed=None if fragments == 'auto' else int(fragments),
+                                 external=args.external_downloader, max_jobs=args.jobs)
+
+    os.makedirs(args.output, exist_ok=True)
+    probe_cache = None if args.no_cache else ProbeCache()
+    archive = DownloadArchive()
+    job_store = JobStore() if args.resume else None
+    media_store = MediaStore(args.store) if args.store else None
+    metrics = MetricsRecorder(jsonl_path=args.metrics)
+    governor = RateGovernor(cookies_browser=args.cookies_from_browser)
+
+    def queue_factory(on_job_update, on_job_progress):
+        return DownloadQueue(
+            max_workers=args.jobs,
+            downloader_factory=lambda: YouTubeDownloader(ytdlp_path=args.ytdlp, engine=args.engine,
+                                                         probe_cache=probe_cache, archive=archive,
+                                                         media_store=media_store,
+                                                         transfer=transfer),
+            on_job_update=on_job_update,
+            on_job_progress=on_job_progress,
+            job_store=job_store,
+            scheduler=ResourceScheduler(network_slots=args.jobs, bandwidth_limit=bandwidth_limit,
+                                        min_free_bytes=int(min_free)),
+            governor=governor,
+            metrics=metrics,
+            transfer=transfer
+        )
+
+    service = JobService(queue_factory, defaults={'output_path': args.output},
+                         token=args.token, archive=archive, ytdlp_path=args.ytdlp or find_ytdlp(),
+                         metrics=metrics)
+
+    def ready(address):
+        print(f'Listening on http://{address[0]}:{address[1]}', file=sys.stderr, flush=True)
+
+    if job_store is not None:
+        resumed = service.queue.resume()
+        print(f'Resumed {len(resumed)} unfinished jobs', file=sys.stderr, flush=True)
+    try:
+        asyncio.run(service.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if job_store is not None:
+            service.queue.suspend()
+        service.close()
+        if probe_cache is not None:
+            probe_cache.close()
+        archive.close()
+        if media_store is not None:
+            media_store.close()
+        if job_store is not None:
+            job_store.close()
+        metrics.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
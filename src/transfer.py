@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Transfer tuning
+Sizes concurrent fragment downloads per job from measured throughput and running jobs
+"""
+
+import math
+import shutil
+import threading
+from typing import Optional, Dict, Any, List
+
+
+# External downloaders yt-dlp can hand a transfer to, with the
+# --downloader-args that open `n` connections per file
+EXTERNAL_DOWNLOADERS = {
+    'aria2c': lambda n: f'aria2c:-x{n} -s{n} -k1M --file-allocation=none',
+}
+
+
+class TransferTuner:
+    """
+    Connections per download (yt-dlp -N), sized for each job
+
+    Jobs together stay within `max_connections`, so the fragments a job
+    gets shrink as more jobs run: with the default budget of 16, eight
+    parallel jobs open 2 each instead of 16 each. Below that cap the tuner
+    uses the throughput finished jobs reached at each fragment count: it
+    doubles the count while that is untried, halves it while the lowest
+    count tried is as good as any, and settles on the fewest fragments
+    within `min_gain` of the best throughput seen. A job with a bandwidth
+    share from the scheduler gets no more connections than the share needs
+    at the measured speed per connection.
+
+    A running download cannot give connections back, so a new job only
+    gets what is left of the budget. With `max_jobs` (the worker count),
+    one connection is also held back for each job that may still start,
+    which keeps jobs that start together within the budget too; every job
+    gets at least one connection.
+
+    With `external='aria2c'` yt-dlp hands transfers to aria2c with the
+    same connection count; if aria2c is not installed, yt-dlp's own
+    downloader is used. Safe to share between threads.
+    """
+
+    def __init__(self, max_connections: int = 16, max_fragments: int = 8, initial: int = 2,
+                 fixed: Optional[int] = None, min_gain: float = 0.1,
+                 external: Optional[str] = None, chunk_size: int = 10 * 1024 ** 2,
+                 min_sample_bytes: int = 1024 ** 2, max_jobs: Optional[int] = None):
+        """
+        Args:
+            max_connections: Fragment connections across all running jobs
+            max_fragments: Most fragments one job downloads at once
+            initial: Fragments per job before any throughput is measured
+            fixed: Always use this many fragments (no tuning, no budget)
+            min_gain: Throughput gain, as a fraction, that justifies more
+                      connections
+            external: 'aria2c' to download through aria2c, or None for
+                      yt-dlp's own downloader
+            chunk_size: --http-chunk-size, the bytes per ranged request
+            min_sample_bytes: Smaller downloads are not measured (their
+                              speed is mostly request latency)
+            max_jobs: Most downloads that run at once, or None if unknown
+        """
+        if external is not None and external not in EXTERNAL_DOWNLOADERS:
+            raise ValueError(f"Unknown downloader '{external}', "
+                             f"expected one of {tuple(EXTERNAL_DOWNLOADERS)}")
+        self.max_connections = max(1, int(max_connections))
+        self.max_fragments = max(1, int(max_fragments))
+        self.initial = max(1, int(initial))
+        self.fixed = max(1, int(fixed)) if fixed else None
+        self.min_gain = min_gain
+        self.external = external if external and shutil.which(external) else None
+        self.chunk_size = int(chunk_size)
+        self.min_sample_bytes = min_sample_bytes
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        # Fragment count -> [jobs measured, average bytes per second]
+        self._levels: Dict[int, List[float]] = {}
+        self._active: List[int] = []
+        self._peak_connections = 0
+        self._jobs = 0
+
+    def begin(self, rate: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Pick the fragments for a download that is starting now
+
+        Args:
+            rate: The job's bandwidth share in bytes per second, or None
+
+        Returns:
+            Transfer dict with 'fragments', 'downloader', 'chunk_size' and
+            'args' (yt-dlp options to add); give it back to finish() when the
+            job ends
+        """
+        with self._lock:
+            fragments = self.fixed or self._choose(len(self._active) + 1, rate)
+            self._active.append(fragments)
+            self._peak_connections = max(self._peak_connections, sum(self._active))
+            self._jobs += 1
+        return {'fragments': fragments, 'downloader': self.external or 'native',
+                'chunk_size': self.chunk_size, 'args': self.args(fragments)}
+
+    def finish(self, transfer: Dict[str, Any], downloaded_bytes: Optional[float] = None,
+               seconds: Optional[float] = None):
+        """Release a transfer's connections and record the throughput it reached"""
+        fragments = transfer['fragments']
+        with self._lock:
+            if fragments in self._active:
+                self._active.remove(fragments)
+            if downloaded_bytes and seconds and downloaded_bytes >= self.min_sample_bytes:
+                level = self._levels.setdefault(fragments, [0, 0.0])
+                level[0] += 1
+                # Recent jobs count more; the network changes over a long batch
+                weight = max(0.3, 1.0 / level[0])
+                level[1] += (downloaded_bytes / seconds - level[1]) * weight
+
+    def args(self, fragments: int) -> List[str]:
+        """yt-dlp options for a transfer with this many fragments"""
+        args = ['--concurrent-fragments', str(fragments), '--http-chunk-size', str(self.chunk_size)]
+        if self.external:
+            args.extend(['--downloader', self.external,
+                         '--downloader-args', EXTERNAL_DOWNLOADERS[self.external](fragments)])
+        return args
+
+    def stats(self) -> Dict[str, Any]:
+        """Connections in use and the throughput measured per fragment count"""
+        with self._lock:
+            return {
+                'mode': 'fixed' if self.fixed else 'auto',
+                'downloader': self.external or 'native',
+                'active_jobs': len(self._active),
+                'active_connections': sum(self._active),
+                'peak_connections': self._peak_connections,
+                'max_connections': self.max_connections,
+                'jobs': self._jobs,
+                'levels': {str(fragments): {'jobs': int(level[0]), 'bytes_per_second': level[1]}
+                           for fragments, level in sorted(self._levels.items())},
+            }
+
+    def _choose(self, running: int, rate: Optional[float]) -> int:
+        """Fragments for one of `running` jobs (lock held)"""
+        left = self.max_connections - sum(self._active)
+        if self.max_jobs:
+            # One connection for each job that may still start
+            left -= max(0, self.max_jobs - running)
+        cap = max(1, min(self.max_fragments, self.max_connections // running, left))
+        levels = {n: level[1] for n, level in self._levels.items() if n <= cap}
+        if not levels:
+            fragments = min(self.initial, cap)
+        else:
+            best = max(levels.values())
+            fragments = min(n for n, speed in levels.items() if speed * (1 + self.min_gain) >= best)
+            doubled = min(fragments * 2, cap)
+            if fragments == max(levels) and fragments < cap and doubled not in self._levels:
+                fragments = doubled
+            elif fragments == min(levels) and fragments > 1 and fragments // 2 not in self._levels:
+                fragments //= 2
+        if rate and self._levels:
+            per_connection = max(level[1] / n for n, level in self._levels.items())
+            if per_connection > 0:
+                fragments = min(fragments, max(1, math.ceil(rate / per_connection)))
+        return fragments
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+UI event bus
+Hands log lines and widget updates from worker threads to the Tk main loop
+"""
+
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+LOG = 'log'
+CALL = 'call'
+
+
+class UIEventBus:
+    """
+    Thread-safe mailbox drained by the GUI thread
+
+    Workers never touch widgets. They post log lines and callbacks here,
+    and the main loop runs them in order from a root.after timer. Updates
+    posted with call_latest() under the same key are coalesced, so a
+    burst of progress events costs one redraw per tick instead of one per
+    event.
+    """
+
+    def __init__(self):
+        self._events: "deque[Tuple[str, Any]]" = deque()
+        self._latest: Dict[str, Tuple[Callable, tuple]] = {}
+        self._lock = threading.Lock()
+        self.posted = 0
+        self.coalesced = 0
+
+    def log(self, line: str):
+        """Queue a line for the log widget"""
+        with self._lock:
+            self._events.append((LOG, line))
+            self.posted += 1
+
+    def call(self, fn: Callable, *args):
+        """Queue a callback to run on the GUI thread"""
+        with self._lock:
+            self._events.append((CALL, (fn, args)))
+            self.posted += 1
+
+    def call_latest(self, key: str, fn: Callable, *args):
+        """Queue a callback, replacing one under the same key that has not run yet"""
+        with self._lock:
+            self.posted += 1
+            if key in self._latest:
+                self.coalesced += 1
+            else:
+                # The slot keeps its queue position; the newest arguments win
+                self._events.append((key, None))
+            self._latest[key] = (fn, args)
+
+    def drain(self, max_events: Optional[int] = None) -> List[Tuple[str, Any]]:
+        """
+        Take pending events in posting order
+
+        Returns:
+            List of (LOG, line) and (CALL, (fn, args)) tuples
+        """
+        drained = []
+        with self._lock:
+            while self._events and (max_events is None or len(drained) < max_events):
+                kind, payload = self._events.popleft()
+                if kind not in (LOG, CALL):
+                    kind, payload = CALL, self._latest.pop(kind)
+                drained.append((kind, payload))
+        return drained
+
+    def pending(self) -> int:
+        """Number of events waiting to be drained"""
+        with self._lock:
+            return len(self._events)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+URL helpers
+Parses pasted link lists and URL list files, and normalizes video IDs
+"""
+
+import re
+from typing import List, Optional
+from urllib.parse import urlparse, parse_qs
+
+
+_URL_SPLIT = re.compile(r'[\s,;]+')
+
+_YOUTUBE_HOSTS = ('youtube.com', 'youtube-nocookie.com', 'youtu.be')
+_VIDEO_ID = re.compile(r'^[\w-]{11}$')
+_PATH_PREFIXES = ('/shorts/', '/embed/', '/live/', '/v/', '/e/')
+
+
+def normalize_url(url: str) -> str:
+    """Strip whitespace and add a scheme to bare links"""
+    url = url.strip()
+    if url and not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    return url
+
+
+def parse_url_list(text: str) -> List[str]:
+    """
+    Parse a pasted list of links
+
+    Links may be separated by newlines, spaces, commas or semicolons.
+    Lines starting with '#' are treated as comments. Duplicates are
+    dropped while keeping the original order.
+    """
+    urls = []
+    seen = set()
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        for token in _URL_SPLIT.split(line):
+            url = normalize_url(token)
+            if url and url not in seen:
+                seen.add(url)
+                urls.append(url)
+    return urls
+
+
+def read_url_file(path: str) -> List[str]:
+    """Read a text file with one or more links per line"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_url_list(f.read())
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """Return the 11 character YouTube video ID of a link, or None"""
+    parsed = urlparse(normalize_url(url))
+    host = (parsed.hostname or '').lower()
+    if not any(host == h or host.endswith('.' + h) for h in _YOUTUBE_HOSTS):
+        return None
+
+    candidate = None
+    if host.endswith('youtu.be'):
+        candidate = parsed.path.lstrip('/').split('/')[0]
+    elif parsed.path == '/watch':
+        candidate = parse_qs(parsed.query).get('v', [None])[0]
+    else:
+        for prefix in _PATH_PREFIXES:
+            if parsed.path.startswith(prefix):
+                candidate = parsed.path[len(prefix):].split('/')[0]
+                break
+
+    if candidate and _VIDEO_ID.match(candidate):
+        return candidate
+    return None
+
+
+def video_key(url: str) -> str:
+    """
+    Stable cache key for a link
+
+    YouTube links collapse to 'youtube:<id>' whatever their form
+    (watch, youtu.be, shorts, extra query parameters); other sites fall
+    back to the normalized URL.
+    """
+    video_id = extract_video_id(url)
+    if video_id:
+        return f'youtube:{video_id}'
+    return f'url:{normalize_url(url)}'
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+yt-dlp discovery
+Finds the yt-dlp executable and its version once, cached across runs
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from typing import Optional, Dict, Any
+
+try:
+    from .paths import user_file
+except ImportError:
+    from paths import user_file
+
+
+# Looked up in this order, like the old `which` loop did
+CANDIDATES = (
+    'yt-dlp',
+    'yt-dlp.exe',
+    '~/.local/bin/yt-dlp',
+    'C:\\Program Files\\yt-dlp\\yt-dlp.exe',
+)
+
+# First yt-dlp release with each option the downloader relies on
+FEATURES = {
+    'progress_template': (2021, 10, 9),    # --progress-template
+    'print_when': (2022, 1, 21),           # --print after_move:...
+    'download_sections': (2022, 9, 1),     # --download-sections
+}
+
+_VERSION_RE = re.compile(r'^(\d{4})\.(\d{1,2})\.(\d{1,2})')
+
+_lock = threading.Lock()
+_found: Optional[str] = None
+_versions: Dict[tuple, Optional[str]] = {}
+
+
+def _fingerprint(path: str) -> Optional[Dict[str, Any]]:
+    """mtime and size of a file; an upgrade in place changes at least one"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return {'mtime': st.st_mtime_ns, 'size': st.st_size}
+
+
+def _load() -> Dict[str, Any]:
+    try:
+        with open(user_file('ytdlp.json'), encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(data: Dict[str, Any]):
+    path = user_file('ytdlp.json')
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+
+
+def find_ytdlp() -> str:
+    """
+    Full path of the yt-dlp executable, or 'yt-dlp' if none was found
+
+    Looked up in-process with shutil.which instead of spawning `which` per
+    candidate. The result is remembered for this process and in
+    ~/.youtube_downloader_ytdlp.json; the next run reuses it after one stat,
+    unless PATH changed or the binary was replaced or removed.
+    """
+    global _found
+    with _lock:
+        if _found is not None:
+            return _found
+        search_path = os.environ.get('PATH', '')
+        data = _load()
+        cached = data.get('lookup') or {}
+        path = cached.get('path')
+        if path and cached.get('search_path') == search_path and \
+                cached.get('file') == _fingerprint(path):
+            _found = path
+            return path
+
+        for candidate in CANDIDATES:
+            path = shutil.which(os.path.expanduser(candidate))
+            if path:
+                path = os.path.abspath(path)
+                data['lookup'] = {'search_path': search_path, 'path': path,
+                                  'file': _fingerprint(path)}
+                _save(data)
+                _found = path
+                return path
+        # Not cached: installing yt-dlp later should work without clearing anything
+        return 'yt-dlp'
+
+
+def ytdlp_version(ytdlp_path: str = 'yt-dlp', timeout: float = 15.0) -> Optional[str]:
+    """
+    Version string `ytdlp_path --version` prints, e.g. '2024.08.06'
+
+    Probed once per binary: the answer is cached in-process and on disk
+    keyed by the file's mtime and size, so updating yt-dlp (yt-dlp -U, a
+    package upgrade) is noticed on the next call. None if it cannot be run.
+    """
+    resolved = shutil.which(ytdlp_path)
+    if resolved is None:
+        return None
+    resolved = os.path.abspath(resolved)
+    fingerprint = _fingerprint(resolved)
+    key = (resolved, json.dumps(fingerprint, sort_keys=True))
+    with _lock:
+        if key in _versions:
+            return _versions[key]
+        cached = (_load().get('versions') or {}).get(resolved) or {}
+        if cached.get('file') == fingerprint and cached.get('version'):
+            _versions[key] = cached['version']
+            return cached['version']
+
+    try:
+        completed = subprocess.run([resolved, '--version'], capture_output=True, text=True,
+                                   timeout=timeout)
+        lines = completed.stdout.strip().splitlines()
+        version = lines[0].strip() if completed.returncode == 0 and lines else None
+    except (OSError, subprocess.SubprocessError):
+        version = None
+
+    with _lock:
+        _versions[key] = version
+        if version:
+            data = _load()
+            data.setdefault('versions', {})[resolved] = {'file': fingerprint, 'version': version}
+            _save(data)
+    return version
+
+
+def ytdlp_features(version: Optional[str]) -> Dict[str, bool]:
+    """Which of FEATURES a yt-dlp version has; all assumed present if the version is unknown"""
+    match = _VERSION_RE.match(version or '')
+    if not match:
+        return {name: True for name in FEATURES}
+    release = tuple(int(part) for part in match.groups())
+    return {name: release >= first for name, first in FEATURES.items()}
+
+
+def missing_features(ytdlp_path: str, *names: str) -> Optional[str]:
+    """Error message if the installed yt-dlp lacks any of `names`, else None"""
+    version = ytdlp_version(ytdlp_path)
+    features = ytdlp_features(version)
+    missing = [name for name in names if not features.get(name, True)]
+    if not missing:
+        return None
+    needed = max(FEATURES[name] for name in missing)
+    return (f"yt-dlp {version} is too old (needs {needed[0]}.{needed[1]:02d}.{needed[2]:02d} "
+            f"or newer); update it with 'yt-dlp -U' or pip install -U yt-dlp")
+
+
+def clear_cache():
+    """Forget the cached path and versions, in this process and on disk"""
+    global _found
+    with _lock:
+        _found = None
+        _versions.clear()
+        try:
+            os.remove(user_file('ytdlp.json'))
+        except OSError:
+            pass
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS_DIR = os.path.join(TESTS_DIR, '..', 'benchmarks')
+
+# Modules in src/ import each other by bare name, as run.py and cli.py set up
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'src'))
+# The fake media server and fake yt-dlp the benchmarks run against
+sys.path.insert(0, BENCHMARKS_DIR)
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    """Keep caches, archives and configs out of the real home folder"""
+    path = tmp_path / 'home'
+    path.mkdir()
+    monkeypatch.setenv('HOME', str(path))
+    return path
+
+
+@pytest.fixture(scope='session')
+def media(tmp_path_factory):
+    """Short test videos, one file per format (see fake_media.generate_media)"""
+    from fake_media import generate_media
+    return generate_media(str(tmp_path_factory.mktemp('media')), duration=2, size_mib=0.5)
+
+
+@pytest.fixture
+def fake_ytdlp():
+    """Stub yt-dlp executable that downloads from a FakeMediaServer"""
+    return os.path.join(BENCHMARKS_DIR, 'fake_ytdlp.py')
+
+
+@pytest.fixture
+def fake_server(media):
+    """Running FakeMediaServer; tests may change its settings before use"""
+    from fake_media import FakeMediaServer
+    server = FakeMediaServer(media)
+    server.start()
+    yield server
+    server.stop()
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from archive import DownloadArchive, clip_key
+from downloader import YouTubeDownloader
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = DownloadArchive(tmp_path / 'archive.db')
+    yield archive
+    archive.close()
+
+
+def test_clip_key():
+    assert clip_key() == ''
+    assert clip_key(1.5, 3) == '1.5-3'
+    assert clip_key(2) == '2-'
+
+
+def test_lookup_matches_any_link_form(archive, tmp_path):
+    video = tmp_path / 'Video.mp4'
+    video.write_bytes(b'video')
+    archive.record('https://www.youtube.com/watch?v=dQw4w9WgXcQ', str(video), '720')
+
+    entry = archive.lookup('https://youtu.be/dQw4w9WgXcQ', '720')
+    assert entry['filepath'] == str(video) and entry['size'] == 5
+    assert archive.lookup('youtube:dQw4w9WgXcQ', '720') is not None
+    assert archive.lookup('https://youtu.be/dQw4w9WgXcQ', 'best') is None
+    assert archive.lookup('https://youtu.be/dQw4w9WgXcQ', '720', clip_key(1, 2)) is None
+    assert archive.stats() == {'hits': 2, 'misses': 2, 'entries': 1, 'bytes': 5}
+
+
+def test_changed_or_missing_files_drop_their_entry(archive, tmp_path):
+    video = tmp_path / 'Video.mp4'
+    video.write_bytes(b'video')
+    archive.record('https://youtu.be/dQw4w9WgXcQ', str(video))
+
+    video.write_bytes(b'VIDEO')
+    # Same size: only a checksum notices
+    assert archive.lookup('https://youtu.be/dQw4w9WgXcQ') is not None
+    assert archive.lookup('https://youtu.be/dQw4w9WgXcQ', verify='checksum') is None
+    assert archive.stats()['entries'] == 0
+
+    archive.record('https://youtu.be/dQw4w9WgXcQ', str(video))
+    video.unlink()
+    assert archive.lookup('https://youtu.be/dQw4w9WgXcQ', verify=False) is not None
+    assert archive.lookup('https://youtu.be/dQw4w9WgXcQ') is None
+
+
+def test_import_folder_reads_ids_from_names_and_info_json(archive, tmp_path):
+    (tmp_path / 'Song [dQw4w9WgXcQ].m4a').write_bytes(b'audio')
+    (tmp_path / 'Talk.mp4').write_bytes(b'video')
+    (tmp_path / 'Talk.info.json').write_text(
+        json.dumps({'webpage_url': 'https://www.youtube.com/watch?v=9bZkp7q19f0'}))
+    (tmp_path / 'Unknown.mp4').write_bytes(b'video')
+    (tmp_path / 'notes.txt').write_text('not media')
+
+    assert archive.import_folder(str(tmp_path)) == 2
+    assert archive.lookup('https://youtu.be/dQw4w9WgXcQ')['filepath'].endswith('.m4a')
+    assert archive.lookup('https://youtu.be/9bZkp7q19f0')['filepath'].endswith('Talk.mp4')
+
+
+def test_downloader_skips_archived_videos(archive, tmp_path, fake_server, fake_ytdlp):
+    downloader = YouTubeDownloader(ytdlp_path=fake_ytdlp, archive=archive)
+    url = fake_server.watch_url('abc')
+    options = {'output_path': str(tmp_path / 'out')}
+
+    first = downloader.download(url, options)
+    assert first['success'] and not first.get('archived')
+    fetched = fake_server.stats()['requests']
+
+    second = downloader.download(url, options)
+    assert second['archived'] and second['filepath'] == first['filepath']
+    assert second['downloaded_bytes'] == 0
+    assert fake_server.stats()['requests'] == fetched
+
+    third = downloader.download(url, dict(options, ignore_archive=True))
+    assert not third.get('archived')
+    assert fake_server.stats()['requests'] > fetched
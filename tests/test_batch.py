@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+
+from batch import DownloadQueue, JobState
+from downloader import YouTubeDownloader
+from scheduler import ResourceScheduler
+
+
+class StubDownloader:
+    """Records how many jobs are fetching at once; optionally 'merges' after fetching"""
+
+    def __init__(self, tracker, merge_seconds=0.0):
+        self.tracker = tracker
+        self.merge_seconds = merge_seconds
+
+    def download(self, url, options):
+        self.tracker.enter(url)
+        time.sleep(0.05)
+        self.tracker.leave()
+        if self.merge_seconds:
+            options['postprocess_callback']()
+            time.sleep(self.merge_seconds)
+        self.tracker.finished.append(url)
+        return {'success': True, 'filepath': url, 'downloaded_bytes': 1}
+
+    def cancel_download(self, keep_partial=False):
+        pass
+
+
+class Tracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.started = []
+        self.finished = []
+
+    def enter(self, url):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.started.append(url)
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+
+
+def run_queue(workers, merge_seconds=0.0, cpu_slots=2):
+    tracker = Tracker()
+    scheduler = ResourceScheduler(network_slots=workers, cpu_slots=cpu_slots, min_free_bytes=0)
+    queue = DownloadQueue(max_workers=workers, scheduler=scheduler,
+                          downloader_factory=lambda: StubDownloader(tracker, merge_seconds))
+    urls = [f'https://www.youtube.com/watch?v=video{n:05d}' for n in range(6)]
+    jobs = queue.submit_many(urls)
+    assert queue.wait(timeout=10)
+    queue.shutdown()
+    assert all(job.state == JobState.DONE for job in jobs)
+    return tracker, urls
+
+
+def test_one_worker_runs_jobs_one_at_a_time_in_order():
+    tracker, urls = run_queue(1)
+    assert tracker.peak == 1
+    assert tracker.started == urls
+    assert tracker.finished == urls
+
+
+def test_merging_job_lets_the_next_one_start_but_fetches_stay_bounded():
+    tracker, urls = run_queue(1, merge_seconds=0.2)
+    assert tracker.peak == 1
+    assert tracker.started == urls
+
+
+def test_queue_runs_the_stub_ytdlp_with_cancel_and_stats(fake_server, fake_ytdlp, tmp_path):
+    fake_server.bandwidth = 256 * 1024
+    updates = []
+    queue = DownloadQueue(
+        max_workers=1,
+        downloader_factory=lambda: YouTubeDownloader(ytdlp_path=fake_ytdlp),
+        on_job_update=lambda job: updates.append((job.job_id, job.state)),
+        scheduler=ResourceScheduler(network_slots=1, min_free_bytes=0))
+    options = {'output_path': str(tmp_path / 'out'), 'quality': '720'}
+    running = queue.submit(fake_server.watch_url('running'), options)
+    queued = queue.submit(fake_server.watch_url('queued'), options)
+    done = queue.submit(fake_server.watch_url('done'), options)
+    failed = queue.submit('http://127.0.0.1:9/watch?v=unreachable', options)
+
+    deadline = time.time() + 10
+    while running.state != JobState.RUNNING and time.time() < deadline:
+        time.sleep(0.01)
+    assert queued.state == JobState.QUEUED
+    assert queue.cancel(queued.job_id)
+    assert queued.state == JobState.CANCELLED
+    assert queue.cancel(running.job_id)
+    fake_server.bandwidth = None
+    assert queue.wait(timeout=30)
+    queue.shutdown()
+
+    assert running.state == JobState.CANCELLED
+    assert done.state == JobState.DONE and os.path.isfile(done.result['filepath'])
+    assert failed.state == JobState.FAILED and failed.error
+    assert not queue.cancel(done.job_id)
+
+    def states(job):
+        return [state for job_id, state in updates if job_id == job.job_id]
+
+    assert states(done) == [JobState.QUEUED, JobState.RUNNING, JobState.DONE]
+    assert states(queued) == [JobState.QUEUED, JobState.CANCELLED]
+    assert states(running)[:2] == [JobState.QUEUED, JobState.RUNNING]
+    assert states(running)[-1] == JobState.CANCELLED
+
+    stats = queue.stats()
+    assert stats['total'] == 4
+    assert stats['states'] == {JobState.QUEUED: 0, JobState.RUNNING: 0, JobState.DONE: 1,
+                               JobState.FAILED: 1, JobState.CANCELLED: 2}
+    assert stats['bytes'] >= done.bytes_downloaded > 0
+    assert stats['jobs_per_minute'] > 0
@@ -0,0 +1,112 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pytest
+
+from cache_proxy import CacheProxy, cache_key
+
+
+@pytest.fixture
+def proxy(tmp_path):
+    proxy = CacheProxy(str(tmp_path / 'cache'))
+    proxy.start()
+    yield proxy
+    proxy.stop()
+
+
+def fetch(proxy, url, byte_range=None):
+    """GET `url` through the proxy; returns status and body"""
+    parts = urlsplit(proxy.url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+    try:
+        conn.request('GET', url, headers={'Range': f'bytes={byte_range}'} if byte_range else {})
+        response = conn.getresponse()
+        result = response.status, response.read()
+    finally:
+        conn.close()
+    # The body is cached just after its last byte is relayed
+    deadline = time.time() + 10
+    while proxy._transfers and time.time() < deadline:
+        time.sleep(0.01)
+    return result
+
+
+def test_cache_key_separates_ranges_only():
+    url = 'http://mirror.lan/media/abc/137'
+    assert cache_key(url, 'bytes=0-99') == cache_key(url, 'bytes=0-99')
+    assert cache_key(url, 'bytes=0-99') != cache_key(url, 'bytes=100-199')
+    assert cache_key(url) != cache_key(url + '?sig=2')
+
+
+def test_second_request_is_served_from_cache(proxy, fake_server, media):
+    url = f'{fake_server.base_url}/media/abc/140'
+    with open(media['140'], 'rb') as f:
+        expected = f.read()
+
+    assert fetch(proxy, url) == (200, expected)
+    assert fetch(proxy, url) == (200, expected)
+    assert fetch(proxy, url, '0-999') == (206, expected[:1000])
+
+    assert fake_server.stats()['media_requests'] == 2
+    stats = proxy.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 2)
+    assert stats['bytes_from_cache'] == len(expected)
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, fake_server):
+    proxy = CacheProxy(str(tmp_path / 'cache'), max_bytes=250000, max_object_bytes=250000)
+    proxy.start()
+    url = f'{fake_server.base_url}/media/abc/137'
+    first, second, third = '0-99999', '100000-199999', '200000-299999'
+    try:
+        fetch(proxy, url, first)
+        fetch(proxy, url, second)
+        fetch(proxy, url, first)
+        fetch(proxy, url, third)
+        stats = proxy.stats()
+        assert (stats['evictions'], stats['entries'], stats['cache_bytes']) == (1, 2, 200000)
+
+        fetch(proxy, url, first)
+        assert proxy.stats()['hits'] == 2
+        fetch(proxy, url, second)
+        assert proxy.stats()['misses'] == 4
+        assert fake_server.stats()['media_requests'] == 4
+    finally:
+        proxy.stop()
+
+
+def test_identical_concurrent_requests_share_one_fetch(proxy, fake_server, media):
+    fake_server.bandwidth = 200 * 1024
+    url = f'{fake_server.base_url}/media/abc/137'
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fetch(proxy, url, '0-149999')))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(media['137'], 'rb') as f:
+        expected = f.read(150000)
+    assert results == [(206, expected)] * 2
+    assert fake_server.stats()['media_requests'] == 1
+    stats = proxy.stats()
+    assert (stats['misses'], stats['coalesced']) == (1, 1)
+
+
+def test_restart_keeps_entries_and_drops_partial_fetches(tmp_path, fake_server):
+    cache_dir = tmp_path / 'cache'
+    proxy = CacheProxy(str(cache_dir))
+    proxy.start()
+    try:
+        fetch(proxy, f'{fake_server.base_url}/media/abc/140')
+    finally:
+        proxy.stop()
+    leftover = cache_dir / 'fetch-abc123'
+    leftover.write_bytes(b'partial')
+
+    proxy = CacheProxy(str(cache_dir))
+    assert proxy.stats()['entries'] == 1
+    assert not leftover.exists()
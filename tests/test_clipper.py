@@ -0,0 +1,54 @@
+import os
+import shutil
+
+import pytest
+
+from clipper import MODE_COPY, MODE_REENCODE, ClipExtractor
+from scheduler import ResourceScheduler
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='needs ffmpeg')
+
+
+def test_choose_mode_copies_only_from_keyframes():
+    clipper = ClipExtractor(keyframe_tolerance=0.05)
+    keyframes = [0.0, 2.0, 4.0]
+    assert clipper.choose_mode(0.0, None) == MODE_COPY
+    assert clipper.choose_mode(2.03, keyframes) == MODE_COPY
+    assert clipper.choose_mode(3.96, keyframes) == MODE_COPY
+    assert clipper.choose_mode(3.0, keyframes) == MODE_REENCODE
+    assert clipper.choose_mode(9.0, keyframes) == MODE_REENCODE
+    assert clipper.choose_mode(3.0, None) == MODE_REENCODE
+
+
+@needs_ffmpeg
+def test_extract_cuts_clips_in_order(tmp_path, media):
+    source = str(tmp_path / 'Video.mp4')
+    shutil.copy(media['18'], source)
+    scheduler = ResourceScheduler(cpu_slots=1, min_free_bytes=0)
+    clipper = ClipExtractor(max_workers=3, scheduler=scheduler)
+    assert clipper.keyframes(source)[0] == 0.0
+
+    logged = []
+    # Minutes: 0-0.6 s starts on the first keyframe, the others do not
+    clips = [(0, 0.01), (0.01, 0.02), (0.02, None)]
+    results = clipper.extract(source, clips, log_callback=logged.append)
+
+    assert [r['mode'] for r in results] == [MODE_COPY, MODE_REENCODE, MODE_REENCODE]
+    assert [(r['start'], r['end']) for r in results] == clips
+    assert [os.path.basename(r['filepath']) for r in results] == [
+        'Video [clip 1 0-0.6s].mp4', 'Video [clip 2 0.6-1.2s].mp4', 'Video [clip 3 1.2s-end].mp4']
+    for result in results:
+        assert result['success'], result.get('error')
+        assert result['size'] == os.path.getsize(result['filepath']) > 0
+    assert logged == ['Cutting 3 clips with 3 workers (1 stream copy)']
+    # Re-encodes share the single CPU slot
+    assert scheduler.stats()['peak_cpu'] == 1
+
+
+@needs_ffmpeg
+def test_cancelled_extractor_starts_no_cuts(tmp_path, media):
+    clipper = ClipExtractor()
+    clipper.cancel()
+    result = clipper.cut(media['18'], 0, 0.01, str(tmp_path / 'clip.mp4'))
+    assert result['success'] is False and result['error'] == 'Cancelled'
+    assert not os.path.exists(tmp_path / 'clip.mp4')
@@ -0,0 +1,91 @@
+import os
+import shutil
+import stat
+import threading
+
+import pytest
+
+from cookie_cache import CookieJarCache, is_auth_failure
+
+
+@pytest.fixture
+def cache():
+    cache = CookieJarCache()
+    yield cache
+    cache.close()
+
+
+def test_jar_is_extracted_once_and_copied_per_job(cache, fake_ytdlp):
+    logged = []
+    first, status, saved = cache.checkout('firefox', fake_ytdlp, logged.append)
+    assert (status, saved) == ('miss', 0.0)
+    with open(first, 'rb') as f:
+        assert f.read().startswith(b'# Netscape HTTP Cookie File')
+    assert stat.S_IMODE(os.stat(first).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(first)).st_mode) == 0o700
+
+    second, status, saved = cache.checkout('firefox', fake_ytdlp, logged.append)
+    assert status == 'hit' and saved > 0
+    assert second != first
+    assert logged[0] == 'Extracting cookies from Firefox...'
+    assert logged[-1] == 'Using cached Firefox cookies'
+
+    cache.checkin(first)
+    assert not os.path.exists(first) and os.path.exists(second)
+    stats = cache.stats()
+    assert (stats['extractions'], stats['hits'], stats['failures']) == (1, 1, 0)
+
+    directory = os.path.dirname(second)
+    cache.close()
+    assert not os.path.exists(directory)
+
+
+def test_concurrent_jobs_share_one_extraction(cache, fake_ytdlp):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.checkout('chrome', fake_ytdlp)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(status for _, status, _ in results) == ['hit', 'hit', 'hit', 'miss']
+    assert len({path for path, _, _ in results}) == 4
+    assert cache.stats()['extractions'] == 1
+
+
+def test_expired_and_refused_jars_are_extracted_again(fake_ytdlp):
+    cache = CookieJarCache(ttl=0)
+    cache.checkout('chrome', fake_ytdlp)
+    assert cache.checkout('chrome', fake_ytdlp)[1] == 'miss'
+    assert cache.stats()['refreshes'] == 1
+
+    cache.ttl = 3600
+    assert not cache.report_failure('chrome', 'HTTP Error 403: Forbidden')
+    assert cache.checkout('chrome', fake_ytdlp)[1] == 'hit'
+    assert cache.report_failure('chrome', "Sign in to confirm you're not a bot")
+    assert cache.checkout('chrome', fake_ytdlp)[1] == 'miss'
+    assert cache.stats()['invalidations'] == 1
+    assert cache.stats()['extractions'] == 3
+    cache.close()
+
+
+@pytest.mark.skipif(shutil.which('false') is None, reason='needs false')
+def test_failed_extraction_falls_back_for_a_while(fake_ytdlp):
+    cache = CookieJarCache(retry_after=3600)
+    logged = []
+    assert cache.checkout('chrome', shutil.which('false'), logged.append) == (None, 'failed', 0.0)
+    assert logged[-1] == 'Could not extract Chrome cookies'
+    # Not retried until retry_after has passed, even with a working yt-dlp
+    assert cache.checkout('chrome', fake_ytdlp) == (None, 'failed', 0.0)
+    assert cache.stats()['failures'] == 1
+
+    cache.retry_after = 0
+    assert cache.checkout('chrome', fake_ytdlp)[1] == 'miss'
+    cache.close()
+
+
+def test_is_auth_failure():
+    assert is_auth_failure('ERROR: The provided YouTube account cookies are no longer valid')
+    assert is_auth_failure('ERROR: [youtube] abc: Sign in to confirm your age')
+    assert not is_auth_failure('ERROR: unable to download video data: HTTP Error 403')
+    assert not is_auth_failure(None)
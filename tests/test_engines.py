@@ -0,0 +1,69 @@
+import functools
+import http.server
+import os
+import threading
+
+import pytest
+
+from engines import YtDlpApiEngine, api_available
+
+pytestmark = pytest.mark.skipif(not api_available(), reason='yt_dlp is not installed')
+
+
+@pytest.fixture
+def media_server(tmp_path):
+    """Static HTTP server with one small file, a.mp4"""
+    root = tmp_path / 'www'
+    root.mkdir()
+    (root / 'a.mp4').write_bytes(b'\0' * 4096)
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(root))
+    handler.log_message = lambda *args: None
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_failed_job_does_not_fail_later_jobs_on_the_same_session(media_server, tmp_path):
+    engine = YtDlpApiEngine()
+    output = str(tmp_path / 'out' / '%(title)s.%(ext)s')
+    try:
+        failed = engine.prepare(['--no-warnings', '-o', output, f'{media_server}/missing.mp4'],
+                                lambda event: None)
+        assert failed.run(lambda line: None) == 1
+
+        ok = engine.prepare(['--no-warnings', '-o', output, f'{media_server}/a.mp4'],
+                            lambda event: None)
+        assert ok.session is failed.session
+        assert ok.run(lambda line: None) == 0
+        assert os.path.isfile(tmp_path / 'out' / 'a.mp4')
+    finally:
+        engine.close()
+
+
+def _cookie_file(path, name, value):
+    path.write_text('# Netscape HTTP Cookie File\n'
+                    f'.example.com\tTRUE\t/\tFALSE\t0\t{name}\t{value}\n')
+    return str(path)
+
+
+def test_cookies_and_rate_limit_do_not_split_the_session(tmp_path):
+    engine = YtDlpApiEngine()
+    url = 'https://example.com/watch'
+    try:
+        first = engine.prepare(['--cookies', _cookie_file(tmp_path / 'a.txt', 'SID', 'first'),
+                                '--limit-rate', '1000000', url], lambda event: None)
+        assert first.session.ydl.params['ratelimit'] == 1000000
+        second = engine.prepare(['--cookies', _cookie_file(tmp_path / 'b.txt', 'SID', 'second'),
+                                 '--limit-rate', '2000000', url], lambda event: None)
+        assert second.session is first.session
+        assert second.session.ydl.params['ratelimit'] == 2000000
+        assert [c.value for c in second.session.ydl.cookiejar] == ['second']
+
+        third = engine.prepare([url], lambda event: None)
+        assert third.session is first.session
+        assert 'ratelimit' not in third.session.ydl.params
+        assert list(third.session.ydl.cookiejar) == []
+    finally:
+        engine.close()
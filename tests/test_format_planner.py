@@ -0,0 +1,101 @@
+import json
+import os
+
+import pytest
+
+from format_planner import FormatPlanner, describe, format_bytes, fragment_count
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'fixtures',
+                       'formats_youtube.json')
+
+
+@pytest.fixture(scope='module')
+def info():
+    with open(FIXTURE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('quality, expected, height', [
+    ('best', '137+140', 1080),
+    ('1080', '137+140', 1080),
+    ('720', '136+140', 720),
+])
+def test_h264_aac_wins_at_equal_height(info, quality, expected, height):
+    plan = FormatPlanner().plan(info, quality)
+
+    assert plan['format'] == expected
+    assert plan['height'] == height
+    assert plan['mp4_compatible'] is True
+    assert plan['over_cap'] is False
+
+
+@pytest.mark.parametrize('quality, expected', [('best', '399+140'), ('720', '398+140')])
+def test_without_the_preference_the_smaller_codec_wins(info, quality, expected):
+    plan = FormatPlanner(prefer_mp4_native=False).plan(info, quality)
+
+    assert plan['format'] == expected
+    assert plan['mp4_compatible'] is False
+
+
+def test_audio_preset_picks_aac(info):
+    plan = FormatPlanner().plan(info, 'audio')
+
+    assert plan['format'] == '140'
+    assert plan['height'] is None
+    assert plan['estimated_bytes'] == 3431750
+
+
+def test_size_cap_keeps_the_resolution_with_a_smaller_codec(info):
+    plan = FormatPlanner(max_bytes=50e6).plan(info, 'best')
+
+    assert plan['format'] == '399+140'
+    assert plan['height'] == 1080
+    assert plan['over_cap'] is False
+
+
+def test_size_cap_steps_down_a_resolution(info):
+    plan = FormatPlanner(max_bytes=40e6).plan(info, 'best')
+
+    assert plan['format'] == '136+140'
+    assert plan['height'] == 720
+
+
+def test_bitrate_cap(info):
+    # 136+140 is 1333 kbit/s; AV1 at 720p is 942
+    plan = FormatPlanner(max_bitrate=1000).plan(info, 'best')
+
+    assert plan['format'] == '398+140'
+    assert plan['height'] == 720
+
+
+def test_nothing_fits_the_cap(info):
+    plan = FormatPlanner(max_bytes=1).plan(info, 'best')
+
+    assert plan['over_cap'] is True
+    assert plan['format'] == '394+140'
+
+
+def test_fallback_selector(info):
+    merged = FormatPlanner().plan(info, '720', fallback='bv*[height<=720]+ba/b')
+    split = FormatPlanner().plan(info, '720', merge=False, fallback='bv[height<=720],ba')
+
+    assert merged['format'] == '136+140/bv*[height<=720]+ba/b'
+    assert split['format'] == '136/bv[height<=720],140/ba'
+
+
+def test_describe(info):
+    text = describe(FormatPlanner(prefer_mp4_native=False).plan(info, '720'))
+
+    assert text.startswith('398 (av01.0.05M.08) + 140 (mp4a.40.2), about 23.8 MiB')
+    assert text.endswith('not H.264/AAC')
+    assert describe(None) == 'no usable formats'
+
+
+def test_sizes_and_fragments(info):
+    formats = {f['format_id']: f for f in info['formats']}
+
+    assert format_bytes(formats['137'], info['duration']) == 61445550
+    # HLS without a size: bitrate x duration
+    assert format_bytes(formats['95'], info['duration']) == pytest.approx(2490.8 * 125 * 212)
+    assert fragment_count(formats['137'], info['duration']) == 1
+    assert fragment_count(formats['95'], info['duration']) == 43
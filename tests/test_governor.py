@@ -0,0 +1,39 @@
+from governor import BLOCK_BOT, BLOCK_RATE_LIMITED, RateGovernor, classify_error
+
+URL = 'https://www.youtube.com/watch?v=video000001'
+
+
+def _names(rungs):
+    return [rung['name'] for rung in rungs]
+
+
+def test_cookie_step_uses_the_configured_browser():
+    rungs = RateGovernor(cookies_browser='firefox').strategies({})
+
+    assert _names(rungs) == ['alternate-client', 'browser-cookies', 'single-file']
+    assert rungs[1]['cookies_browser'] == 'firefox'
+
+
+def test_cookie_step_is_skipped_without_a_browser_or_when_the_job_has_cookies():
+    assert 'browser-cookies' not in _names(RateGovernor().strategies({}))
+    assert 'browser-cookies' not in _names(
+        RateGovernor(cookies_browser='firefox').strategies({'cookies_browser': 'chrome'}))
+
+
+def test_a_failure_without_error_text_keeps_the_backoff_streak():
+    governor = RateGovernor(base_backoff=0.01, jitter=0)
+    assert governor.report(URL, 'ERROR: HTTP Error 429: Too Many Requests') == BLOCK_RATE_LIMITED
+    assert governor.retry_args()[:2] == ['--retries', '1']
+
+    # A cancelled job returns no error text; that is not a success
+    assert governor.report(URL, '') is None
+    assert governor.retry_args()[:2] == ['--retries', '1']
+
+    assert governor.report(URL, None) is None
+    assert governor.retry_args()[:2] == ['--retries', '3']
+
+
+def test_classify_error():
+    assert classify_error("Sign in to confirm you're not a bot") == BLOCK_BOT
+    assert classify_error('ERROR: Video unavailable') is None
+    assert classify_error('') is None
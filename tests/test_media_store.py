@@ -0,0 +1,158 @@
+import os
+import sqlite3
+
+import pytest
+
+from downloader import YouTubeDownloader
+from format_planner import FormatPlanner
+from media_store import MediaStore, formats_key
+from probe_cache import ProbeCache
+
+URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MediaStore(tmp_path / 'store')
+    yield store
+    store.close()
+
+
+def make_file(folder, name, content=b'video data'):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_formats_key_ignores_order():
+    assert formats_key(['140', '137']) == formats_key(['137', '140']) == '137+140'
+
+
+def test_adopt_and_materialize_by_format_ids(store, tmp_path):
+    original = make_file(tmp_path / 'alice', 'Video.mp4')
+    adopted = store.adopt(URL, original, ['137', '140'], preset='best')
+    assert not adopted['deduplicated']
+    assert os.path.isfile(store.object_path(adopted['hash'], '.mp4'))
+
+    linked = store.materialize('https://youtu.be/dQw4w9WgXcQ', tmp_path / 'bob', ['140', '137'])
+    assert linked == str(tmp_path / 'bob' / 'Video.mp4')
+    with open(linked, 'rb') as f:
+        assert f.read() == b'video data'
+    # Same link asked for again is found in place
+    assert store.materialize(URL, tmp_path / 'bob', ['137', '140']) == linked
+
+    # Other streams of the same video, or another clip range, are different entries
+    assert store.materialize(URL, tmp_path / 'carol', ['18']) is None
+    assert store.materialize(URL, tmp_path / 'carol', ['137', '140'], clip='1-2') is None
+    assert store.formats_for(URL, 'best') == ['137', '140']
+    assert store.formats_for(URL, '720') is None
+    assert store.stats()['hits'] == 2
+    assert store.stats()['misses'] == 2
+
+
+def test_presets_resolving_to_the_same_formats_share_the_object(store, tmp_path):
+    best = make_file(tmp_path / 'alice', 'Video.mp4')
+    same = make_file(tmp_path / 'bob', 'Video.mp4')
+    store.adopt(URL, best, ['137', '140'], preset='best')
+    adopted = store.adopt(URL, same, ['137', '140'], preset='1080')
+    assert adopted['deduplicated']
+    assert store.formats_for(URL, 'best') == store.formats_for(URL, '1080') == ['137', '140']
+    assert store.stats()['objects'] == 1
+
+    with pytest.raises(ValueError):
+        store.adopt(URL, best, [])
+
+
+def test_name_taken_by_other_content_gets_the_video_tag(store, tmp_path):
+    store.adopt(URL, make_file(tmp_path / 'alice', 'Video.mp4'), ['18'])
+    make_file(tmp_path / 'bob', 'Video.mp4', b'something else')
+    linked = store.materialize(URL, tmp_path / 'bob', ['18'])
+    assert linked == str(tmp_path / 'bob' / 'Video [dQw4w9WgXcQ].mp4')
+
+
+def test_gc_counts_references(store, tmp_path):
+    original = make_file(tmp_path / 'alice', 'Video.mp4')
+    digest = store.adopt(URL, original, ['18'])['hash']
+    first = store.materialize(URL, tmp_path / 'bob', ['18'])
+    second = store.materialize(URL, tmp_path / 'carol', ['18'])
+    assert store.refcount(digest) == 3
+
+    os.remove(first)
+    assert store.refcount(digest) == 2
+    assert store.gc(grace=0) == {'links_removed': 1, 'objects_removed': 0, 'bytes_freed': 0,
+                                 'orphans_removed': 0}
+    assert store.stats()['links'] == 2
+
+    os.remove(original)
+    # Replaced by another file: no longer a reference
+    os.remove(second)
+    make_file(tmp_path / 'carol', 'Video.mp4', b'new video')
+    assert store.refcount(digest) == 0
+
+
+def test_gc_dry_run_reports_without_removing(store, tmp_path):
+    original = make_file(tmp_path / 'alice', 'Video.mp4')
+    digest = store.adopt(URL, original, ['18'])['hash']
+    object_path = store.object_path(digest, '.mp4')
+    os.remove(original)
+
+    report = store.gc(grace=0, dry_run=True)
+    assert report == {'links_removed': 1, 'objects_removed': 1, 'bytes_freed': 10}
+    assert os.path.isfile(object_path)
+    assert store.stats()['links'] == 1
+
+    # Young objects are kept for the grace period
+    report = store.gc()
+    assert (report['links_removed'], report['objects_removed']) == (1, 0)
+    assert os.path.isfile(object_path)
+
+    report = store.gc(grace=0)
+    assert report['objects_removed'] == 1 and report['bytes_freed'] == 10
+    assert not os.path.exists(object_path)
+    assert store.stats()['objects'] == 0
+    assert store.materialize(URL, tmp_path / 'bob', ['18']) is None
+
+
+def test_downloader_links_a_repeat_request_for_other_presets(store, tmp_path, fake_server,
+                                                             fake_ytdlp):
+    downloader = YouTubeDownloader(ytdlp_path=fake_ytdlp, media_store=store,
+                                   probe_cache=ProbeCache(tmp_path / 'probe.db'),
+                                   planner=FormatPlanner())
+    url = fake_server.watch_url('abc')
+
+    first = downloader.download(url, {'output_path': str(tmp_path / 'alice'), 'quality': 'best'})
+    assert first['success'] and not first.get('stored')
+    fetched = fake_server.stats()['media_requests']
+    assert store.formats_for(url, 'best') == sorted(first['format_ids'])
+
+    # 'best' and '720' pick the same streams here, so nothing is fetched
+    second = downloader.download(url, {'output_path': str(tmp_path / 'bob'), 'quality': '720'})
+    assert second['success'] and second['stored']
+    assert fake_server.stats()['media_requests'] == fetched
+    assert os.path.samefile(first['filepath'], second['filepath'])
+
+    # 'audio' resolves to another format and is downloaded
+    third = downloader.download(url, {'output_path': str(tmp_path / 'carol'), 'quality': 'audio'})
+    assert third['success'] and not third.get('stored')
+    assert fake_server.stats()['media_requests'] > fetched
+    assert store.stats()['objects'] == 2
+
+
+def test_entries_keyed_by_preset_are_dropped(tmp_path):
+    root = tmp_path / 'store'
+    root.mkdir()
+    db = sqlite3.connect(str(root / 'store.db'))
+    db.execute('CREATE TABLE entries (video TEXT NOT NULL, format TEXT NOT NULL, '
+               'clip TEXT NOT NULL, hash TEXT NOT NULL, name TEXT NOT NULL, '
+               'created REAL NOT NULL, PRIMARY KEY (video, format, clip))')
+    db.execute("INSERT INTO entries VALUES ('youtube:dQw4w9WgXcQ', 'best', '', 'x', 'a.mp4', 0)")
+    db.commit()
+    db.close()
+
+    store = MediaStore(root)
+    assert store.formats_for(URL, 'best') is None
+    store.adopt(URL, make_file(tmp_path / 'alice', 'Video.mp4'), ['18'])
+    assert store.formats_for(URL, 'best') == ['18']
+    store.close()
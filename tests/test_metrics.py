@@ -0,0 +1,93 @@
+import json
+import time
+
+from batch import DownloadQueue, JobState
+from downloader import YouTubeDownloader
+from metrics import Histogram, MetricsRecorder, PhaseClock
+from scheduler import ResourceScheduler
+
+
+def test_phase_clock_splits_time_into_phases(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    clock = PhaseClock()
+    clock.start('spawn')
+    now[0] += 0.5
+    clock.advance('transfer')
+    now[0] += 2.0
+    # Going back to an earlier phase is ignored
+    clock.advance('first_byte')
+    now[0] += 1.0
+    clock.start('merge')
+    now[0] += 0.25
+    clock.stop()
+    clock.add('backoff', 3.0)
+    clock.add('backoff', 0)
+    assert clock.timings == {'spawn': 0.5, 'transfer': 3.0, 'merge': 0.25, 'backoff': 3.0}
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+    assert histogram.counts == [2, 3]
+    assert (histogram.count, histogram.sum) == (4, 14.5)
+
+
+def test_recorder_writes_json_lines_and_prometheus_text(tmp_path):
+    jsonl, prom = tmp_path / 'jobs.jsonl', tmp_path / 'ytd.prom'
+    recorder = MetricsRecorder(str(jsonl), str(prom), buckets=(1, 10))
+    recorder.record({'state': 'done', 'duration': 4.0, 'bytes': 1000, 'attempts': 1,
+                     'retries': 2, 'probe_cache': 'hit', 'strategy': 'web_client',
+                     'timings': {'extract': 0.5, 'transfer': 3.0}})
+    recorder.record({'state': 'failed', 'duration': 20.0, 'attempts': 2,
+                     'blocked': 'bot "check"', 'timings': {'extract': 2.0}})
+    recorder.close()
+
+    lines = [json.loads(line) for line in jsonl.read_text().splitlines()]
+    assert [line['state'] for line in lines] == ['done', 'failed']
+    assert all('ts' in line for line in lines)
+
+    text = prom.read_text()
+    assert text == recorder.prometheus_text()
+    for sample in ('ytd_jobs_total{state="done"} 1',
+                   'ytd_jobs_total{state="failed"} 1',
+                   'ytd_job_duration_seconds_bucket{le="10"} 1',
+                   'ytd_job_duration_seconds_bucket{le="+Inf"} 2',
+                   'ytd_job_duration_seconds_sum 24.0',
+                   'ytd_phase_seconds_bucket{phase="extract",le="1"} 1',
+                   'ytd_phase_seconds_count{phase="extract"} 2',
+                   'ytd_downloaded_bytes_total 1000',
+                   'ytd_attempts_total 3',
+                   'ytd_ytdlp_retries_total 2',
+                   'ytd_fallbacks_total{strategy="web_client"} 1',
+                   'ytd_blocked_jobs_total{reason="bot \\"check\\""} 1',
+                   'ytd_cache_lookups_total{cache="probe",result="hit"} 1',
+                   '# TYPE ytd_phase_seconds histogram'):
+        assert sample in text.splitlines()
+    assert 'ytd_queued 3' in recorder.prometheus_text({'queued': 3})
+
+    summary = recorder.summary()
+    assert summary['jobs'] == {'done': 1, 'failed': 1}
+    assert summary['phases']['extract'] == {'count': 2, 'seconds': 2.5, 'mean': 1.25}
+
+
+def test_queue_records_every_finished_job(tmp_path, fake_server, fake_ytdlp):
+    recorder = MetricsRecorder(str(tmp_path / 'jobs.jsonl'))
+    queue = DownloadQueue(
+        max_workers=2,
+        downloader_factory=lambda: YouTubeDownloader(ytdlp_path=fake_ytdlp),
+        scheduler=ResourceScheduler(network_slots=2, min_free_bytes=0), metrics=recorder)
+    jobs = [queue.submit(fake_server.watch_url(video_id), {'output_path': str(tmp_path / 'out')})
+            for video_id in ('a', 'b')]
+    assert queue.wait(timeout=30)
+    queue.shutdown()
+    recorder.close()
+    assert [job.state for job in jobs] == [JobState.DONE, JobState.DONE]
+
+    records = [json.loads(line) for line in (tmp_path / 'jobs.jsonl').read_text().splitlines()]
+    assert sorted(record['state'] for record in records) == ['done', 'done']
+    for record in records:
+        assert record['bytes'] > 0
+        assert {'spawn', 'transfer', 'merge'} <= set(record['timings'])
+    assert recorder.summary()['phases']['transfer']['count'] == 2
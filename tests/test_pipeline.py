@@ -0,0 +1,35 @@
+from pipeline import Pipeline, PipelineJob, _stream_stem
+
+URL = 'https://www.youtube.com/watch?v=video000001'
+
+
+def test_stream_stem_only_strips_downloaded_format_ids():
+    assert _stream_stem('/d/Intro.final.f137.mp4', ['137', '140']) == '/d/Intro.final'
+    assert _stream_stem('/d/Intro.final.mp4', ['137', '140']) is None
+    assert _stream_stem('/d/Demo.fixed.mkv', []) is None
+    assert _stream_stem('/d/clip.f251-drc.webm', ['251-drc']) == '/d/clip'
+
+
+def test_merge_keeps_archived_files_in_place(tmp_path):
+    path = tmp_path / 'Intro.final.mp4'
+    path.write_bytes(b'data')
+    job = PipelineJob(1, URL, {})
+    job.files = [str(path)]
+    job.archived = True
+
+    Pipeline()._merge(job, {})
+
+    assert path.exists()
+    assert job.filepaths == [str(path)]
+
+
+def test_merge_names_a_single_stream_after_the_title(tmp_path):
+    (tmp_path / 'Intro.final.f18.mp4').write_bytes(b'data')
+    job = PipelineJob(1, URL, {})
+    job.files = [str(tmp_path / 'Intro.final.f18.mp4')]
+    job._fetch_result = {'success': True, 'format_ids': ['18']}
+
+    Pipeline()._merge(job, {})
+
+    assert job.filepaths == [str(tmp_path / 'Intro.final.mp4')]
+    assert (tmp_path / 'Intro.final.mp4').read_bytes() == b'data'
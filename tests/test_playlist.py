@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+from archive import DownloadArchive
+from playlist import PlaylistExpander, is_collection_url, parse_flat_entry
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'fixtures',
+                       'flat_playlist.jsonl')
+
+
+@pytest.fixture
+def lines():
+    with open(FIXTURE, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def flat_line(**data):
+    return json.dumps(dict({'_type': 'url'}, **data))
+
+
+def test_parse_flat_entry_reads_a_video_line(lines):
+    entry = parse_flat_entry(lines[0])
+    assert entry == {'url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'id': 'dQw4w9WgXcQ',
+                     'title': 'Video 1', 'index': 1, 'duration': 201, 'nested': False}
+
+
+def test_parse_flat_entry_expands_bare_ids_and_skips_noise():
+    entry = parse_flat_entry(flat_line(ie_key='Youtube', id='abc', url='abc'))
+    assert entry['url'] == 'https://www.youtube.com/watch?v=abc'
+    assert parse_flat_entry('[youtube:tab] Downloading page 1') is None
+    assert parse_flat_entry('{not json') is None
+    assert parse_flat_entry(flat_line(id='abc')) is None
+
+
+def test_parse_flat_entry_marks_nested_collections():
+    tab = parse_flat_entry(flat_line(ie_key='YoutubeTab', title='Shorts',
+                                     url='https://www.youtube.com/@example/shorts'))
+    playlist = parse_flat_entry(flat_line(url='https://www.youtube.com/playlist?list=PL123'))
+    video_in_list = parse_flat_entry(flat_line(
+        ie_key='Youtube', url='https://www.youtube.com/watch?v=abc&list=PL123'))
+    assert tab['nested'] and playlist['nested']
+    assert not video_in_list['nested']
+    assert not is_collection_url('https://www.youtube.com/watch?v=abc&list=PL123')
+
+
+def test_expand_lines_drops_duplicates(lines):
+    expander = PlaylistExpander()
+    entries = list(expander.expand_lines(lines))
+    assert [entry['title'] for entry in entries] == [f'Video {n}' for n in range(1, 6)]
+    assert expander.stats() == {'listed': 6, 'new': 5, 'duplicates': 1, 'archived': 0}
+
+
+def test_expand_lines_skips_archived_and_excluded_videos(lines, tmp_path):
+    video = tmp_path / 'Video 2.mp4'
+    video.write_bytes(b'video')
+    archive = DownloadArchive(str(tmp_path / 'archive.db'))
+    archive.record('https://youtu.be/9bZkp7q19f0', str(video), format_key='720')
+    logged = []
+
+    expander = PlaylistExpander(archive=archive, format_key='720')
+    expander.exclude(['https://www.youtube.com/shorts/kJQP7kiw5Fk'])
+    entries = list(expander.expand_lines(lines, logged.append))
+    assert [entry['id'] for entry in entries] == ['dQw4w9WgXcQ', 'JGwWNGJdvx8', 'OPf0YbXqDm0']
+    assert expander.stats() == {'listed': 6, 'new': 3, 'duplicates': 2, 'archived': 1}
+    assert logged == ['Already downloaded: Video 2']
+
+    # The archive entry is for another quality preset
+    other = PlaylistExpander(archive=archive, format_key='best')
+    assert len(list(other.expand_lines(lines))) == 5
+    archive.close()
+
+
+def test_expand_lines_passes_nested_entries_through(lines):
+    tab = flat_line(ie_key='YoutubeTab', title='Shorts',
+                    url='https://www.youtube.com/@example/shorts')
+    expander = PlaylistExpander()
+    entries = list(expander.expand_lines([tab, tab] + lines[:2]))
+    assert [entry['nested'] for entry in entries] == [True, True, False, False]
+    assert expander.stats()['listed'] == 2
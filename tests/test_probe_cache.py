@@ -0,0 +1,86 @@
+import pytest
+
+import probe_cache
+from probe_cache import ProbeCache, stream_expiry
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(probe_cache.time, 'time', clock)
+    return clock
+
+
+def info(video_id, expire=None, padding=0):
+    url = f'https://rr1.googlevideo.com/videoplayback?id={video_id}'
+    if expire is not None:
+        url += f'&expire={int(expire)}'
+    return {'id': video_id, 'formats': [{'format_id': '18', 'url': url}],
+            'description': 'x' * padding}
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = ProbeCache(tmp_path / 'probe.db', ttl=60)
+    cache.put('youtube:a', info('a'))
+    clock.now += 59
+    assert cache.get('youtube:a') == info('a')
+    clock.now += 2
+    assert cache.get('youtube:a') is None
+    assert cache.stats()['expired'] == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_signed_stream_urls_shorten_the_ttl(tmp_path, clock):
+    cache = ProbeCache(tmp_path / 'probe.db', ttl=3600, expiry_margin=600)
+    data = info('a', expire=clock.now + 1000)
+    assert stream_expiry(data) == clock.now + 1000
+    cache.put('youtube:a', data)
+    clock.now += 399
+    assert cache.get('youtube:a') is not None
+    clock.now += 2
+    assert cache.get('youtube:a') is None
+
+    # Links that expire within the margin are not cached at all
+    cache.put('youtube:b', info('b', expire=clock.now + 300))
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ProbeCache(tmp_path / 'probe.db', max_entries=2)
+    cache.put('youtube:a', info('a'))
+    clock.now += 1
+    cache.put('youtube:b', info('b'))
+    clock.now += 1
+    assert cache.get('youtube:a') is not None
+    clock.now += 1
+    cache.put('youtube:c', info('c'))
+
+    assert cache.get('youtube:b') is None
+    assert cache.get('youtube:a') is not None
+    assert cache.get('youtube:c') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_size_budget_evicts_oldest_first(tmp_path, clock):
+    cache = ProbeCache(tmp_path / 'probe.db', max_bytes=1)
+    cache.put('youtube:a', info('a'))
+    assert cache.stats()['entries'] == 0
+
+    cache = ProbeCache(tmp_path / 'probe2.db')
+    cache.put('youtube:a', info('a', padding=1000))
+    clock.now += 1
+    cache.put('youtube:b', info('b', padding=1000))
+    cache.max_bytes = cache.stats()['bytes'] - 1
+    clock.now += 1
+    cache.put('youtube:c', info('c'))
+    assert cache.get('youtube:a') is None
+    assert cache.get('youtube:b') is not None
+    cache.close()
@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from downloader import YouTubeDownloader
+from progress import (PROGRESS_MARKER, ProgressTracker, parse_filepath_line, parse_format_line,
+                      parse_progress_line)
+
+MIB = 1024 ** 2
+
+
+def template_line(status, downloaded, total='NA', estimate='NA', speed='NA', eta='NA'):
+    """A line as yt-dlp prints PROGRESS_TEMPLATE"""
+    return f'{PROGRESS_MARKER} {status} {downloaded} {total} {estimate} {speed} {eta}'
+
+
+def test_template_line():
+    event = parse_progress_line(template_line('downloading', 2048, 8192, 'NA', 1024.5, 6))
+    assert event == {'status': 'downloading', 'downloaded_bytes': 2048, 'total_bytes': 8192,
+                     'speed': 1024.5, 'eta': 6.0, 'percent': 25.0}
+
+
+def test_template_line_falls_back_to_the_estimate():
+    event = parse_progress_line('  ' + template_line('downloading', 500, 'NA', 1000.0) + '\n')
+    assert (event['total_bytes'], event['percent'], event['speed'], event['eta']) == \
+        (1000, 50.0, None, None)
+
+
+def test_template_line_with_missing_fields_is_ignored():
+    assert parse_progress_line(f'{PROGRESS_MARKER} downloading 500') is None
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('[download]  12.5% of   10.00MiB at    1.00MiB/s ETA 00:09',
+     {'status': 'downloading', 'downloaded_bytes': int(1.25 * MIB), 'total_bytes': 10 * MIB,
+      'speed': 1.0 * MIB, 'eta': 9.0, 'percent': 12.5}),
+    ('[download]  50.0% of ~  4.00MiB at  512.00KiB/s ETA 01:02:03 (frag 3/40)',
+     {'status': 'downloading', 'downloaded_bytes': 2 * MIB, 'total_bytes': 4 * MIB,
+      'speed': 512.0 * 1024, 'eta': 3723.0, 'percent': 50.0}),
+    ('[download]   5.0% of  200.00KiB at  Unknown B/s ETA Unknown',
+     {'status': 'downloading', 'downloaded_bytes': 10240, 'total_bytes': 204800,
+      'speed': None, 'eta': None, 'percent': 5.0}),
+    ('[download] 100% of   10.00MiB in 00:00:05 at 2.00MiB/s',
+     {'status': 'finished', 'downloaded_bytes': 10 * MIB, 'total_bytes': 10 * MIB,
+      'speed': None, 'eta': None, 'percent': 100.0}),
+])
+def test_default_download_lines(line, expected):
+    assert parse_progress_line(line) == expected
+
+
+@pytest.mark.parametrize('line', [
+    '[download] Destination: Video.f137.mp4',
+    '[Merger] Merging formats into "Video.mp4"',
+    '[youtube] dQw4w9WgXcQ: Downloading webpage',
+    '',
+])
+def test_other_lines_are_not_progress(line):
+    assert parse_progress_line(line) is None
+
+
+def test_print_lines():
+    assert parse_filepath_line('__YTD_FILEPATH__ /tmp/Video.mp4') == '/tmp/Video.mp4'
+    assert parse_filepath_line('__YTD_FILEPATH__ NA') is None
+    assert parse_format_line('__YTD_FORMAT__ 137+140') == ['137', '140']
+    assert parse_format_line('[download] 100%') is None
+
+
+def test_tracker_adds_up_fragments_of_one_file():
+    tracker = ProgressTracker()
+    # Fragment downloads report a running total and a changing estimate
+    for downloaded, estimate in ((1000, 40000), (5000, 42000), (21000, 41000), (40500, 40500)):
+        tracker.update(parse_progress_line(template_line('downloading', downloaded, 'NA',
+                                                         estimate, 2000.0)))
+    tracker.update(parse_progress_line(template_line('finished', 40500, 40500)))
+    assert tracker.downloaded_bytes == 40500
+    assert tracker.summary()['peak_speed'] == 2000.0
+
+
+def test_tracker_adds_up_video_and_audio_of_a_merged_download():
+    tracker = ProgressTracker()
+    for line in ('[download]  50.0% of   4.00MiB at  1.00MiB/s ETA 00:02',
+                 '[download] 100% of   4.00MiB in 00:00:04 at 1.00MiB/s',
+                 '[download]  25.0% of   1.00MiB at  3.00MiB/s ETA 00:01'):
+        tracker.update(parse_progress_line(line))
+    assert tracker.downloaded_bytes == 4 * MIB + MIB // 4
+    tracker.update(parse_progress_line('[download] 100% of   1.00MiB in 00:00:01 at 1.00MiB/s'))
+    assert tracker.downloaded_bytes == 5 * MIB
+    assert tracker.summary()['peak_speed'] == 3.0 * MIB
+
+
+def test_tracker_counts_a_file_that_ended_without_finished_event():
+    tracker = ProgressTracker()
+    for status, downloaded in (('downloading', 3000), ('downloading', 4000),
+                               ('downloading', 100), ('finished', 800)):
+        tracker.update({'status': status, 'downloaded_bytes': downloaded})
+    assert tracker.downloaded_bytes == 4800
+
+
+def test_downloader_reports_the_bytes_of_both_streams(tmp_path, fake_server, fake_ytdlp, media):
+    events = []
+    result = YouTubeDownloader(ytdlp_path=fake_ytdlp).download(
+        fake_server.watch_url('abc'),
+        {'output_path': str(tmp_path), 'progress_callback': events.append})
+    assert result['success']
+    assert sorted(result['format_ids']) == ['137', '140']
+    expected = os.path.getsize(media['137']) + os.path.getsize(media['140'])
+    assert result['downloaded_bytes'] == expected
+    assert events and events[-1]['status'] == 'finished'
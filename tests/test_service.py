@@ -0,0 +1,151 @@
+import asyncio
+import http.client
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from batch import DownloadQueue, JobState
+from downloader import YouTubeDownloader
+from scheduler import ResourceScheduler
+from service import JobService
+
+
+@pytest.fixture
+def service(tmp_path, fake_ytdlp, fake_server):
+    """JobService on a free localhost port, downloading from the fake server"""
+    root = tmp_path / 'downloads'
+    root.mkdir()
+
+    def queue_factory(on_job_update, on_job_progress):
+        return DownloadQueue(
+            max_workers=2,
+            downloader_factory=lambda: YouTubeDownloader(ytdlp_path=fake_ytdlp),
+            on_job_update=on_job_update, on_job_progress=on_job_progress,
+            scheduler=ResourceScheduler(network_slots=2, min_free_bytes=0))
+
+    job_service = JobService(queue_factory, defaults={'output_path': str(root)},
+                             ytdlp_path=fake_ytdlp, progress_interval=0)
+    loop = asyncio.new_event_loop()
+    address = []
+    ready = threading.Event()
+    task = loop.create_task(job_service.serve('127.0.0.1', 0,
+                                              ready=lambda a: (address.append(a), ready.set())))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    job_service.port = address[0][1]
+    job_service.root = root
+    job_service.media = fake_server
+    yield job_service
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(5)
+    job_service.close()
+    loop.close()
+
+
+def request(service, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', service.port, timeout=10)
+    try:
+        data = json.dumps(body) if body is not None else None
+        conn.request(method, path, body=data, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b'null')
+    finally:
+        conn.close()
+
+
+def wait_for_state(service, job_id, states, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status, job = request(service, 'GET', f'/jobs/{job_id}')
+        assert status == 200
+        if job['state'] in states:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} stuck in {job["state"]}')
+
+
+def test_post_and_get_a_job(service):
+    url = service.media.watch_url('v1')
+    status, created = request(service, 'POST', '/jobs', {'url': url, 'quality': '720'})
+
+    assert status == 202
+    assert [job['url'] for job in created['jobs']] == [url]
+    job = wait_for_state(service, created['jobs'][0]['id'], JobState.FINISHED)
+    assert job['state'] == JobState.DONE
+    assert os.path.dirname(job['filepath']) == str(service.root)
+    assert os.path.isfile(job['filepath'])
+
+    status, listing = request(service, 'GET', '/jobs')
+    assert status == 200
+    assert [j['id'] for j in listing['jobs']] == [job['id']]
+
+
+def test_delete_cancels_a_running_job(service):
+    service.media.bandwidth = 64 * 1024
+    status, created = request(service, 'POST', '/jobs', {'url': service.media.watch_url('slow')})
+    job_id = created['jobs'][0]['id']
+    wait_for_state(service, job_id, (JobState.RUNNING,))
+
+    status, job = request(service, 'DELETE', f'/jobs/{job_id}')
+    assert status == 200
+    assert wait_for_state(service, job_id, JobState.FINISHED)['state'] == JobState.CANCELLED
+
+    status, error = request(service, 'DELETE', f'/jobs/{job_id}')
+    assert status == 409
+    assert request(service, 'DELETE', '/jobs/999')[0] == 404
+
+
+def test_event_stream_reports_progress_until_the_job_is_done(service):
+    service.media.bandwidth = 512 * 1024
+    status, created = request(service, 'POST', '/jobs', {'url': service.media.watch_url('v2')})
+    job_id = created['jobs'][0]['id']
+
+    conn = http.client.HTTPConnection('127.0.0.1', service.port, timeout=20)
+    conn.request('GET', f'/jobs/{job_id}/events')
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.getheader('Content-Type') == 'text/event-stream'
+    events = []
+    for line in response:
+        if line.startswith(b'data: '):
+            events.append(json.loads(line[6:]))
+    conn.close()
+
+    assert {event['id'] for event in events} == {job_id}
+    assert 'progress' in [event['type'] for event in events]
+    assert events[-1]['type'] == 'state'
+    assert events[-1]['job']['state'] == JobState.DONE
+
+
+def test_output_path_must_stay_in_the_download_folder(service, tmp_path):
+    url = service.media.watch_url('v3')
+    for path in (str(tmp_path / 'elsewhere'), '../elsewhere', '/etc', 7):
+        status, error = request(service, 'POST', '/jobs', {'url': url, 'output_path': path})
+        assert status == 400, path
+        assert 'output_path' in error['error']
+    os.symlink(tmp_path, service.root / 'escape')
+    assert request(service, 'POST', '/jobs', {'url': url, 'output_path': 'escape/x'})[0] == 400
+
+    status, created = request(service, 'POST', '/jobs', {'url': url, 'output_path': 'music'})
+    assert status == 202
+    job = wait_for_state(service, created['jobs'][0]['id'], JobState.FINISHED)
+    assert os.path.dirname(job['filepath']) == str(service.root / 'music')
+
+
+@pytest.mark.parametrize('length', ['abc', '-5'])
+def test_bad_content_length_is_a_client_error(service, length):
+    status, error = request(service, 'POST', '/jobs', headers={'Content-Length': length})
+
+    assert status == 400
+    assert 'Content-Length' in error['error']
@@ -0,0 +1,47 @@
+import pytest
+
+from transfer import TransferTuner
+
+
+@pytest.mark.parametrize('jobs', [2, 5, 8, 16])
+def test_jobs_started_together_stay_within_the_budget(jobs):
+    tuner = TransferTuner(max_connections=16, max_jobs=jobs)
+    # One measured job, so the tuner tries doubling its count
+    tuner.finish(tuner.begin(), downloaded_bytes=8 * 1024 ** 2, seconds=1.0)
+
+    transfers = [tuner.begin() for _ in range(jobs)]
+
+    assert sum(t['fragments'] for t in transfers) <= 16
+    assert tuner.stats()['peak_connections'] <= 16
+    assert all(t['fragments'] >= 1 for t in transfers)
+
+
+def test_finished_jobs_give_their_connections_back():
+    tuner = TransferTuner(max_connections=4, initial=2)
+    first, second = tuner.begin(), tuner.begin()
+    assert tuner.stats()['active_connections'] == 4
+
+    tuner.finish(first)
+    tuner.finish(second)
+
+    assert tuner.stats()['active_connections'] == 0
+    assert tuner.begin()['fragments'] == 2
+
+
+def test_fixed_count_and_args():
+    tuner = TransferTuner(fixed=3, chunk_size=1024)
+
+    transfer = tuner.begin()
+
+    assert transfer['fragments'] == 3
+    assert transfer['args'] == ['--concurrent-fragments', '3', '--http-chunk-size', '1024']
+
+
+def test_new_jobs_only_get_what_is_left_of_the_budget():
+    tuner = TransferTuner(max_connections=8, initial=4)
+    tuner.finish(tuner.begin(), downloaded_bytes=8 * 1024 ** 2, seconds=1.0)
+    first = tuner.begin()
+    assert first['fragments'] == 8
+
+    # The first job still holds all 8, so the next gets the minimum
+    assert tuner.begin()['fragments'] == 1
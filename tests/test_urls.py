@@ -0,0 +1,43 @@
+import pytest
+
+from urls import extract_video_id, parse_url_list, video_key
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtube.com/watch?v=dQw4w9WgXcQ&t=42s&list=PL123',
+    'https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ',
+    'youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ?si=abc',
+    'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+    'https://www.youtube.com/embed/dQw4w9WgXcQ?autoplay=1',
+    'https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ',
+    'https://www.youtube.com/live/dQw4w9WgXcQ',
+    '  https://www.youtube.com/watch?v=dQw4w9WgXcQ\n',
+])
+def test_video_key_collapses_every_link_form(url):
+    assert video_key(url) == 'youtube:dQw4w9WgXcQ'
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.youtube.com/watch?v=short',
+    'https://www.youtube.com/playlist?list=PL123',
+    'https://notyoutube.com/watch?v=dQw4w9WgXcQ',
+    'https://vimeo.com/123456',
+])
+def test_other_links_have_no_video_id(url):
+    assert extract_video_id(url) is None
+
+
+def test_video_key_falls_back_to_the_normalized_url():
+    assert video_key('vimeo.com/123456 ') == 'url:https://vimeo.com/123456'
+
+
+def test_parse_url_list_splits_and_dedupes():
+    text = ('# my list\n'
+            'youtu.be/dQw4w9WgXcQ, https://vimeo.com/1;https://vimeo.com/1\n'
+            '\n'
+            'https://www.youtube.com/watch?v=9bZkp7q19f0 https://youtu.be/dQw4w9WgXcQ\n')
+    assert parse_url_list(text) == ['https://youtu.be/dQw4w9WgXcQ', 'https://vimeo.com/1',
+                                    'https://www.youtube.com/watch?v=9bZkp7q19f0']
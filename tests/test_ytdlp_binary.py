@@ -0,0 +1,109 @@
+import os
+import stat
+import sys
+
+import pytest
+
+import ytdlp_binary
+from paths import user_file
+from ytdlp_binary import find_ytdlp, missing_features, ytdlp_features, ytdlp_version
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='uses a shell script stand-in')
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    ytdlp_binary.clear_cache()
+    yield
+    ytdlp_binary.clear_cache()
+
+
+def write_ytdlp(path, version, runs):
+    """Stand-in yt-dlp that prints `version` and counts its runs in `runs`"""
+    path.write_text(f'#!/bin/sh\necho run >> "{runs}"\necho {version}\n')
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
+
+
+def run_count(runs):
+    return len(runs.read_text().splitlines()) if runs.exists() else 0
+
+
+def forget_process_cache():
+    """What a new process starts with: only the file on disk"""
+    ytdlp_binary._found = None
+    ytdlp_binary._versions.clear()
+
+
+def test_version_is_probed_once_per_binary(tmp_path):
+    runs = tmp_path / 'runs'
+    binary = write_ytdlp(tmp_path / 'yt-dlp', '2024.08.06', runs)
+    assert ytdlp_version(binary) == '2024.08.06'
+    assert ytdlp_version(binary) == '2024.08.06'
+    assert run_count(runs) == 1
+
+    forget_process_cache()
+    assert ytdlp_version(binary) == '2024.08.06'
+    assert run_count(runs) == 1
+    assert user_file('ytdlp.json').exists()
+
+
+def test_upgraded_binary_invalidates_the_cached_version(tmp_path):
+    runs = tmp_path / 'runs'
+    binary = write_ytdlp(tmp_path / 'yt-dlp', '2024.08.06', runs)
+    assert ytdlp_version(binary) == '2024.08.06'
+
+    # Upgrade in place: new content and size
+    write_ytdlp(tmp_path / 'yt-dlp', '2025.10.22.1', runs)
+    forget_process_cache()
+    assert ytdlp_version(binary) == '2025.10.22.1'
+    assert run_count(runs) == 2
+
+    # Same size, only the mtime moved (e.g. reinstalled)
+    st = os.stat(binary)
+    os.utime(binary, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert ytdlp_version(binary) == '2025.10.22.1'
+    assert run_count(runs) == 3
+
+
+def test_missing_or_broken_binaries_have_no_version(tmp_path):
+    assert ytdlp_version(str(tmp_path / 'missing')) is None
+    broken = tmp_path / 'yt-dlp'
+    broken.write_text('#!/bin/sh\nexit 1\n')
+    broken.chmod(0o755)
+    assert ytdlp_version(str(broken)) is None
+
+
+def test_find_ytdlp_reuses_the_lookup_until_path_changes(tmp_path, monkeypatch):
+    first, second = tmp_path / 'a', tmp_path / 'b'
+    first.mkdir()
+    second.mkdir()
+    binary = write_ytdlp(first / 'yt-dlp', '2024.08.06', tmp_path / 'runs')
+    monkeypatch.setenv('PATH', str(first))
+    assert find_ytdlp() == binary
+
+    # A new process trusts the cached path; which() is not consulted
+    forget_process_cache()
+    with monkeypatch.context() as patch:
+        patch.setattr(ytdlp_binary.shutil, 'which', lambda name: None)
+        assert find_ytdlp() == binary
+
+    other = write_ytdlp(second / 'yt-dlp', '2025.01.01', tmp_path / 'runs')
+    monkeypatch.setenv('PATH', str(second))
+    forget_process_cache()
+    assert find_ytdlp() == other
+
+    monkeypatch.setenv('PATH', str(tmp_path / 'empty'))
+    forget_process_cache()
+    assert find_ytdlp() == 'yt-dlp'
+
+
+def test_features_of_old_versions(tmp_path):
+    assert ytdlp_features('2022.05.18') == {'progress_template': True, 'print_when': True,
+                                            'download_sections': False}
+    assert all(ytdlp_features(None).values())
+
+    binary = write_ytdlp(tmp_path / 'yt-dlp', '2021.12.27', tmp_path / 'runs')
+    message = missing_features(binary, 'progress_template', 'print_when')
+    assert message.startswith('yt-dlp 2021.12.27 is too old (needs 2022.01.21 or newer)')
+    assert missing_features(binary, 'progress_template') is None